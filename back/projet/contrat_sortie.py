@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""
+Contrat de sortie de l'enrichissement (schéma Pydantic).
+
+Séparé de output_tri_structure.py pour pouvoir être importé sans le SDK
+Gemini (validateur d'intégrité, outils d'audit).
+"""
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+# ---------- SCHÉMA DE SORTIE (Pydantic) : MINIMAL ----------
+class EnrichissementMinimal(BaseModel):
+    # 🔹 Classification principale (OBLIGATOIRE)
+    label: str = Field(
+        description=(
+            "Code du label principal choisi parmi les clés de NATURE_PROBLEME "
+            "(ex: 'harcelement', 'examens_evaluations', 'bourses_aides', 'autre')."
+        )
+    )
+    sous_label: str = Field(
+        description=(
+            "Code du sous_label choisi parmi les clés de "
+            "NATURE_PROBLEME[label]['sous_labels'] "
+            "(ex: 'harcelement_islamophobe', 'contestation_note', 'autre')."
+        )
+    )
+
+    # 🔹 Contexte léger
+    lieu: Optional[str] = Field(
+        default=None,
+        description=(
+            "Lieu concret si identifiable et pertinent "
+            "(ex: 'salle de classe', 'cantine', 'cour', 'internat', "
+            "'examen', 'en ligne'), sinon null."
+        )
+    )
+    key_word: List[str] = Field(
+        default_factory=list,
+        description=(
+            "Liste courte de mots-clés factuels (2 à 5 maximum), utiles à la statistique. "
+            "Ne pas dupliquer label ou sous_label. "
+            "Ex: ['conflit', 'COP', 'comportement']."
+        )
+    )
+
+    # 🔹 Propositions (OPTIONNELLES – uniquement en cas d'incertitude)
+    label_proposition: Optional[str] = Field(
+        default=None,
+        description=(
+            "Label alternatif proposé UNIQUEMENT si la classification principale "
+            "est incertaine ou trop restrictive. "
+            "Doit être plus générique et appartenir aux clés de NATURE_PROBLEME."
+        )
+    )
+    sous_label_proposition: Optional[str] = Field(
+        default=None,
+        description=(
+            "Sous-label alternatif proposé UNIQUEMENT si nécessaire. "
+            "Doit être plus générique ou transverse que le sous_label principal "
+            "et appartenir à NATURE_PROBLEME[label_proposition]['sous_labels']."
+        )
+    )
+
+
+# Champs ajoutés par l'enrichissement (présents dans chaque objet de sortie)
+CHAMPS_ENRICHIS = tuple(EnrichissementMinimal.model_fields)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+État d'avancement de l'enrichissement, dans une petite base SQLite.
+
+Une ligne par plainte : id, statut, nombre de tentatives et horodatages.
+output_tri_structure.py met la base à jour à chaque batch ; le vérificateur
+d'avancement (back/tests/avancement_checker.py) l'interroge pendant le run
+sans relire les gros fichiers JSON.
+
+Statuts :
+- "en_attente" : plainte connue, pas encore traitée,
+- "en_cours"   : batch envoyé à Gemini,
+- "ok"         : plainte enrichie et sauvegardée,
+- "echec"      : le dernier essai a échoué (cf. colonne erreur),
+- "a_refaire"  : sortie invalide, à ré-enrichir (cf. valider_sortie.py).
+
+La base est en mode WAL : un lecteur peut suivre le run pendant l'écriture.
+"""
+
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
+BASE_DIR = Path(__file__).resolve().parent.parent
+ETAT_DB = BASE_DIR / "data" / "output" / "enrichissement_etat.sqlite"
+
+# ---------- CONFIG ----------
+FENETRE_DEBIT = 600  # secondes prises en compte pour le débit (et l'ETA)
+
+STATUTS = ("en_attente", "en_cours", "ok", "echec", "a_refaire")
+
+# La colonne id n'a pas de type déclaré : les ids sont stockés tels quels
+# (entiers ou chaînes), comme dans les fichiers JSON.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS etat (
+    id PRIMARY KEY,
+    statut TEXT NOT NULL,
+    tentatives INTEGER NOT NULL DEFAULT 0,
+    debut REAL,
+    fin REAL,
+    maj REAL NOT NULL,
+    erreur TEXT
+);
+CREATE INDEX IF NOT EXISTS etat_statut ON etat (statut);
+CREATE INDEX IF NOT EXISTS etat_fin ON etat (fin);
+"""
+
+
+class EtatStore:
+    """Accès à la base d'état (une connexion par instance)."""
+
+    def __init__(self, path: Path = ETAT_DB, readonly: bool = False):
+        self.path = path
+        if readonly:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=30)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(path, timeout=30)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def open_if_exists(cls, path: Path = ETAT_DB) -> Optional["EtatStore"]:
+        """Ouvre la base en lecture seule, ou None si elle n'existe pas encore."""
+        if not path.exists():
+            return None
+        return cls(path, readonly=True)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    # ----------------- écriture (run d'enrichissement) -----------------
+
+    def reset(self) -> None:
+        """Vide la base (run repris de zéro)."""
+        with self.conn:
+            self.conn.execute("DELETE FROM etat")
+
+    def register(self, ids: Iterable, done_ids: Iterable = ()) -> None:
+        """
+        Déclare les plaintes du fichier d'entrée (en_attente si inconnues) et
+        marque "ok" celles déjà présentes dans le fichier de sortie. Ces
+        dernières n'ont pas d'horodatage de fin : elles ne faussent pas le débit.
+        """
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO etat (id, statut, maj) VALUES (?, 'en_attente', ?)",
+                ((i, now) for i in ids if i is not None),
+            )
+            self.conn.executemany(
+                "UPDATE etat SET statut = 'ok', erreur = NULL, maj = ? WHERE id = ? AND statut != 'ok'",
+                ((now, i) for i in done_ids if i is not None),
+            )
+
+    def mark_started(self, ids: List) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE etat SET statut = 'en_cours', tentatives = tentatives + 1, debut = ?, maj = ? WHERE id = ?",
+                ((now, now, i) for i in ids),
+            )
+
+    def mark_done(self, ids: List) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE etat SET statut = 'ok', fin = ?, maj = ?, erreur = NULL WHERE id = ?",
+                ((now, now, i) for i in ids),
+            )
+
+    def mark_failed(self, ids: List, erreur: str) -> None:
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE etat SET statut = 'echec', maj = ?, erreur = ? WHERE id = ?",
+                ((now, erreur[:1000], i) for i in ids),
+            )
+
+    def mark_redo(self, ids: Iterable, erreur: str) -> int:
+        """Remet des plaintes dans la file (sortie invalide). Retourne le nombre de lignes touchées."""
+        now = time.time()
+        with self.conn:
+            cur = self.conn.executemany(
+                "UPDATE etat SET statut = 'a_refaire', maj = ?, erreur = ? WHERE id = ?",
+                ((now, erreur[:1000], i) for i in ids),
+            )
+        return cur.rowcount
+
+    # ----------------- lecture (vérificateur) -----------------
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(STATUTS, 0)
+        for statut, n in self.conn.execute("SELECT statut, COUNT(*) FROM etat GROUP BY statut"):
+            counts[statut] = n
+        return counts
+
+    def summary(self, window: float = FENETRE_DEBIT) -> Dict:
+        """
+        Avancement, débit (plaintes/min sur la fenêtre récente) et ETA.
+        Toutes les requêtes passent par les index (statut, fin) : instantané
+        même pour des centaines de milliers de plaintes.
+        """
+        now = time.time()
+        counts = self.counts()
+        total = sum(counts.values())
+        # Débit mesuré depuis le début du plus ancien batch terminé dans la fenêtre
+        recent, first_start = self.conn.execute(
+            "SELECT COUNT(*), MIN(COALESCE(debut, fin)) FROM etat WHERE fin >= ?", (now - window,)
+        ).fetchone()
+        last_fin = self.conn.execute("SELECT MAX(fin) FROM etat").fetchone()[0]
+
+        elapsed = (now - first_start) if first_start is not None else 0.0
+        per_min = recent / elapsed * 60 if recent and elapsed > 0 else 0.0
+        remaining = total - counts["ok"]
+        eta = remaining / per_min * 60 if per_min > 0 else None
+
+        return {
+            "total": total,
+            "counts": counts,
+            "done": counts["ok"],
+            "remaining": remaining,
+            "percentage": counts["ok"] / total * 100 if total else 0.0,
+            "per_min": per_min,
+            "eta_seconds": eta,
+            "last_done_at": last_fin,
+        }
+
+    def failures(self, limit: int = 10) -> List[tuple]:
+        """Dernières plaintes en échec : (id, tentatives, erreur)."""
+        return self.conn.execute(
+            "SELECT id, tentatives, erreur FROM etat WHERE statut = 'echec' ORDER BY maj DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def ids_by_status(self, statut: str, limit: Optional[int] = None) -> List:
+        sql = "SELECT id FROM etat WHERE statut = ? ORDER BY id"
+        params: tuple = (statut,)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params += (limit,)
+        return [row[0] for row in self.conn.execute(sql, params)]
@@ -1,8 +1,21 @@
 #!/usr/bin/env python
+import csv
+import hashlib
+import io
 import json
 from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
 import pandas as pd
 
+try:
+    # Lecteur CSV Arrow multithreadé (optionnel) : fallback pandas si absent
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    pa = None
+    pa_csv = None
+
 # ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
 BASE_DIR = Path(__file__).resolve().parent.parent
 INPUT_PATH = BASE_DIR / "data" / "input" / "Excel et data" / "concatenation.xlsx"
@@ -10,27 +23,129 @@ INPUT_PATH = BASE_DIR / "data" / "input" / "Excel et data" / "concatenation.xlsx
 # 🔥 Nom du fichier de sortie JSON
 OUTPUT_JSON = BASE_DIR / "data" / "output" / "output_tri.json"
 
+# 🔥 Manifeste id -> hash de contenu + fichiers delta (incrémental)
+MANIFEST_JSON = BASE_DIR / "data" / "output" / "output_tri_manifest.json"
+DELTA_NEW_JSON = BASE_DIR / "data" / "output" / "output_tri_delta_new.json"
+DELTA_CHANGED_JSON = BASE_DIR / "data" / "output" / "output_tri_delta_changed.json"
+DELTA_DELETED_JSON = BASE_DIR / "data" / "output" / "output_tri_delta_deleted.json"
+# Lignes nouvelles/modifiées en attente pendant la lecture (supprimé en fin de run)
+DELTA_SPOOL = BASE_DIR / "data" / "output" / "output_tri_delta_pending.ndjson.tmp"
+
+# ---------- CONFIG CSV ----------
+CSV_SEP = ";"
+CSV_BLOCK_SIZE = 16 * 1024 * 1024  # octets lus par bloc (borne la mémoire)
+
+
+def read_csv_header(input_path: Path) -> List[str]:
+    """
+    Lit uniquement la ligne d'en-tête du CSV.
+    """
+    with input_path.open("r", encoding="utf-8", newline="") as f:
+        return next(csv.reader(f, delimiter=CSV_SEP), [])
+
+
+def iter_csv_blocks(input_path: Path, block_size: int = CSV_BLOCK_SIZE) -> Iterator[Tuple[int, bytes]]:
+    """
+    Découpe le CSV (sans l'en-tête) en blocs (offset, octets) alignés sur des fins
+    d'enregistrement : un retour à la ligne n'est une fin d'enregistrement que
+    hors guillemets (nombre pair de '"' depuis le début du bloc). Un bloc où
+    aucune fin n'est trouvée (guillemet non fermé) est coupé à la dernière
+    ligne au-delà de 4 blocs, pour borner la mémoire.
+    """
+    with input_path.open("rb") as f:
+        f.readline()  # en-tête (cf. read_csv_header)
+        offset = f.tell()
+        pending = b""
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            pending += data
+            cut = _last_record_end(pending)
+            if cut is None and len(pending) > 4 * block_size:
+                cut = pending.rfind(b"\n") + 1 or None
+            if cut:
+                yield offset, pending[:cut]
+                offset += cut
+                pending = pending[cut:]
+        if pending.strip():
+            yield offset, pending
+
+
+def _last_record_end(data: bytes):
+    """Position juste après le dernier '\\n' hors guillemets (data commence un enregistrement)."""
+    quotes_after = 0
+    odd = data.count(b'"') % 2
+    end = len(data)
+    while True:
+        nl = data.rfind(b"\n", 0, end)
+        if nl < 0:
+            return None
+        quotes_after += data.count(b'"', nl + 1, end)
+        if (odd - quotes_after) % 2 == 0:
+            return nl + 1
+        end = nl
+
+
+def iter_csv_chunks(input_path: Path) -> Iterator[pd.DataFrame]:
+    """
+    Lit un CSV par blocs d'octets bornés (alignés sur les enregistrements).
+
+    - Chaque bloc est lu par le lecteur Arrow (multithreadé, colonnaire),
+      retours à la ligne entre guillemets acceptés ("Analyse" multiligne).
+    - Seul un bloc réellement mal formé est relu par le parseur pandas
+      "python" (tolérant) ; la lecture reprend au bloc suivant.
+
+    Toutes les colonnes sont lues en texte : les conversions (id, ...) sont
+    faites par preprocess_df, identiques quel que soit le moteur.
+    """
+    header = read_csv_header(input_path)
+    for offset, block in iter_csv_blocks(input_path):
+        if pa_csv is not None:
+            try:
+                table = pa_csv.read_csv(
+                    io.BytesIO(block),
+                    read_options=pa_csv.ReadOptions(use_threads=True, column_names=header),
+                    parse_options=pa_csv.ParseOptions(
+                        delimiter=CSV_SEP, quote_char='"', newlines_in_values=True
+                    ),
+                    convert_options=pa_csv.ConvertOptions(
+                        column_types={name: pa.string() for name in header},
+                        strings_can_be_null=True,
+                    ),
+                )
+                yield table.to_pandas()
+                continue
+            except pa.ArrowInvalid as e:
+                print(
+                    f"[AVERTISSEMENT] Bloc à l'octet {offset} illisible par Arrow ({e}). "
+                    "Parseur tolérant pour ce bloc."
+                )
+
+        # CSV avec ; comme séparateur, moteur python : plus tolérant mais lent
+        yield pd.read_csv(
+            io.BytesIO(block),
+            sep=CSV_SEP,
+            engine="python",
+            dtype=str,
+            header=None,
+            names=header,
+        )
+
 
-def load_table(input_path: Path) -> pd.DataFrame:
+def iter_table_chunks(input_path: Path) -> Iterator[pd.DataFrame]:
     """
-    Charge un fichier CSV ou Excel en DataFrame.
+    Itère sur un fichier CSV (par chunks) ou Excel (un seul bloc) en DataFrames.
     """
     suffix = input_path.suffix.lower()
 
     if suffix in [".xls", ".xlsx", ".xlsm", ".xlsb", ".ods"]:
-        df = pd.read_excel(input_path)
+        yield pd.read_excel(input_path)
     elif suffix == ".csv":
-        # CSV avec ; comme séparateur
-        df = pd.read_csv(
-            input_path,
-            sep=";",          # séparateur
-            engine="python",  # plus tolérant
-        )
+        yield from iter_csv_chunks(input_path)
     else:
         raise ValueError(f"Extension non supportée : {suffix}")
 
-    return df
-
 
 def preprocess_df(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -156,22 +271,183 @@ def save_json(data, output_path: Path):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
+class JsonArrayWriter:
+    """
+    Écrit une liste JSON au fil de l'eau (même rendu que json.dump(indent=2)),
+    dans un fichier temporaire remplacé atomiquement à la fermeture.
+    """
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+        self.count = 0
+        self._f = None
+
+    def __enter__(self):
+        self._f = self.tmp_path.open("w", encoding="utf-8")
+        self._f.write("[")
+        return self
+
+    def write_many(self, records: List[dict]):
+        for record in records:
+            item = json.dumps(record, ensure_ascii=False, indent=2).replace("\n", "\n  ")
+            self._f.write(("," if self.count else "") + "\n  " + item)
+            self.count += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._f.write("\n]" if self.count else "]")
+        self._f.close()
+        if exc_type is None:
+            self.tmp_path.replace(self.output_path)
+        else:
+            self.tmp_path.unlink(missing_ok=True)
+        return False
+
+
+def save_json_atomic(data, output_path: Path):
+    """
+    Écrit le JSON de manière atomique (fichier temporaire puis replace).
+    """
+    tmp_path = output_path.with_suffix(output_path.suffix + ".tmp")
+    save_json(data, tmp_path)
+    tmp_path.replace(output_path)
+
+
+def row_hash(record: dict) -> str:
+    """
+    Hash stable du contenu d'une ligne (indépendant de l'ordre des clés).
+    """
+    canonical = json.dumps(
+        record, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: Path) -> Dict[str, str]:
+    """
+    Charge le manifeste id -> hash du précédent export.
+    Retourne un dict vide si absent ou illisible (tout sera considéré comme nouveau).
+    """
+    if not path.exists() or path.stat().st_size == 0:
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (json.JSONDecodeError, OSError) as e:
+        print(f"[AVERTISSEMENT] Manifeste illisible ({e}), export complet considéré comme nouveau.")
+        return {}
+    return manifest.get("hashes", {}) if isinstance(manifest, dict) else {}
+
+
+class DeltaTracker:
+    """
+    Calcule le delta au fil des chunks, sans garder l'export complet en mémoire :
+    les lignes nouvelles/modifiées sont écrites au fil de l'eau dans un fichier
+    temporaire (NDJSON) ; seuls les hashes et, par id en attente, le numéro de
+    sa dernière ligne dans ce fichier restent en mémoire.
+    Les ids sont indexés sous forme de chaîne dans le manifeste (clés JSON).
+    """
+
+    def __init__(self, previous: Dict[str, str], spool_path: Path = DELTA_SPOOL):
+        self.previous = previous
+        self.hashes: Dict[str, str] = {}
+        self.pending: Dict[str, int] = {}
+        self.spool_path = spool_path
+        self._spool = spool_path.open("w+", encoding="utf-8")
+        self._lines = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def add(self, records: List[dict]):
+        for record in records:
+            key = str(record["id"])
+            h = row_hash(record)
+            self.hashes[key] = h  # en cas de doublon d'id, la dernière ligne gagne
+            if self.previous.get(key) == h:
+                self.pending.pop(key, None)
+            else:
+                self._spool.write(json.dumps(record, ensure_ascii=False) + "\n")
+                self.pending[key] = self._lines
+                self._lines += 1
+
+    def iter_pending(self) -> Iterator[Tuple[str, dict]]:
+        """Relit le fichier temporaire : dernière version de chaque ligne nouvelle/modifiée."""
+        self._spool.flush()
+        self._spool.seek(0)
+        for i, line in enumerate(self._spool):
+            record = json.loads(line)
+            key = str(record["id"])
+            if self.pending.get(key) == i:
+                yield key, record
+
+    def deleted(self) -> List:
+        return [
+            int(k) if k.lstrip("-").isdigit() else k
+            for k in self.previous
+            if k not in self.hashes
+        ]
+
+    def close(self):
+        self._spool.close()
+        self.spool_path.unlink(missing_ok=True)
+
+
+def save_delta(tracker: DeltaTracker) -> Tuple[int, int, int]:
+    """
+    Écrit les fichiers delta en streaming depuis le fichier temporaire du
+    tracker, puis le manifeste (en dernier : si une étape échoue, le prochain
+    run recalcule le même delta). Retourne (nouvelles, modifiées, supprimées).
+    """
+    with JsonArrayWriter(DELTA_NEW_JSON) as new, JsonArrayWriter(DELTA_CHANGED_JSON) as changed:
+        for key, record in tracker.iter_pending():
+            (changed if key in tracker.previous else new).write_many([record])
+    deleted = tracker.deleted()
+    save_json_atomic(deleted, DELTA_DELETED_JSON)
+    save_json_atomic(
+        {"source": INPUT_PATH.name, "total": len(tracker.hashes), "hashes": tracker.hashes},
+        MANIFEST_JSON,
+    )
+    return new.count, changed.count, len(deleted)
+
+
 def main():
     print(f"[INFO] Chargement du fichier : {INPUT_PATH}")
 
-    df = load_table(INPUT_PATH)
-    print(f"[INFO] Lignes brutes trouvées : {len(df)}")
-    print(f"[INFO] Colonnes brutes : {list(df.columns)}")
+    # 🔥 Delta par rapport au précédent export (manifeste id -> hash)
+    total_raw = 0
 
-    # 🔥 Pré-nettoyage selon tes règles
-    df = preprocess_df(df)
-    df = drop_rows_without_id(df)
-    print(f"[INFO] Colonnes après pré-nettoyage : {list(df.columns)}")
+    print(f"[INFO] Sauvegarde JSON dans : {OUTPUT_JSON}")
+    with DeltaTracker(load_manifest(MANIFEST_JSON)) as tracker:
+        with JsonArrayWriter(OUTPUT_JSON) as writer:
+            for i, df in enumerate(iter_table_chunks(INPUT_PATH)):
+                total_raw += len(df)
+                if i == 0:
+                    print(f"[INFO] Colonnes brutes : {list(df.columns)}")
 
-    data = dataframe_to_json(df)
+                # 🔥 Pré-nettoyage selon tes règles (chunk par chunk)
+                df = preprocess_df(df)
+                df = drop_rows_without_id(df)
+                if i == 0:
+                    print(f"[INFO] Colonnes après pré-nettoyage : {list(df.columns)}")
 
-    print(f"[INFO] Sauvegarde JSON dans : {OUTPUT_JSON}")
-    save_json(data, OUTPUT_JSON)
+                data = dataframe_to_json(df)
+                writer.write_many(data)
+                tracker.add(data)
+
+        print(f"[INFO] Lignes brutes trouvées : {total_raw}")
+        print(f"[INFO] Lignes écrites : {writer.count}")
+
+        n_new, n_changed, n_deleted = save_delta(tracker)
+    print(
+        f"[INFO] Delta : {n_new} nouvelles, {n_changed} modifiées, "
+        f"{n_deleted} supprimées (manifeste : {MANIFEST_JSON.name})"
+    )
 
     print("[OK] Conversion + pré-nettoyage terminés ✔️")
 
@@ -2,41 +2,282 @@
 """
 Convertit un fichier JSON contenant une LISTE d'objets
 en un fichier NDJSON (1 document JSON par ligne).
+
+L'enrichissement (output_tri_structure.py) tient déjà le journal
+output_tri_structure2.ndjson au fil des batches : ce script sert à le
+régénérer depuis l'export JSON complet, à le compresser ou à le découper.
+
+- Lecture en streaming : le tableau JSON est parsé élément par élément
+  (mémoire constante, même pour des fichiers de plusieurs Go).
+- Encodage en parallèle par chunks de documents (ordre préservé).
+- Compression optionnelle (gzip / zstd) et découpage en shards de taille
+  bornée, lisibles en parallèle par le chargement Elasticsearch / DuckDB.
+
+Usage :
+    python json_to_ndjson.py
+    python json_to_ndjson.py --workers 4 --compression zstd --shard-size-mb 256
 """
 
+import argparse
+import gzip
 import json
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    zstandard = None
 
 # ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
 BASE_DIR = Path(__file__).resolve().parent.parent
-INPUT = BASE_DIR / "data" / "output" / "output_tri_structure.json"
-OUTPUT = BASE_DIR / "data" / "output" / "output_tri_structure.ndjson"
+INPUT = BASE_DIR / "data" / "output" / "output_tri_structure2.json"
+OUTPUT = BASE_DIR / "data" / "output" / "output_tri_structure2.ndjson"
 
-def main():
-    if not INPUT.exists():
-        print(f"[ERREUR] Fichier introuvable : {INPUT.resolve()}")
+# ---------- CONFIG ----------
+READ_CHUNK_CHARS = 1024 * 1024  # caractères lus à chaque remplissage du buffer
+DOCS_PER_CHUNK = 2000           # documents encodés par tâche worker
+WORKERS = 1                     # 1 = encodage dans le processus principal
+COMPRESSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+_WS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(path: Path, chunk_chars: int = READ_CHUNK_CHARS) -> Iterator[Any]:
+    """
+    Itère sur les éléments d'un tableau JSON sans charger le fichier entier.
+
+    Le buffer est rempli par blocs ; chaque élément est décodé avec
+    JSONDecoder.raw_decode (C). Un élément incomplet en fin de buffer
+    déclenche simplement une lecture supplémentaire.
+    """
+    decoder = json.JSONDecoder()
+    with path.open("r", encoding="utf-8") as f:
+        buf = f.read(chunk_chars)
+        eof = not buf
+        pos = _WS.match(buf).end()
+        if eof or buf[pos : pos + 1] != "[":
+            raise ValueError(
+                "ERREUR : Le fichier JSON doit contenir une liste d'objets, "
+                "pas un objet unique."
+            )
+        pos += 1
+        read_size = chunk_chars
+
+        while True:
+            pos = _WS.match(buf, pos).end()
+            if pos >= len(buf):
+                if eof:
+                    raise ValueError(f"Tableau JSON non terminé dans {path}")
+                buf, pos = f.read(read_size), 0
+                eof = not buf
+                continue
+            if buf[pos] == "]":
+                return
+            error = None
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                error, end = e, None
+            if end is None or (end == len(buf) and not eof):
+                # Élément tronqué par la fin du buffer : on complète et on réessaie
+                more = f.read(read_size)
+                if not more:
+                    if error is not None:
+                        raise error
+                    eof = True
+                    continue
+                buf = buf[pos:] + more
+                pos = 0
+                read_size *= 2  # élément plus gros que le bloc : on accélère
+                continue
+            read_size = chunk_chars
+            yield obj
+            pos = end
+
+
+def iter_chunks(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+    """Regroupe un itérateur en listes de `size` éléments."""
+    chunk: List[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def encode_chunk(docs: List[Any]) -> List[bytes]:
+    """Encode un chunk de documents en lignes NDJSON (bytes, avec '\\n')."""
+    return [(json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8") for doc in docs]
+
+
+def iter_encoded(docs: Iterator[Any], workers: int) -> Iterator[List[bytes]]:
+    """
+    Encode les documents par chunks, en parallèle si workers > 1.
+    Le nombre de chunks en vol est borné (mémoire constante) et l'ordre
+    de sortie est celui de l'entrée.
+    """
+    chunks = iter_chunks(docs, DOCS_PER_CHUNK)
+    if workers <= 1:
+        for chunk in chunks:
+            yield encode_chunk(chunk)
         return
 
-    print(f"[INFO] Chargement du fichier JSON : {INPUT.resolve()}")
-    data = json.loads(INPUT.read_text(encoding="utf-8"))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        for chunk in chunks:
+            in_flight.append(pool.submit(encode_chunk, chunk))
+            if len(in_flight) >= workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
 
-    if not isinstance(data, list):
-        raise ValueError(
-            "ERREUR : Le fichier JSON doit contenir une liste d'objets, "
-            "pas un objet unique."
-        )
+class ShardedWriter:
+    """
+    Écrit des lignes NDJSON dans un fichier unique ou dans des shards
+    `<nom>-00000.ndjson[.gz|.zst]` dont la taille (non compressée) est bornée.
+    Les shards sont écrits en .tmp et ne remplacent les fichiers existants
+    qu'à la validation (commit) : une conversion en échec (abort) laisse la
+    sortie précédente intacte.
+    """
 
-    print(f"[INFO] Nombre de documents trouvés : {len(data)}")
+    def __init__(self, output: Path, compression: Optional[str], shard_max_bytes: Optional[int]):
+        if compression == "zstd" and zstandard is None:
+            raise SystemExit("[ERREUR] Compression zstd demandée mais le module 'zstandard' est absent.")
+        self.output = output
+        self.compression = compression
+        self.shard_max_bytes = shard_max_bytes
+        self.paths: List[Path] = []
+        self.lines = 0
+        self._f = None
+        self._raw = None
+        self._tmp: Optional[Path] = None
+        self._size = 0
+
+    def _shard_path(self, index: int) -> Path:
+        ext = COMPRESSIONS[self.compression]
+        if self.shard_max_bytes is None:
+            return self.output.with_name(self.output.name + ext)
+        return self.output.with_name(f"{self.output.stem}-{index:05d}{self.output.suffix}{ext}")
+
+    @staticmethod
+    def _tmp_path(path: Path) -> Path:
+        return path.with_name(path.name + ".tmp")
+
+    def remove_stale_shards(self):
+        """Supprime les shards d'un run précédent absents de ce run (sinon ils seraient relus)."""
+        pattern = re.compile(re.escape(self.output.stem) + r"-\d{5}" + re.escape(self.output.suffix) + r"(\.gz|\.zst)?$")
+        current = set(self.paths)
+        for path in self.output.parent.glob(f"{self.output.stem}-*"):
+            if pattern.match(path.name) and path not in current:
+                path.unlink()
+
+    def _open(self):
+        path = self._shard_path(len(self.paths))
+        self._tmp = self._tmp_path(path)
+        if self.compression == "gzip":
+            self._f = gzip.open(self._tmp, "wb", compresslevel=6)
+        elif self.compression == "zstd":
+            self._raw = self._tmp.open("wb")
+            self._f = zstandard.ZstdCompressor(level=3, threads=-1).stream_writer(self._raw)
+        else:
+            self._f = self._tmp.open("wb")
+        self.paths.append(path)
+        self._size = 0
+
+    def _close_current(self):
+        if self._f is None:
+            return
+        try:
+            self._f.close()
+        finally:
+            if self._raw is not None:
+                self._raw.close()
+                self._raw = None
+            self._f = None
+
+    def write_lines(self, lines: List[bytes]):
+        for line in lines:
+            if self._f is None or (
+                self.shard_max_bytes is not None
+                and self._size
+                and self._size + len(line) > self.shard_max_bytes
+            ):
+                self._close_current()
+                self._open()
+            self._f.write(line)
+            self._size += len(line)
+            self.lines += 1
+
+    def commit(self):
+        """Ferme le shard courant et publie tous les .tmp (puis retire les shards obsolètes)."""
+        if self._f is None and not self.paths:
+            self._open()  # entrée vide : on produit quand même un fichier vide
+        self._close_current()
+        for path in self.paths:
+            self._tmp_path(path).replace(path)
+        if self.shard_max_bytes is not None:
+            self.remove_stale_shards()
+
+    def abort(self):
+        """Ferme et supprime les .tmp de ce run ; les fichiers existants ne sont pas touchés."""
+        try:
+            self._close_current()
+        finally:
+            for path in self.paths:
+                self._tmp_path(path).unlink(missing_ok=True)
+
+
+def convert(
+    input_path: Path,
+    output_path: Path,
+    workers: int = WORKERS,
+    compression: Optional[str] = None,
+    shard_max_bytes: Optional[int] = None,
+) -> ShardedWriter:
+    """Convertit input_path (tableau JSON) en NDJSON. Retourne le writer (chemins, compte)."""
+    writer = ShardedWriter(output_path, compression, shard_max_bytes)
+    try:
+        for lines in iter_encoded(iter_json_array(input_path), workers):
+            writer.write_lines(lines)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.commit()
+    return writer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Conversion JSON (liste) -> NDJSON en streaming.")
+    parser.add_argument("--input", type=Path, default=INPUT, help="Fichier JSON d'entrée (liste d'objets).")
+    parser.add_argument("--output", type=Path, default=OUTPUT, help="Fichier NDJSON de sortie (base des shards).")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Nombre de processus d'encodage.")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], default=None, help="Compression de sortie.")
+    parser.add_argument("--shard-size-mb", type=int, default=None, help="Taille max (non compressée) d'un shard.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.input.exists():
+        print(f"[ERREUR] Fichier introuvable : {args.input.resolve()}")
+        return
 
-    with OUTPUT.open("w", encoding="utf-8") as f:
-        for doc in data:
-            line = json.dumps(doc, ensure_ascii=False)
-            f.write(line + "\n")
+    print(f"[INFO] Lecture en streaming du fichier JSON : {args.input.resolve()}")
+    shard_max_bytes = args.shard_size_mb * 1024 * 1024 if args.shard_size_mb else None
+    writer = convert(args.input, args.output, args.workers, args.compression, shard_max_bytes)
 
     print("=" * 60)
     print("[OK] Conversion terminée.")
-    print("[OK] Fichier NDJSON :", OUTPUT.resolve())
-    print("[OK] Nombre de lignes écrites :", len(data))
+    for path in writer.paths:
+        print("[OK] Fichier NDJSON :", path.resolve())
+    print("[OK] Nombre de lignes écrites :", writer.lines)
     print("=" * 60)
 
 
@@ -3,7 +3,10 @@
 Traitement complet (enrichissement MINIMAL) :
 - On lit output_tri.json (liste d'objets "plaintes" bruts)
 - On appelle Gemini 2.5 Flash Lite par BATCH
-- On écrit une LISTE d'objets enrichis dans output_tri_structure2.json
+- On écrit chaque batch enrichi dans le journal output_tri_structure2.ndjson
+  (1 objet par ligne), lu par push_to_elastic.py et l'ETL dataviz
+- En fin de run, l'export complet output_tri_structure2.json (LISTE d'objets)
+  est écrit une seule fois
 
 CONTRAT DE SORTIE (par objet) :
 - On conserve TOUS les champs initiaux tels quels (y compris "Analyse")
@@ -16,90 +19,46 @@ CONTRAT DE SORTIE (par objet) :
 Aucun autre champ ne doit apparaître dans la sortie.
 
 Gestion "propre" :
-- écriture atomique (fichier temporaire puis replace),
-- reprise possible sans casser le fichier,
+- journal en ajout, synchronisé sur disque à chaque batch (pas de réécriture
+  complète de la sortie par batch),
+- reprise depuis le journal (une ligne tronquée par un arrêt brutal est
+  ignorée), export JSON en écriture atomique,
 - reset possible sur demande.
+
+Chaque batch est diffusé aux sinks configurés (SINKS, cf. sinks.py) : journal
+NDJSON (toujours actif), Parquet, Elasticsearch.
+
+L'avancement (statut, tentatives, horodatages par id) est tenu dans une base
+SQLite (cf. etat_enrichissement.py), lue en direct par avancement_checker.py.
 """
 
 import json
+import re
 import time
 import subprocess
 import sys
 from pathlib import Path
-from typing import List, Optional, Tuple, Set
+from typing import List, Tuple, Set
 
-from pydantic import BaseModel, Field
 from google import genai
 from google.genai import types
-from acronymes import ACRONYMES, ACRONYMES_BRUIT
-
-
-
-from nature_probleme import NATURE_PROBLEME
+from prompt_enrichissement import build_batch_prompt
+from sinks import build_fanout
+from etat_enrichissement import EtatStore
+from contrat_sortie import EnrichissementMinimal
 
 # ---------- CONFIG ----------
 BATCH_SIZE = 10          # nombre de plaintes traitées par requête API
 MAX_RETRIES = 3          # nb de tentatives par batch en cas de 503
 RETRY_BASE_DELAY = 10    # secondes (backoff exponentiel)
+SINKS = ["ndjson"]       # diffusion par batch : "ndjson" (journal, toujours actif), "parquet", "elastic"
 
 # ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
 BASE_DIR = Path(__file__).resolve().parent.parent
 API_KEY_FILE = BASE_DIR / "projet" / "api_key.txt"
 INPUT_JSON = BASE_DIR / "data" / "output" / "output_tri.json"
 OUTPUT_JSON = BASE_DIR / "data" / "output" / "output_tri_structure2.json"
-
-# ---------- SCHÉMA DE SORTIE (Pydantic) : MINIMAL ----------
-class EnrichissementMinimal(BaseModel):
-    # 🔹 Classification principale (OBLIGATOIRE)
-    label: str = Field(
-        description=(
-            "Code du label principal choisi parmi les clés de NATURE_PROBLEME "
-            "(ex: 'harcelement', 'examens_evaluations', 'bourses_aides', 'autre')."
-        )
-    )
-    sous_label: str = Field(
-        description=(
-            "Code du sous_label choisi parmi les clés de "
-            "NATURE_PROBLEME[label]['sous_labels'] "
-            "(ex: 'harcelement_islamophobe', 'contestation_note', 'autre')."
-        )
-    )
-
-    # 🔹 Contexte léger
-    lieu: Optional[str] = Field(
-        default=None,
-        description=(
-            "Lieu concret si identifiable et pertinent "
-            "(ex: 'salle de classe', 'cantine', 'cour', 'internat', "
-            "'examen', 'en ligne'), sinon null."
-        )
-    )
-    key_word: List[str] = Field(
-        default_factory=list,
-        description=(
-            "Liste courte de mots-clés factuels (2 à 5 maximum), utiles à la statistique. "
-            "Ne pas dupliquer label ou sous_label. "
-            "Ex: ['conflit', 'COP', 'comportement']."
-        )
-    )
-
-    # 🔹 Propositions (OPTIONNELLES – uniquement en cas d'incertitude)
-    label_proposition: Optional[str] = Field(
-        default=None,
-        description=(
-            "Label alternatif proposé UNIQUEMENT si la classification principale "
-            "est incertaine ou trop restrictive. "
-            "Doit être plus générique et appartenir aux clés de NATURE_PROBLEME."
-        )
-    )
-    sous_label_proposition: Optional[str] = Field(
-        default=None,
-        description=(
-            "Sous-label alternatif proposé UNIQUEMENT si nécessaire. "
-            "Doit être plus générique ou transverse que le sous_label principal "
-            "et appartenir à NATURE_PROBLEME[label_proposition]['sous_labels']."
-        )
-    )
+OUTPUT_NDJSON = OUTPUT_JSON.with_suffix(".ndjson")  # journal écrit par le sink "ndjson"
 
 # ---------- UTILITAIRES JSON ----------
 def safe_write_json(path: Path, data) -> None:
@@ -110,6 +69,14 @@ def safe_write_json(path: Path, data) -> None:
         f.write("\n")
     tmp_path.replace(path)
 
+def safe_write_ndjson(path: Path, data: List[dict]) -> None:
+    """Réécrit le journal NDJSON de manière atomique (reprise, ré-enrichissement)."""
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        for obj in data:
+            f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    tmp_path.replace(path)
+
 # ---------- UTILITAIRES EXISTANTS ----------
 def load_api_key() -> str:
     if not API_KEY_FILE.exists():
@@ -132,8 +99,46 @@ def load_all_plaintes() -> List[dict]:
         raise ValueError("Le fichier JSON doit contenir une liste non vide d'objets.")
     return data
 
-def load_existing_results() -> Tuple[List[dict], Set]:
-    """Charge le fichier de sortie s'il existe déjà, de manière robuste."""
+def load_journal() -> Tuple[List[dict], Set, bool]:
+    """
+    Relit le journal NDJSON. Les lignes illisibles (batch tronqué par un arrêt
+    brutal) sont ignorées et, pour un id présent plusieurs fois, seule la
+    dernière version est gardée. Le booléen indique si le journal doit être
+    réécrit (lignes ignorées ou doublons).
+    """
+    by_id = {}
+    lines = 0
+    with OUTPUT_NDJSON.open("r", encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            lines += 1
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"[AVERTISSEMENT] Ligne {n} illisible dans {OUTPUT_NDJSON.name} : ignorée.")
+                continue
+            key = obj.get("id") if isinstance(obj, dict) and obj.get("id") is not None else ("sans_id", n)
+            by_id.pop(key, None)
+            by_id[key] = obj
+    data = list(by_id.values())
+    done_ids = {obj.get("id") for obj in data if isinstance(obj, dict) and "id" in obj}
+    print(f"[INFO] Journal existant trouvé : {len(data)} plaintes déjà enrichies.")
+    return data, done_ids, len(data) != lines
+
+def load_existing_results() -> Tuple[List[dict], Set, bool]:
+    """
+    Charge les résultats déjà enrichis : depuis le journal NDJSON s'il existe
+    (à jour au batch près), sinon depuis le fichier de sortie JSON, de manière
+    robuste. Le booléen indique si le journal doit être (ré)écrit.
+    """
+    if OUTPUT_NDJSON.exists() and OUTPUT_NDJSON.stat().st_size > 0:
+        return load_journal()
+    data, done_ids = load_json_results()
+    return data, done_ids, bool(data)
+
+def load_json_results() -> Tuple[List[dict], Set]:
+    """Charge le fichier de sortie JSON s'il existe déjà, de manière robuste."""
     if not OUTPUT_JSON.exists() or OUTPUT_JSON.stat().st_size == 0:
         return [], set()
 
@@ -192,174 +197,6 @@ def load_existing_results() -> Tuple[List[dict], Set]:
             pass
     return data, done_ids
 
-# ---------- PROMPT MINIMAL (verrouillé) ----------
-def build_batch_prompt(batch: List[dict]) -> str:
-    """
-    Construit le prompt pour UN BATCH :
-    - On fournit la taxonomie
-    - On fournit les plaintes
-    - On exige une sortie STRICTEMENT MINIMALE (label/sous_label/lieu/key_word) uniquement.
-    """
-    plaintes_json = json.dumps(batch, ensure_ascii=False, indent=2)
-    taxonomie_json = json.dumps(NATURE_PROBLEME, ensure_ascii=False, indent=2)
-    acronymes_json = json.dumps(ACRONYMES, ensure_ascii=False, indent=2)
-    bruit_json = json.dumps(sorted(list(ACRONYMES_BRUIT)), ensure_ascii=False, indent=2)
-
-    return f"""
-Tu es un expert de médiation scolaire. Tu dois classifier des saisines afin de produire
-des statistiques fiables, stables et exploitables.
-
-================================================
-IMPORTANT — CONTRAT DE SORTIE STRICT
-================================================
-
-Tu dois répondre UNIQUEMENT par un TABLEAU JSON.
-
-Chaque élément du tableau doit contenir :
-- OBLIGATOIREMENT :
-  1) "label"
-  2) "sous_label"
-  3) "lieu"
-  4) "key_word"
-
-- OPTIONNELLEMENT (UNIQUEMENT dans certains cas) :
-  5) "label_proposition"
-  6) "sous_label_proposition"
-
-⚠️ INTERDICTIONS ABSOLUES :
-- Ne renvoie AUCUN autre champ.
-- Ne renvoie PAS de résumé, analyse, émotion, gravité, urgence, etc.
-- Ne recopie JAMAIS le texte de la plainte.
-- Ne commente PAS ta réponse.
-
-================================================
-TAXONOMIE — CODES AUTORISÉS
-================================================
-
-La classification DOIT s’appuyer sur la taxonomie suivante.
-
-- "label" doit être une des clés principales de NATURE_PROBLEME
-- "sous_label" doit être une des clés de NATURE_PROBLEME[label]["sous_labels"]
-- Tu ne dois JAMAIS inventer de nouveaux codes pour la classification principale.
-
-NATURE_PROBLEME :
-{taxonomie_json}
-
-================================================
-RÈGLE FONDAMENTALE DE CLASSIFICATION
-================================================
-
-Tu dois TOUJOURS fournir une classification principale ("label", "sous_label").
-Cette classification est celle utilisée pour les statistiques.
-
-------------------------------------------------
-1) UTILISATION DE "autre"
-------------------------------------------------
-Utilise "label = autre" UNIQUEMENT si :
-- aucun label existant de la taxonomie ne correspond au problème,
-- le sujet est clairement hors du champ couvert par NATURE_PROBLEME.
-
-Si tu utilises "label = autre" :
-- tu DOIS proposer un "label_proposition",
-- et un "sous_label_proposition" si possible.
-
-------------------------------------------------
-2) UTILISATION DES PROPOSITIONS
-------------------------------------------------
-Les champs "label_proposition" et "sous_label_proposition" servent
-EXCLUSIVEMENT à suggérer une ÉVOLUTION de la taxonomie.
-
-Tu peux les utiliser si :
-- le cas est ambigu entre plusieurs sous_labels existants,
-- le sous_label existant est trop spécifique,
-- le problème est transversal ou récurrent,
-- plusieurs sous_labels proches pourraient s’appliquer.
-
-RÈGLES POUR LES PROPOSITIONS :
-- Elles doivent être PLUS GÉNÉRIQUES que la classification principale.
-- Elles doivent pouvoir regrouper PLUSIEURS cas similaires.
-- Elles doivent appartenir à la taxonomie existante
-  OU être formulées de manière suffisamment générales pour y être intégrées.
-
-------------------------------------------------
-3) CAS CLAIR
-------------------------------------------------
-Si la classification principale est claire et suffisante :
-- N’utilise PAS "label_proposition"
-- N’utilise PAS "sous_label_proposition"
-
-IMPORTANT :
-- "autre" n’est PAS une proposition.
-- Les propositions ne remplacent JAMAIS la classification principale.
-
-================================================
-RÈGLES SUR "lieu"
-================================================
-
-- "lieu" = lieu CONCRET si identifiable
-  (ex: "salle de classe", "cantine", "cour", "internat",
-       "examen", "plateforme en ligne").
-- Si non identifiable ou non pertinent : null.
-- Ne pas confondre avec pôle, académie ou rectorat (ex: Lille).
-
-================================================
-RÈGLES SUR "key_word"
-================================================
-
-- "key_word" = liste de 2 à 5 mots-clés factuels.
-- Ne pas dupliquer "label" ou "sous_label".
-- Mots courts, sans phrases, sans ponctuation superflue.
-- Objectif : aide à la statistique et au filtrage.
-
-================================================
-AIDE À L’INTERPRÉTATION — ACRONYMES
-================================================
-
-Les données peuvent contenir des acronymes.
-Ils servent d’INDICES DE CONTEXTE, mais ne sont PAS fiables à 100%.
-
-RÈGLES :
-1) Utilise un acronyme UNIQUEMENT s’il est cohérent avec le texte "Analyse".
-2) Ignore un acronyme si :
-   - il n’a pas de définition,
-   - il figure dans la liste "BRUIT",
-   - il semble hors-sujet (initiales, faute de frappe).
-3) Ne base JAMAIS une classification uniquement sur un acronyme.
-4) Ne recopie JAMAIS les définitions dans la sortie.
-
-ACRONYMES DÉFINIS :
-{acronymes_json}
-
-CODES BRUIT / FAUTES PROBABLES / INITIALES MÉDIATEURS :
-{bruit_json}
-
-================================================
-PRIORITÉ DES SOURCES POUR CLASSIFIER
-================================================
-
-1) Texte "Analyse" (priorité maximale)
-2) Champs métier structurés (Catégorie, Domaine, Sous-domaine, Nature de la saisine)
-3) Acronymes (indices secondaires uniquement)
-
-================================================
-ENTRÉE — LISTE DES PLAINTES (JSON)
-================================================
-
-Tu dois produire EXACTEMENT un objet de sortie par plainte,
-dans le MÊME ORDRE que la liste d’entrée.
-
-PLAINTES :
-{plaintes_json}
-
-================================================
-SORTIE ATTENDUE
-================================================
-
-RÉPONSE : UNIQUEMENT un tableau JSON,
-sans texte libre, sans commentaire, sans métadonnées.
-""".strip()
-
-
 # ---------- APPEL GEMINI ----------
 def enrich_batch(client: genai.Client, batch: List[dict]) -> List[dict]:
     """
@@ -468,6 +305,10 @@ def check_avancement():
 
 # ---------- LOGIQUE PRINCIPALE ----------
 def main():
+    fanout = None
+    etat = None
+    results = None
+    dirty = False
     try:
         print("\n" + "=" * 60)
         print("🚀 ENRICHISSEMENT MINIMAL DES PLAINTES (GEMINI)")
@@ -487,7 +328,7 @@ def main():
         print(f"\n[INFO] Nombre total de plaintes dans le fichier d'entrée : {len(plaintes)}")
         print(f"[INFO] Fichier de sortie : {OUTPUT_JSON.resolve()}")
 
-        existing_results, done_ids = load_existing_results()
+        existing_results, done_ids, rewrite_journal = load_existing_results()
 
         if existing_results:
             choice = input(
@@ -500,11 +341,35 @@ def main():
                 print("[INFO] Écrasement du fichier de sortie et reprise à zéro.")
                 existing_results = []
                 done_ids = set()
+                rewrite_journal = False
                 OUTPUT_JSON.unlink(missing_ok=True)
             else:
                 print("[INFO] Reprise : les plaintes dont l'id est déjà présent seront ignorées.")
 
-        results: List[dict] = list(existing_results)
+        results = list(existing_results)
+
+        # État d'avancement : remis à zéro si on repart de zéro
+        etat = EtatStore()
+        if not existing_results:
+            etat.reset()
+
+        # Plaintes invalidées par valider_sortie.py --requeue : ré-enrichies
+        a_refaire = set(etat.ids_by_status("a_refaire"))
+        if a_refaire:
+            print(f"[INFO] {len(a_refaire)} plaintes marquées 'a_refaire' seront ré-enrichies.")
+            results = [r for r in results if r.get("id") not in a_refaire]
+            done_ids -= a_refaire
+            rewrite_journal = dirty = True
+        etat.register((p.get("id") for p in plaintes), done_ids)
+
+        # Journal réécrit une fois (sans doublon ni ligne tronquée) avant les
+        # ajouts : push_to_elastic.py et l'ETL le lisent tel quel
+        if rewrite_journal:
+            safe_write_ndjson(OUTPUT_NDJSON, results)
+
+        # Sinks : remis à zéro si on repart de zéro, sinon en ajout
+        sinks = SINKS if "ndjson" in SINKS else ["ndjson", *SINKS]
+        fanout = build_fanout(sinks, OUTPUT_JSON, reset=not existing_results)
 
         pending = [p for p in plaintes if p.get("id") not in done_ids]
         print(f"[INFO] Plaintes restantes à traiter : {len(pending)}")
@@ -514,7 +379,12 @@ def main():
             ids_batch = [p.get("id") for p in batch]
             print(f"\n[INFO] Traitement batch {start} -> {start + len(batch) - 1} (ids={ids_batch})")
 
-            final_batch = enrich_batch(client, batch)
+            etat.mark_started(ids_batch)
+            try:
+                final_batch = enrich_batch(client, batch)
+            except Exception as e:
+                etat.mark_failed(ids_batch, str(e))
+                raise
 
             results.extend(final_batch)
             for obj in final_batch:
@@ -522,15 +392,26 @@ def main():
                 if pid is not None:
                     done_ids.add(pid)
 
-            safe_write_json(OUTPUT_JSON, results)
-            print(f"[OK] Batch de {len(final_batch)} plaintes enrichies et sauvegardées (total={len(results)}).")
+            dirty = True
+            etat.mark_done(ids_batch)
+            fanout.publish(final_batch)
+            print(f"[OK] Batch de {len(final_batch)} plaintes enrichies et journalisées (total={len(results)}).")
 
         print(f"\n[OK] Traitement terminé. {len(results)} plaintes enrichies au total.")
-        print(f"[OK] Résultat final dans : {OUTPUT_JSON.resolve()}")
+        print(f"[OK] Journal NDJSON : {OUTPUT_NDJSON.resolve()}")
 
     except Exception as e:
         print(f"[ERREUR] Une erreur s'est produite : {e}")
-        print("[INFO] Tout ce qui a été enrichi avant l'erreur est déjà sauvegardé (écriture atomique).")
+        print("[INFO] Tout ce qui a été enrichi avant l'erreur est déjà dans le journal NDJSON.")
+    finally:
+        if fanout is not None:
+            fanout.close()
+        if etat is not None:
+            etat.close()
+        # Export complet écrit une seule fois, y compris après une interruption
+        if results is not None and (dirty or not OUTPUT_JSON.exists()):
+            safe_write_json(OUTPUT_JSON, results)
+            print(f"[OK] Export JSON complet : {OUTPUT_JSON.resolve()}")
 
 if __name__ == "__main__":
     main()
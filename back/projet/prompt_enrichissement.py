@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Prompt d'enrichissement envoyé à Gemini pour un batch de plaintes.
+
+Séparé de output_tri_structure.py pour pouvoir être importé sans le SDK
+Gemini (audit de charge, stand-in local).
+"""
+
+import json
+from typing import List
+
+from acronymes import ACRONYMES, ACRONYMES_BRUIT
+from nature_probleme import NATURE_PROBLEME
+
+
+# ---------- PROMPT MINIMAL (verrouillé) ----------
+def build_batch_prompt(batch: List[dict]) -> str:
+    """
+    Construit le prompt pour UN BATCH :
+    - On fournit la taxonomie
+    - On fournit les plaintes
+    - On exige une sortie STRICTEMENT MINIMALE (label/sous_label/lieu/key_word) uniquement.
+    """
+    plaintes_json = json.dumps(batch, ensure_ascii=False, indent=2)
+    taxonomie_json = json.dumps(NATURE_PROBLEME, ensure_ascii=False, indent=2)
+    acronymes_json = json.dumps(ACRONYMES, ensure_ascii=False, indent=2)
+    bruit_json = json.dumps(sorted(list(ACRONYMES_BRUIT)), ensure_ascii=False, indent=2)
+
+    return f"""
+Tu es un expert de médiation scolaire. Tu dois classifier des saisines afin de produire
+des statistiques fiables, stables et exploitables.
+
+================================================
+IMPORTANT — CONTRAT DE SORTIE STRICT
+================================================
+
+Tu dois répondre UNIQUEMENT par un TABLEAU JSON.
+
+Chaque élément du tableau doit contenir :
+- OBLIGATOIREMENT :
+  1) "label"
+  2) "sous_label"
+  3) "lieu"
+  4) "key_word"
+
+- OPTIONNELLEMENT (UNIQUEMENT dans certains cas) :
+  5) "label_proposition"
+  6) "sous_label_proposition"
+
+⚠️ INTERDICTIONS ABSOLUES :
+- Ne renvoie AUCUN autre champ.
+- Ne renvoie PAS de résumé, analyse, émotion, gravité, urgence, etc.
+- Ne recopie JAMAIS le texte de la plainte.
+- Ne commente PAS ta réponse.
+
+================================================
+TAXONOMIE — CODES AUTORISÉS
+================================================
+
+La classification DOIT s’appuyer sur la taxonomie suivante.
+
+- "label" doit être une des clés principales de NATURE_PROBLEME
+- "sous_label" doit être une des clés de NATURE_PROBLEME[label]["sous_labels"]
+- Tu ne dois JAMAIS inventer de nouveaux codes pour la classification principale.
+
+NATURE_PROBLEME :
+{taxonomie_json}
+
+================================================
+RÈGLE FONDAMENTALE DE CLASSIFICATION
+================================================
+
+Tu dois TOUJOURS fournir une classification principale ("label", "sous_label").
+Cette classification est celle utilisée pour les statistiques.
+
+------------------------------------------------
+1) UTILISATION DE "autre"
+------------------------------------------------
+Utilise "label = autre" UNIQUEMENT si :
+- aucun label existant de la taxonomie ne correspond au problème,
+- le sujet est clairement hors du champ couvert par NATURE_PROBLEME.
+
+Si tu utilises "label = autre" :
+- tu DOIS proposer un "label_proposition",
+- et un "sous_label_proposition" si possible.
+
+------------------------------------------------
+2) UTILISATION DES PROPOSITIONS
+------------------------------------------------
+Les champs "label_proposition" et "sous_label_proposition" servent
+EXCLUSIVEMENT à suggérer une ÉVOLUTION de la taxonomie.
+
+Tu peux les utiliser si :
+- le cas est ambigu entre plusieurs sous_labels existants,
+- le sous_label existant est trop spécifique,
+- le problème est transversal ou récurrent,
+- plusieurs sous_labels proches pourraient s’appliquer.
+
+RÈGLES POUR LES PROPOSITIONS :
+- Elles doivent être PLUS GÉNÉRIQUES que la classification principale.
+- Elles doivent pouvoir regrouper PLUSIEURS cas similaires.
+- Elles doivent appartenir à la taxonomie existante
+  OU être formulées de manière suffisamment générales pour y être intégrées.
+
+------------------------------------------------
+3) CAS CLAIR
+------------------------------------------------
+Si la classification principale est claire et suffisante :
+- N’utilise PAS "label_proposition"
+- N’utilise PAS "sous_label_proposition"
+
+IMPORTANT :
+- "autre" n’est PAS une proposition.
+- Les propositions ne remplacent JAMAIS la classification principale.
+
+================================================
+RÈGLES SUR "lieu"
+================================================
+
+- "lieu" = lieu CONCRET si identifiable
+  (ex: "salle de classe", "cantine", "cour", "internat",
+       "examen", "plateforme en ligne").
+- Si non identifiable ou non pertinent : null.
+- Ne pas confondre avec pôle, académie ou rectorat (ex: Lille).
+
+================================================
+RÈGLES SUR "key_word"
+================================================
+
+- "key_word" = liste de 2 à 5 mots-clés factuels.
+- Ne pas dupliquer "label" ou "sous_label".
+- Mots courts, sans phrases, sans ponctuation superflue.
+- Objectif : aide à la statistique et au filtrage.
+
+================================================
+AIDE À L’INTERPRÉTATION — ACRONYMES
+================================================
+
+Les données peuvent contenir des acronymes.
+Ils servent d’INDICES DE CONTEXTE, mais ne sont PAS fiables à 100%.
+
+RÈGLES :
+1) Utilise un acronyme UNIQUEMENT s’il est cohérent avec le texte "Analyse".
+2) Ignore un acronyme si :
+   - il n’a pas de définition,
+   - il figure dans la liste "BRUIT",
+   - il semble hors-sujet (initiales, faute de frappe).
+3) Ne base JAMAIS une classification uniquement sur un acronyme.
+4) Ne recopie JAMAIS les définitions dans la sortie.
+
+ACRONYMES DÉFINIS :
+{acronymes_json}
+
+CODES BRUIT / FAUTES PROBABLES / INITIALES MÉDIATEURS :
+{bruit_json}
+
+================================================
+PRIORITÉ DES SOURCES POUR CLASSIFIER
+================================================
+
+1) Texte "Analyse" (priorité maximale)
+2) Champs métier structurés (Catégorie, Domaine, Sous-domaine, Nature de la saisine)
+3) Acronymes (indices secondaires uniquement)
+
+================================================
+ENTRÉE — LISTE DES PLAINTES (JSON)
+================================================
+
+Tu dois produire EXACTEMENT un objet de sortie par plainte,
+dans le MÊME ORDRE que la liste d’entrée.
+
+PLAINTES :
+{plaintes_json}
+
+================================================
+SORTIE ATTENDUE
+================================================
+
+RÉPONSE : UNIQUEMENT un tableau JSON,
+sans texte libre, sans commentaire, sans métadonnées.
+""".strip()
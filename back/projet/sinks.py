@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+"""
+Sinks de sortie de l'enrichissement.
+
+Chaque batch enrichi (déjà validé et sauvegardé) est diffusé, au fil de l'eau,
+vers des sinks configurables :
+- "ndjson"  : journal NDJSON en ajout (1 document par ligne),
+- "parquet" : fichier Parquet, 1 row group par batch,
+- "elastic" : envoi _bulk vers Elasticsearch.
+
+Chaque sink tourne dans son propre thread avec une file bornée : si un sink
+est lent, publish() bloque (backpressure) au lieu d'accumuler en mémoire.
+Un sink en erreur est désactivé sans interrompre l'enrichissement ; les
+batches qu'il n'a pas écrits sont récapitulés à la fermeture.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# ---------- CONFIG ----------
+QUEUE_MAX_BATCHES = 4  # batches en attente par sink avant blocage
+ES_URL = "http://localhost:9200"
+# Alias publié par front/push_to_elastic.py (génération courante). Une
+# génération découpée par année (--split-by-year) n'accepte pas d'écriture
+# via l'alias : le sink est alors désactivé, push_to_elastic.py reste la voie
+# de chargement.
+ES_INDEX = "plaintes_mediation"
+
+# Types connus pour le Parquet (les autres champs sont écrits en texte)
+PARQUET_TYPES = {
+    "id": "int64",
+    "key_word": "list<string>",
+}
+
+
+class Sink(ABC):
+    """Interface d'un sink : reçoit des batches de documents enrichis."""
+
+    name = "sink"
+
+    @abstractmethod
+    def write_batch(self, records: List[dict]) -> None:
+        """Écrit un batch ; une exception désactive le sink (cf. SinkFanout)."""
+
+    def close(self) -> None:
+        pass
+
+
+class NdjsonSink(Sink):
+    """Journal NDJSON en ajout, synchronisé sur disque à chaque batch."""
+
+    name = "ndjson"
+
+    def __init__(self, path: Path, reset: bool = False):
+        self.path = path
+        self._f = path.open("wb" if reset else "ab")
+
+    def write_batch(self, records: List[dict]) -> None:
+        payload = b"".join(
+            (json.dumps(r, ensure_ascii=False) + "\n").encode("utf-8") for r in records
+        )
+        self._f.write(payload)
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class ParquetSink(Sink):
+    """
+    Écrit un fichier Parquet par run (un row group par batch) dans `directory`.
+    Les fichiers Parquet ne pouvant pas être rouverts en ajout, une reprise
+    produit un nouveau fichier : les lecteurs lisent le dossier entier.
+    """
+
+    name = "parquet"
+
+    def __init__(self, directory: Path, reset: bool = False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._pa = pa
+        self._pq = pq
+        directory.mkdir(parents=True, exist_ok=True)
+        if reset:
+            for old in directory.glob("*.parquet"):
+                old.unlink()
+        self.path = directory / f"part-{time.strftime('%Y%m%d-%H%M%S')}.parquet"
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._writer = None
+        self.schema = None
+
+    def _build_schema(self, records: List[dict]):
+        pa = self._pa
+        types = {"int64": pa.int64(), "list<string>": pa.list_(pa.string())}
+        keys: Dict[str, None] = {}
+        for r in records:
+            keys.update(dict.fromkeys(r))
+        return pa.schema(
+            [pa.field(k, types.get(PARQUET_TYPES.get(k), pa.string())) for k in keys]
+        )
+
+    def write_batch(self, records: List[dict]) -> None:
+        if self._writer is None:
+            self.schema = self._build_schema(records)
+            self._writer = self._pq.ParquetWriter(self._tmp, self.schema, compression="zstd")
+        rows = []
+        for r in records:
+            row = {}
+            for field in self.schema:
+                value = r.get(field.name)
+                if value is not None and field.type == self._pa.string() and not isinstance(value, str):
+                    value = str(value)
+                row[field.name] = value
+            rows.append(row)
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._tmp.replace(self.path)
+
+
+class ElasticsearchSink(Sink):
+    """
+    Envoie chaque batch à Elasticsearch via _bulk (session HTTP réutilisée).
+    Les documents rejetés (réponse `errors: true`) sont écrits dans un
+    dead-letter NDJSON : {"status": ..., "error": ..., "doc": ...}.
+    """
+
+    name = "elastic"
+
+    def __init__(
+        self,
+        es_url: str = ES_URL,
+        index: str = ES_INDEX,
+        dead_letter: Optional[Path] = None,
+        reset: bool = False,
+    ):
+        import requests
+
+        self.es_url = es_url
+        self.index = index
+        self.session = requests.Session()
+        self.dead_letter = dead_letter
+        self.failed = 0
+        self._dead_letter_f = None
+        if dead_letter is not None and reset:
+            dead_letter.unlink(missing_ok=True)
+
+    def write_batch(self, records: List[dict]) -> None:
+        lines = []
+        for doc in records:
+            doc_id = doc.get("id")
+            # require_alias : sans alias publié, ES créerait un index concret du
+            # même nom qui bloquerait ensuite la création de l'alias
+            meta = {"_index": self.index, "require_alias": True}
+            if doc_id is not None:
+                meta["_id"] = doc_id
+            lines.append(json.dumps({"index": meta}, ensure_ascii=False))
+            lines.append(json.dumps(doc, ensure_ascii=False))
+        resp = self.session.post(
+            f"{self.es_url}/_bulk",
+            data=("\n".join(lines) + "\n").encode("utf-8"),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+        resp.raise_for_status()
+        body = resp.json()
+        if not body.get("errors"):
+            return
+        failed = []
+        for doc, item in zip(records, body.get("items", [])):
+            op = next(iter(item.values()))
+            if op.get("status", 500) >= 300:
+                failed.append({"status": op.get("status"), "error": op.get("error"), "doc": doc})
+        if self.dead_letter is None:
+            raise RuntimeError(f"{len(failed)} documents rejetés par Elasticsearch : {failed[0]['error']}")
+        self._write_dead_letter(failed)
+        print(f"[AVERTISSEMENT] Sink elastic : {len(failed)} documents rejetés -> {self.dead_letter}")
+
+    def _write_dead_letter(self, failed: List[dict]) -> None:
+        if self._dead_letter_f is None:
+            self._dead_letter_f = self.dead_letter.open("ab")
+        self._dead_letter_f.write(
+            b"".join((json.dumps(f, ensure_ascii=False) + "\n").encode("utf-8") for f in failed)
+        )
+        self._dead_letter_f.flush()
+        self.failed += len(failed)
+
+    def close(self) -> None:
+        self.session.close()
+        if self._dead_letter_f is not None:
+            self._dead_letter_f.close()
+
+
+class SinkFanout:
+    """
+    Diffuse chaque batch vers plusieurs sinks, chacun dans un thread dédié
+    alimenté par une file bornée (backpressure).
+    """
+
+    _STOP = object()
+
+    def __init__(self, sinks: List[Sink], max_pending: int = QUEUE_MAX_BATCHES):
+        self.sinks = sinks
+        self.errors: Dict[str, Exception] = {}
+        # Batches non écrits par sink (désactivé) : [nombre de batches, de documents]
+        self.skipped: Dict[str, List[int]] = {}
+        self._queues = [queue.Queue(maxsize=max_pending) for _ in sinks]
+        self._threads = [
+            threading.Thread(target=self._run, args=(sink, q), name=f"sink-{sink.name}", daemon=True)
+            for sink, q in zip(sinks, self._queues)
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _run(self, sink: Sink, q: queue.Queue) -> None:
+        while True:
+            batch = q.get()
+            if batch is self._STOP:
+                break
+            if sink.name in self.errors:
+                # sink désactivé : on vide la file sans bloquer le producteur
+                self._skip(sink, batch)
+                continue
+            try:
+                sink.write_batch(batch)
+            except Exception as e:
+                self.errors[sink.name] = e
+                self._skip(sink, batch)
+                print(f"[ERREUR] Sink '{sink.name}' désactivé : {e}")
+        try:
+            sink.close()
+        except Exception as e:
+            self.errors.setdefault(sink.name, e)
+            print(f"[ERREUR] Fermeture du sink '{sink.name}' : {e}")
+
+    def _skip(self, sink: Sink, batch: List[dict]) -> None:
+        counts = self.skipped.setdefault(sink.name, [0, 0])
+        counts[0] += 1
+        counts[1] += len(batch)
+
+    def publish(self, batch: List[dict]) -> None:
+        """Ajoute un batch à la file de chaque sink (bloque si une file est pleine)."""
+        for q in self._queues:
+            q.put(batch)
+
+    def close(self) -> None:
+        """Vide les files, ferme les sinks et attend la fin des threads."""
+        for q in self._queues:
+            q.put(self._STOP)
+        for t in self._threads:
+            t.join()
+        for name in sorted(self.errors):
+            n_batches, n_docs = self.skipped.get(name, (0, 0))
+            print(
+                f"[AVERTISSEMENT] Sink '{name}' en erreur ({self.errors[name]}) : "
+                f"{n_batches} batches / {n_docs} documents non écrits."
+            )
+
+
+def build_sinks(names: List[str], output_json: Path, reset: bool = False) -> List[Sink]:
+    """
+    Construit les sinks demandés. Les chemins sont dérivés du fichier de sortie
+    JSON (ex: output_tri_structure2.ndjson, output_tri_structure2_parquet/).
+    """
+    sinks: List[Sink] = []
+    for name in names:
+        if name == "ndjson":
+            sinks.append(NdjsonSink(output_json.with_suffix(".ndjson"), reset=reset))
+        elif name == "parquet":
+            sinks.append(ParquetSink(output_json.with_name(output_json.stem + "_parquet"), reset=reset))
+        elif name == "elastic":
+            dead_letter = output_json.with_name(output_json.stem + "_elastic_dead_letter.ndjson")
+            sinks.append(ElasticsearchSink(dead_letter=dead_letter, reset=reset))
+        else:
+            raise ValueError(f"Sink inconnu : {name}")
+    return sinks
+
+
+def build_fanout(names: List[str], output_json: Path, reset: bool = False) -> Optional[SinkFanout]:
+    """Retourne un SinkFanout, ou None si aucun sink n'est configuré."""
+    if not names:
+        return None
+    return SinkFanout(build_sinks(names, output_json, reset=reset))
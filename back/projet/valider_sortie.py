@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+"""
+Validation d'intégrité de la sortie enrichie (JSON liste ou NDJSON).
+
+- Lecture en streaming (json_to_ndjson.iter_json_array / lignes NDJSON).
+- Chaque objet est vérifié contre le contrat EnrichissementMinimal et les
+  couples (label, sous_label) de NATURE_PROBLEME, dans un pool de processus.
+- Rapport JSON : nombre d'objets par type de violation et ids concernés.
+- `--requeue` : les ids en erreur passent au statut "a_refaire" dans la base
+  d'état ; output_tri_structure.py les ré-enrichit au run suivant.
+
+Erreurs (contrat rompu, ré-enrichissement) :
+    non_objet, id_manquant, champ_manquant, type_invalide,
+    label_inconnu, sous_label_inconnu
+Avertissements (signalés seulement) :
+    id_duplique, autre_sans_proposition, key_word_hors_limites
+
+Usage :
+    python valider_sortie.py
+    python valider_sortie.py --input ../data/output/output_tri_structure2.json --workers 4 --requeue
+"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+from pydantic import ValidationError
+
+from contrat_sortie import CHAMPS_ENRICHIS, EnrichissementMinimal
+from etat_enrichissement import ETAT_DB, EtatStore
+from json_to_ndjson import iter_chunks, iter_json_array
+from nature_probleme import NATURE_PROBLEME
+
+# ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
+BASE_DIR = Path(__file__).resolve().parent.parent
+INPUT = BASE_DIR / "data" / "output" / "output_tri_structure2.ndjson"  # journal de l'enrichissement
+REPORT = BASE_DIR / "data" / "output" / "validation_sortie_rapport.json"
+
+# ---------- CONFIG ----------
+RECORDS_PER_CHUNK = 5000
+WORKERS = os.cpu_count() or 1
+KEY_WORD_MIN, KEY_WORD_MAX = 2, 5
+
+ERREURS = (
+    "non_objet", "id_manquant", "champ_manquant", "type_invalide",
+    "label_inconnu", "sous_label_inconnu",
+)
+AVERTISSEMENTS = ("id_duplique", "autre_sans_proposition", "key_word_hors_limites")
+
+
+def check_record(obj: Any) -> List[str]:
+    """Retourne la liste des violations d'un objet de sortie (vide si conforme)."""
+    if not isinstance(obj, dict):
+        return ["non_objet"]
+
+    violations = []
+    if obj.get("id") is None:
+        violations.append("id_manquant")
+
+    if any(name not in obj for name in CHAMPS_ENRICHIS):
+        violations.append("champ_manquant")
+    try:
+        EnrichissementMinimal.model_validate({k: obj[k] for k in CHAMPS_ENRICHIS if k in obj}, strict=True)
+    except ValidationError as e:
+        if any(err["type"] != "missing" for err in e.errors()):
+            violations.append("type_invalide")
+
+    label, sous_label = obj.get("label"), obj.get("sous_label")
+    if isinstance(label, str) and isinstance(sous_label, str):
+        entry = NATURE_PROBLEME.get(label)
+        if entry is None:
+            violations.append("label_inconnu")
+        elif sous_label not in entry["sous_labels"]:
+            violations.append("sous_label_inconnu")
+        if label == "autre" and not obj.get("label_proposition"):
+            violations.append("autre_sans_proposition")
+
+    key_word = obj.get("key_word")
+    if isinstance(key_word, list) and not KEY_WORD_MIN <= len(key_word) <= KEY_WORD_MAX:
+        violations.append("key_word_hors_limites")
+
+    return violations
+
+
+def check_chunk(chunk: List[Tuple[int, Any]]) -> Tuple[int, List[Tuple[Any, List[str]]], List[Any]]:
+    """
+    Vérifie un chunk de (position, objet ou ligne NDJSON brute).
+    Retourne (nombre d'objets, violations [(id, [types])], ids rencontrés).
+    Les objets sans id sont désignés par leur position ("#<n>").
+    """
+    violations = []
+    ids = []
+    for position, item in chunk:
+        if isinstance(item, (bytes, str)):
+            try:
+                item = json.loads(item)
+            except ValueError:
+                violations.append((f"#{position}", ["non_objet"]))
+                continue
+        found = check_record(item)
+        obj_id = item.get("id") if isinstance(item, dict) else None
+        if obj_id is not None:
+            ids.append(obj_id)
+        if found:
+            violations.append((obj_id if obj_id is not None else f"#{position}", found))
+    return len(chunk), violations, ids
+
+
+def iter_items(path: Path) -> Iterator[Any]:
+    """
+    Itère sur les objets (JSON liste) ou les lignes brutes (NDJSON, .gz
+    accepté) ; le décodage des lignes NDJSON est fait par les workers.
+    """
+    name = path.name.removesuffix(".gz")
+    if name.endswith(".ndjson"):
+        opener = gzip.open if path.suffix == ".gz" else open
+        with opener(path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield line
+    else:
+        yield from iter_json_array(path)
+
+
+@dataclass
+class ValidationReport:
+    fichier: str
+    total: int = 0
+    violations: Dict[str, List[Any]] = field(default_factory=dict)
+    a_refaire: List[Any] = field(default_factory=list)
+
+    def add(self, obj_id: Any, types_: List[str]) -> None:
+        for t in types_:
+            self.violations.setdefault(t, []).append(obj_id)
+        if any(t in ERREURS for t in types_):
+            self.a_refaire.append(obj_id)
+
+    def to_dict(self) -> Dict:
+        invalides = len(self.a_refaire)
+        return {
+            "fichier": self.fichier,
+            "genere_le": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "total": self.total,
+            "valides": self.total - invalides,
+            "invalides": invalides,
+            "compteurs": {t: len(ids) for t, ids in sorted(self.violations.items())},
+            "violations": {t: ids for t, ids in sorted(self.violations.items())},
+            "a_refaire": self.a_refaire,
+        }
+
+
+def validate(path: Path, workers: int = WORKERS) -> ValidationReport:
+    """Valide le fichier en streaming ; les chunks sont vérifiés en parallèle."""
+    report = ValidationReport(fichier=str(path))
+    chunks = iter_chunks(enumerate(iter_items(path)), RECORDS_PER_CHUNK)
+    seen: Counter = Counter()
+
+    def collect(result):
+        count, violations, ids = result
+        report.total += count
+        for obj_id, types_ in violations:
+            report.add(obj_id, types_)
+        seen.update(ids)
+
+    if workers <= 1:
+        for chunk in chunks:
+            collect(check_chunk(chunk))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Nombre de chunks en vol borné : mémoire constante
+            in_flight = deque()
+            for chunk in chunks:
+                in_flight.append(pool.submit(check_chunk, chunk))
+                if len(in_flight) >= workers * 2:
+                    collect(in_flight.popleft().result())
+            while in_flight:
+                collect(in_flight.popleft().result())
+
+    for obj_id, n in seen.items():
+        if n > 1:
+            report.add(obj_id, ["id_duplique"])
+    return report
+
+
+def requeue(report: ValidationReport, db_path: Path = ETAT_DB) -> int:
+    """Passe les ids en erreur au statut "a_refaire" dans la base d'état."""
+    ids = [i for i in report.a_refaire if not (isinstance(i, str) and i.startswith("#"))]
+    if not ids:
+        return 0
+    store = EtatStore(db_path)
+    try:
+        return store.mark_redo(ids, "sortie invalide (valider_sortie.py)")
+    finally:
+        store.close()
+
+
+def save_report(report: ValidationReport, path: Path) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(report.to_dict(), f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    tmp.replace(path)
+
+
+def display_report(report: ValidationReport, limit: int = 10) -> None:
+    print("=" * 60)
+    print(f"[INFO] Objets vérifiés : {report.total}")
+    print(f"[INFO] Objets à ré-enrichir (erreurs) : {len(report.a_refaire)}")
+    for t, ids in sorted(report.violations.items()):
+        niveau = "ERREUR" if t in ERREURS else "AVERTISSEMENT"
+        apercu = ", ".join(str(i) for i in ids[:limit]) + (" ..." if len(ids) > limit else "")
+        print(f"[{niveau}] {t} : {len(ids)} (ids : {apercu})")
+    if not report.violations:
+        print("[OK] Aucun problème d'intégrité détecté.")
+    print("=" * 60)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validation d'intégrité de la sortie enrichie.")
+    parser.add_argument("--input", type=Path, default=INPUT, help="Sortie enrichie (JSON liste ou NDJSON).")
+    parser.add_argument("--report", type=Path, default=REPORT, help="Rapport JSON produit.")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="Processus de vérification.")
+    parser.add_argument("--requeue", action="store_true", help="Remet les ids en erreur dans la file d'enrichissement.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if not args.input.exists():
+        print(f"[ERREUR] Fichier introuvable : {args.input.resolve()}")
+        return
+
+    print(f"[INFO] Validation en streaming de : {args.input.resolve()}")
+    t0 = time.perf_counter()
+    report = validate(args.input, args.workers)
+    print(f"[INFO] Validation terminée en {time.perf_counter() - t0:.1f}s.")
+    display_report(report)
+
+    save_report(report, args.report)
+    print(f"[OK] Rapport : {args.report.resolve()}")
+    if args.requeue:
+        print(f"[OK] {requeue(report)} plaintes remises dans la file d'enrichissement (statut 'a_refaire').")
+
+
+if __name__ == "__main__":
+    main()
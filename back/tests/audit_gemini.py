@@ -1,9 +1,64 @@
-import time
+#!/usr/bin/env python
+"""
+Audit de l'API Gemini.
+
+Deux modes :
+- ping   : appels séquentiels minimaux, latence par appel (mode historique),
+- charge : balayage taille de batch × concurrence avec de vrais prompts
+           (build_batch_prompt sur un échantillon de plaintes). Pour chaque
+           couple : histogramme de latence, tokens, taux de parsing réussi,
+           fréquence des 429 / 503, débit en plaintes/min. Un tableau final
+           recommande un point de fonctionnement (BATCH_SIZE, concurrence).
+
+Le backend peut être l'API réelle ou le stand-in local (fake_gemini.py),
+qui ne nécessite ni clé API ni réseau.
+
+Usage :
+    python audit_gemini.py                                  # ping (10 appels)
+    python audit_gemini.py --mode charge --backend fake --fake-time-scale 0.05
+    python audit_gemini.py --mode charge --batch-sizes 5 10 20 --concurrency 1 2 4 --requests 12
+"""
+
+import argparse
 import json
-from google import genai
-from google.genai import types
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
 from pydantic import BaseModel
-from typing import List, Optional
+
+try:
+    from google import genai
+    from google.genai import types
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    genai = None
+    types = None
+
+# ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
+BASE_DIR = Path(__file__).resolve().parent.parent
+API_KEY_FILE = BASE_DIR / "projet" / "api_key.txt"
+INPUT_JSON = BASE_DIR / "data" / "output" / "output_tri.json"
+REPORT_JSON = BASE_DIR / "data" / "output" / "audit_gemini_charge.json"
+
+sys.path.insert(0, str(BASE_DIR / "projet"))
+from contrat_sortie import EnrichissementMinimal  # noqa: E402
+from json_to_ndjson import iter_json_array  # noqa: E402
+from prompt_enrichissement import build_batch_prompt  # noqa: E402
+from fake_gemini import MOTS_DOMAINE, FakeGeminiClient, FakeGeminiConfig  # noqa: E402
+
+# ---------- CONFIG ----------
+MODEL = "gemini-2.5-flash-lite"
+BATCH_SIZES = [1, 5, 10, 20]
+CONCURRENCY = [1, 2, 4, 8]
+REQUESTS_PER_CELL = 12            # appels par couple (batch, concurrence)
+SAMPLE_SIZE = 500                 # plaintes échantillonnées dans le fichier d'entrée
+MAX_ERROR_RATE = 0.05             # 429 + 503 + parsing raté tolérés pour la recommandation
+LATENCY_BUCKETS = [0.5, 1, 2, 4, 8, 16, 32, 64]  # bornes hautes (secondes)
+
 
 class PingOut(BaseModel):
     label: str
@@ -11,6 +66,11 @@ class PingOut(BaseModel):
     lieu: Optional[str] = None
     key_word: List[str] = []
 
+
+def load_api_key() -> str:
+    return API_KEY_FILE.read_text(encoding="utf-8").strip()
+
+
 def run_audit(api_key: str, n: int = 5):
     client = genai.Client(api_key=api_key)
 
@@ -23,7 +83,7 @@ Retourne UNIQUEMENT un JSON valide correspondant au schéma:
         t0 = time.time()
         try:
             resp = client.models.generate_content(
-                model="gemini-2.5-flash-lite",
+                model=MODEL,
                 contents=prompt,
                 config=types.GenerateContentConfig(
                     response_mime_type="application/json",
@@ -42,8 +102,255 @@ Retourne UNIQUEMENT un JSON valide correspondant au schéma:
             dt = time.time() - t0
             print(f"[{i+1}/{n}] latency={dt:.2f}s ERROR={e}")
 
+
+# ---------- MODE CHARGE ----------
+
+def sample_plaintes(path: Path, k: int, seed: int = 0) -> List[dict]:
+    """Échantillon aléatoire (reservoir sampling) sans charger tout le fichier."""
+    rng = random.Random(seed)
+    sample: List[dict] = []
+    for i, obj in enumerate(iter_json_array(path)):
+        if len(sample) < k:
+            sample.append(obj)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                sample[j] = obj
+    return sample
+
+
+def synthetic_plaintes(k: int, seed: int = 0) -> List[dict]:
+    """Plaintes factices (quand le fichier d'entrée est absent, backend fake)."""
+    rng = random.Random(seed)
+    return [
+        {"id": i, "Catégorie": "Scolarité", "Analyse": " ".join(rng.choices(MOTS_DOMAINE, k=rng.randint(30, 200)))}
+        for i in range(k)
+    ]
+
+
+def classify_error(message: str) -> str:
+    """Même classification que output_tri_structure.enrich_batch."""
+    if "429" in message or "RESOURCE_EXHAUSTED" in message:
+        return "429"
+    if "503" in message or "UNAVAILABLE" in message:
+        return "503"
+    return "autre_erreur"
+
+
+@dataclass
+class CallResult:
+    latency: float
+    outcome: str  # "ok", "parse_echec", "429", "503", "autre_erreur"
+    plaintes: int
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+
+
+@dataclass
+class CellStats:
+    batch_size: int
+    concurrency: int
+    wall_time: float
+    calls: List[CallResult] = field(default_factory=list)
+
+    def rate(self, outcome: str) -> float:
+        return sum(c.outcome == outcome for c in self.calls) / len(self.calls) if self.calls else 0.0
+
+    @property
+    def error_rate(self) -> float:
+        return 1.0 - self.rate("ok")
+
+    def parse_success_rate(self) -> float:
+        """Part des réponses reçues (hors 429 / 503 / erreurs) correctement parsées."""
+        answered = [c for c in self.calls if c.outcome in ("ok", "parse_echec")]
+        return sum(c.outcome == "ok" for c in answered) / len(answered) if answered else 0.0
+
+    @property
+    def plaintes_per_min(self) -> float:
+        done = sum(c.plaintes for c in self.calls if c.outcome == "ok")
+        return done / self.wall_time * 60 if self.wall_time else 0.0
+
+    def percentile(self, q: float) -> float:
+        latencies = sorted(c.latency for c in self.calls if c.outcome == "ok")
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+    def histogram(self) -> Dict[str, int]:
+        hist = {f"<={b}s": 0 for b in LATENCY_BUCKETS}
+        hist[f">{LATENCY_BUCKETS[-1]}s"] = 0
+        for c in self.calls:
+            for b in LATENCY_BUCKETS:
+                if c.latency <= b:
+                    hist[f"<={b}s"] += 1
+                    break
+            else:
+                hist[f">{LATENCY_BUCKETS[-1]}s"] += 1
+        return hist
+
+    def tokens_per_plainte(self) -> float:
+        ok = [c for c in self.calls if c.outcome == "ok" and c.plaintes]
+        total = sum(c.prompt_tokens + c.output_tokens for c in ok)
+        return total / sum(c.plaintes for c in ok) if ok else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "batch_size": self.batch_size,
+            "concurrency": self.concurrency,
+            "appels": len(self.calls),
+            "duree_s": round(self.wall_time, 2),
+            "plaintes_par_min": round(self.plaintes_per_min, 1),
+            "latence_p50_s": round(self.percentile(0.5), 2),
+            "latence_p95_s": round(self.percentile(0.95), 2),
+            "taux_parsing_ok": round(self.parse_success_rate(), 3),
+            "taux_429": round(self.rate("429"), 3),
+            "taux_503": round(self.rate("503"), 3),
+            "taux_autres_erreurs": round(self.rate("autre_erreur"), 3),
+            "tokens_par_plainte": round(self.tokens_per_plainte(), 1),
+            "tokens_entree": sum(c.prompt_tokens for c in self.calls),
+            "tokens_sortie": sum(c.output_tokens for c in self.calls),
+            "histogramme_latence": self.histogram(),
+        }
+
+
+def make_config():
+    """Configuration de génération (identique à l'enrichissement) ; None sans SDK."""
+    if types is None:
+        return None
+    return types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=list[EnrichissementMinimal],
+    )
+
+
+def timed_call(client, batch: List[dict], config) -> CallResult:
+    """Un appel d'enrichissement mesuré, sans retry (on mesure les erreurs brutes)."""
+    prompt = build_batch_prompt(batch)
+    t0 = time.perf_counter()
+    try:
+        resp = client.models.generate_content(model=MODEL, contents=prompt, config=config)
+    except Exception as e:
+        return CallResult(time.perf_counter() - t0, classify_error(str(e)), len(batch))
+    latency = time.perf_counter() - t0
+
+    usage = getattr(resp, "usage_metadata", None)
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    parsed = resp.parsed
+    ok = isinstance(parsed, list) and len(parsed) == len(batch)
+    return CallResult(latency, "ok" if ok else "parse_echec", len(batch), prompt_tokens, output_tokens)
+
+
+def run_cell(client, plaintes: List[dict], batch_size: int, concurrency: int, n_requests: int, rng: random.Random) -> CellStats:
+    """Envoie n_requests batches de batch_size plaintes avec `concurrency` appels en vol."""
+    batches = [rng.sample(plaintes, min(batch_size, len(plaintes))) for _ in range(n_requests)]
+    config = make_config()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        calls = list(pool.map(lambda b: timed_call(client, b, config), batches))
+    return CellStats(batch_size, concurrency, time.perf_counter() - t0, calls)
+
+
+def recommend(cells: List[CellStats], max_error_rate: float) -> Optional[CellStats]:
+    """Meilleur débit parmi les couples dont le taux d'erreur reste sous le seuil."""
+    eligible = [c for c in cells if c.error_rate <= max_error_rate]
+    return max(eligible, key=lambda c: c.plaintes_per_min) if eligible else None
+
+
+def display_cells(cells: List[CellStats], best: Optional[CellStats]) -> None:
+    print("\n" + "=" * 96)
+    print(f"{'batch':>5} {'conc.':>5} {'plaintes/min':>12} {'p50 (s)':>8} {'p95 (s)':>8} "
+          f"{'parsing':>8} {'429':>6} {'503':>6} {'tok/plainte':>11}")
+    print("-" * 96)
+    for c in cells:
+        d = c.to_dict()
+        marker = "  <= recommandé" if c is best else ""
+        print(
+            f"{c.batch_size:>5} {c.concurrency:>5} {d['plaintes_par_min']:>12.1f} {d['latence_p50_s']:>8.2f} "
+            f"{d['latence_p95_s']:>8.2f} {d['taux_parsing_ok']:>8.1%} {d['taux_429']:>6.1%} {d['taux_503']:>6.1%} "
+            f"{d['tokens_par_plainte']:>11.0f}{marker}"
+        )
+    print("=" * 96)
+
+
+def display_histogram(cell: CellStats) -> None:
+    hist = cell.histogram()
+    peak = max(hist.values()) or 1
+    print(f"\nHistogramme de latence (batch {cell.batch_size}, concurrence {cell.concurrency}) :")
+    for bucket, n in hist.items():
+        print(f"  {bucket:>7} | {'#' * round(n / peak * 40)} {n}")
+
+
+def run_load_test(args) -> None:
+    if args.backend == "fake":
+        client = FakeGeminiClient(FakeGeminiConfig(time_scale=args.fake_time_scale, seed=args.seed))
+    else:
+        if genai is None:
+            raise SystemExit("[ERREUR] Le module google-genai est absent : utiliser --backend fake.")
+        client = genai.Client(api_key=load_api_key())
+
+    if INPUT_JSON.exists():
+        print(f"[INFO] Échantillonnage de {args.sample} plaintes dans {INPUT_JSON.name}...")
+        plaintes = sample_plaintes(INPUT_JSON, args.sample, args.seed)
+    elif args.backend == "fake":
+        print(f"[AVERTISSEMENT] {INPUT_JSON} introuvable : plaintes synthétiques.")
+        plaintes = synthetic_plaintes(args.sample, args.seed)
+    else:
+        raise SystemExit(f"[ERREUR] Fichier d'entrée introuvable : {INPUT_JSON}")
+
+    rng = random.Random(args.seed)
+    cells: List[CellStats] = []
+    for batch_size in args.batch_sizes:
+        for concurrency in args.concurrency:
+            print(f"[INFO] Batch {batch_size} × concurrence {concurrency} : {args.requests} appels...")
+            cell = run_cell(client, plaintes, batch_size, concurrency, args.requests, rng)
+            cells.append(cell)
+
+    best = recommend(cells, args.max_error_rate)
+    display_cells(cells, best)
+    if best is not None:
+        display_histogram(best)
+        print(
+            f"\n[OK] Recommandation : BATCH_SIZE = {best.batch_size}, concurrence = {best.concurrency} "
+            f"({best.plaintes_per_min:.0f} plaintes/min, erreurs {best.error_rate:.1%})."
+        )
+    else:
+        print(f"\n[AVERTISSEMENT] Aucun couple sous le seuil d'erreurs ({args.max_error_rate:.0%}) : réduire la charge.")
+
+    report = {
+        "backend": args.backend,
+        "modele": MODEL,
+        "genere_le": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seuil_erreurs": args.max_error_rate,
+        "recommandation": None if best is None else {"batch_size": best.batch_size, "concurrency": best.concurrency},
+        "resultats": [c.to_dict() for c in cells],
+    }
+    args.report.parent.mkdir(parents=True, exist_ok=True)
+    args.report.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    print(f"[OK] Rapport détaillé : {args.report.resolve()}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Audit de l'API Gemini (ping ou charge).")
+    parser.add_argument("--mode", choices=["ping", "charge"], default="ping")
+    parser.add_argument("--backend", choices=["gemini", "fake"], default="gemini", help="API réelle ou stand-in local.")
+    parser.add_argument("-n", type=int, default=10, help="Nombre d'appels en mode ping.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=BATCH_SIZES)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    parser.add_argument("--requests", type=int, default=REQUESTS_PER_CELL, help="Appels par couple (batch, concurrence).")
+    parser.add_argument("--sample", type=int, default=SAMPLE_SIZE, help="Plaintes échantillonnées.")
+    parser.add_argument("--max-error-rate", type=float, default=MAX_ERROR_RATE)
+    parser.add_argument("--fake-time-scale", type=float, default=1.0, help="Accélération du stand-in (ex: 0.05).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=Path, default=REPORT_JSON)
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
-    from pathlib import Path
-    api_key_path = Path(__file__).resolve().parent.parent / "projet" / "api_key.txt"
-    api_key = open(api_key_path, "r", encoding="utf-8").read().strip()
-    run_audit(api_key, n=10)
+    args = parse_args()
+    if args.mode == "charge":
+        run_load_test(args)
+    else:
+        if genai is None:
+            raise SystemExit("[ERREUR] Le module google-genai est absent.")
+        run_audit(load_api_key(), n=args.n)
@@ -3,9 +3,22 @@
 Outil de vérification de l'avancement de l'enrichissement des plaintes.
 Permet de vérifier l'état actuel du traitement et de reprendre proprement
 au bon endroit si l'API est down.
+
+L'avancement est lu dans la base d'état SQLite tenue par le run
+(cf. projet/etat_enrichissement.py) : instantané, y compris pendant un run.
+Les fichiers JSON ne sont chargés qu'à la demande (échantillon, intégrité,
+listes d'ids) ou si la base n'existe pas encore.
+
+Usage :
+    python avancement_checker.py              # menu
+    python avancement_checker.py --live       # suivi en direct (Ctrl+C pour quitter)
+    python avancement_checker.py --live --interval 10
 """
 
+import argparse
 import json
+import sys
+import time
 from pathlib import Path
 from typing import List, Set, Dict, Optional
 
@@ -14,6 +27,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 INPUT_JSON = BASE_DIR / "data" / "output" / "output_tri.json"
 OUTPUT_JSON = BASE_DIR / "data" / "output" / "output_tri_structure2.json"
 
+sys.path.insert(0, str(BASE_DIR / "projet"))
+from etat_enrichissement import ETAT_DB, EtatStore  # noqa: E402
+from valider_sortie import REPORT as VALIDATION_REPORT, display_report, requeue, save_report, validate  # noqa: E402
+
+# ---------- CONFIG ----------
+REFRESH_INTERVAL = 5  # secondes entre deux rafraîchissements du suivi en direct
+
+_json_cache: Dict = {}  # fichiers JSON et statistiques, chargés à la demande
+
 
 def load_json_list(path: Path) -> List[dict]:
     """
@@ -43,6 +65,68 @@ def load_json_list(path: Path) -> List[dict]:
     return []
 
 
+def get_json_list(path: Path) -> List[dict]:
+    """Charge un fichier JSON une seule fois (au premier besoin)."""
+    if path not in _json_cache:
+        print(f"[INFO] Chargement de {path.name}...")
+        _json_cache[path] = load_json_list(path)
+    return _json_cache[path]
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "inconnue"
+    seconds = int(seconds)
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+def display_store_summary(store: EtatStore, failures_limit: int = 5):
+    """Affiche l'avancement lu dans la base d'état (débit, ETA, échecs)."""
+    summary = store.summary()
+    counts = summary["counts"]
+    print("\n" + "="*60)
+    print("📊 AVANCEMENT (base d'état)")
+    print("="*60)
+    print(f"Plaintes suivies                : {summary['total']}")
+    print(f"Plaintes enrichies              : {summary['done']} ({summary['percentage']:.2f}%)")
+    print(f"Plaintes restantes              : {summary['remaining']}")
+    print(f"  dont en cours                 : {counts['en_cours']}")
+    print(f"  dont en échec                 : {counts['echec']}")
+    print(f"  dont à ré-enrichir            : {counts['a_refaire']}")
+    print(f"Débit récent                    : {summary['per_min']:.1f} plaintes/min")
+    print(f"Temps restant estimé (ETA)      : {format_duration(summary['eta_seconds'])}")
+    if summary["last_done_at"] is not None:
+        print(f"Dernier batch terminé           : {time.strftime('%H:%M:%S', time.localtime(summary['last_done_at']))}")
+
+    failures = store.failures(failures_limit)
+    if failures:
+        print("\nDerniers échecs :")
+        for obj_id, attempts, error in failures:
+            print(f"  - ID {obj_id} ({attempts} tentative(s)) : {(error or '')[:100]}")
+    print("="*60 + "\n")
+
+
+def live_mode(interval: float = REFRESH_INTERVAL):
+    """Rafraîchit l'avancement toutes les `interval` secondes (Ctrl+C pour quitter)."""
+    try:
+        while True:
+            store = EtatStore.open_if_exists(ETAT_DB)
+            print("\033[2J\033[H", end="")  # efface l'écran
+            print(f"🔄 Suivi en direct — {time.strftime('%H:%M:%S')} (rafraîchi toutes les {interval:g}s, Ctrl+C pour quitter)")
+            if store is None:
+                print(f"[INFO] Base d'état absente ({ETAT_DB}) : en attente du démarrage du run...")
+            else:
+                try:
+                    display_store_summary(store)
+                finally:
+                    store.close()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print("\n[INFO] Fin du suivi en direct.")
+
+
 def get_statistics(input_data: List[dict], output_data: List[dict]) -> Dict:
     """
     Calcule les statistiques de l'avancement.
@@ -133,65 +217,63 @@ def display_sample_pending(pending_ids: Set, input_data: List[dict], limit: int
     print("-" * 60 + "\n")
 
 
-def check_file_integrity(output_data: List[dict]) -> bool:
+def check_file_integrity(path: Path) -> bool:
     """
-    Vérifie l'intégrité du fichier de sortie.
+    Vérifie l'intégrité du fichier de sortie (contrat EnrichissementMinimal,
+    couples label / sous_label de NATURE_PROBLEME) en streaming, via
+    valider_sortie.py. Propose de remettre les objets en erreur dans la file.
     """
-    issues = []
-    
-    for i, obj in enumerate(output_data):
-        if not isinstance(obj, dict):
-            issues.append(f"Ligne {i}: n'est pas un dictionnaire")
-            continue
-        
-        if "id" not in obj:
-            issues.append(f"Ligne {i}: manque le champ 'id'")
-        
-        # Vérifier si les champs d'enrichissement sont présents
-        required_enrichment_fields = [
-            "categorie_probleme", "sous_probleme", "gravite", "urgence"
-        ]
-        missing_fields = [field for field in required_enrichment_fields if field not in obj]
-        if missing_fields:
-            issues.append(f"Ligne {i} (ID: {obj.get('id', 'N/A')}): champs manquants: {', '.join(missing_fields)}")
-    
-    if issues:
-        print("\n⚠️  PROBLÈMES D'INTÉGRITÉ DÉTECTÉS :")
-        print("-" * 60)
-        for issue in issues[:10]:  # Limiter à 10 pour ne pas surcharger
-            print(f"  - {issue}")
-        if len(issues) > 10:
-            print(f"  ... et {len(issues) - 10} autres problèmes.")
-        print("-" * 60 + "\n")
+    report = validate(path)
+    display_report(report)
+    save_report(report, VALIDATION_REPORT)
+    print(f"[OK] Rapport détaillé : {VALIDATION_REPORT}")
+
+    if report.a_refaire:
+        choice = input(
+            f"Remettre les {len(report.a_refaire)} plaintes en erreur dans la file d'enrichissement ? [O]ui / [N]on : "
+        ).strip().lower()
+        if choice in ("o", "oui"):
+            print(f"[OK] {requeue(report)} plaintes marquées 'a_refaire'.")
         return False
-    
-    print("✅ Aucun problème d'intégrité détecté.\n")
     return True
 
 
+def json_statistics() -> Optional[Dict]:
+    """Statistiques calculées depuis les fichiers JSON (chargés au premier appel)."""
+    input_data = get_json_list(INPUT_JSON)
+    if not input_data:
+        print(f"[ERREUR] Le fichier d'entrée {INPUT_JSON} est vide ou introuvable.")
+        return None
+    if "stats" not in _json_cache:
+        _json_cache["stats"] = get_statistics(input_data, get_json_list(OUTPUT_JSON))
+    return _json_cache["stats"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Vérification de l'avancement de l'enrichissement.")
+    parser.add_argument("--live", action="store_true", help="Suivi en direct du run (base d'état).")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL, help="Rafraîchissement (secondes).")
+    return parser.parse_args()
+
+
 def main():
     """
     Menu principal de vérification de l'avancement.
     """
+    args = parse_args()
+    if args.live:
+        live_mode(args.interval)
+        return
+
     print("\n" + "="*60)
     print("🔍 VÉRIFICATEUR D'AVANCEMENT - ENRICHISSEMENT DES PLAINTES")
     print("="*60)
-    
-    # Charger les données
-    print("\n[INFO] Chargement des fichiers...")
-    input_data = load_json_list(INPUT_JSON)
-    output_data = load_json_list(OUTPUT_JSON)
-    
-    if not input_data:
-        print(f"[ERREUR] Le fichier d'entrée {INPUT_JSON} est vide ou introuvable.")
-        return
-    
-    print(f"[INFO] Fichier d'entrée : {len(input_data)} plaintes")
-    print(f"[INFO] Fichier de sortie : {len(output_data)} plaintes enrichies")
-    
-    # Calculer les statistiques
-    stats = get_statistics(input_data, output_data)
-    
+
+    if ETAT_DB.exists():
+        print(f"[INFO] Base d'état : {ETAT_DB}")
+    else:
+        print("[INFO] Pas de base d'état : les statistiques seront calculées depuis les fichiers JSON.")
+
     while True:
         print("\n" + "="*60)
         print("MENU")
@@ -200,22 +282,37 @@ def main():
         print("2) Afficher un échantillon des plaintes non traitées")
         print("3) Vérifier l'intégrité du fichier de sortie")
         print("4) Afficher les IDs traités et non traités")
-        print("5) Quitter")
+        print("5) Suivi en direct (débit, ETA, échecs)")
+        print("6) Quitter")
         choix = input("\nVotre choix : ").strip()
 
         if choix == "1":
-            display_statistics(stats)
+            store = EtatStore.open_if_exists(ETAT_DB)
+            if store is not None:
+                try:
+                    display_store_summary(store)
+                finally:
+                    store.close()
+            else:
+                stats = json_statistics()
+                if stats:
+                    display_statistics(stats)
 
         elif choix == "2":
-            display_sample_pending(stats['pending_ids'], input_data, limit=5)
+            stats = json_statistics()
+            if stats:
+                display_sample_pending(stats['pending_ids'], get_json_list(INPUT_JSON), limit=5)
 
         elif choix == "3":
-            if output_data:
-                check_file_integrity(output_data)
+            if OUTPUT_JSON.exists() and OUTPUT_JSON.stat().st_size > 0:
+                check_file_integrity(OUTPUT_JSON)
             else:
                 print("[INFO] Aucune donnée dans le fichier de sortie à vérifier.")
 
         elif choix == "4":
+            stats = json_statistics()
+            if not stats:
+                continue
             print("\n📋 IDs traités :")
             sorted_treated = sorted(stats['treated_ids'])
             if sorted_treated:
@@ -238,13 +335,15 @@ def main():
             print()
 
         elif choix == "5":
+            live_mode()
+
+        elif choix == "6":
             print("\nAu revoir.\n")
             break
 
         else:
-            print("[ERREUR] Choix invalide. Tapez 1, 2, 3, 4 ou 5.")
+            print("[ERREUR] Choix invalide. Tapez 1, 2, 3, 4, 5 ou 6.")
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+Stand-in local du client Gemini (google-genai) pour l'audit de charge.
+
+Expose la même surface que genai.Client pour l'enrichissement :
+    client.models.generate_content(model=..., contents=..., config=...)
+et renvoie une réponse avec .parsed, .text et .usage_metadata.
+
+Modèle de comportement (paramétrable) :
+- latence = base + coût par millier de tokens (entrée + sortie), avec jitter,
+- au-delà de `capacity` requêtes simultanées, une partie des appels est
+  rejetée en 429 RESOURCE_EXHAUSTED,
+- 503 UNAVAILABLE aléatoires,
+- échec de parsing (parsed = None) d'autant plus probable que le batch est gros.
+
+Les erreurs sont levées avec les mêmes libellés que le SDK, ce qui permet
+de réutiliser la même classification (429 / 503) que output_tri_structure.py.
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "projet"))
+from contrat_sortie import EnrichissementMinimal  # noqa: E402
+
+PLAINTES_MARKER = "PLAINTES :\n"
+CHARS_PER_TOKEN = 4
+# Vocabulaire de la médiation de l'éducation, pour les plaintes factices
+# (audit_gemini.py, front/bench_push_to_elastic.py)
+MOTS_DOMAINE = ["élève", "collège", "note", "harcèlement", "bourse", "AESH", "examen", "famille", "inscription"]
+
+
+@dataclass
+class FakeGeminiConfig:
+    base_latency: float = 0.8            # secondes par appel
+    latency_per_1k_tokens: float = 0.12  # secondes par millier de tokens
+    jitter: float = 0.25                 # ± fraction aléatoire de la latence
+    capacity: int = 4                    # appels simultanés tolérés avant des 429
+    overload_reject_rate: float = 0.5    # probabilité de 429 au-delà de la capacité
+    error_503_rate: float = 0.01
+    parse_failure_rate_per_item: float = 0.003
+    time_scale: float = 1.0              # < 1 pour accélérer la simulation
+    seed: Optional[int] = None
+
+
+class FakeGeminiError(Exception):
+    pass
+
+
+def count_plaintes(prompt: str) -> int:
+    """Nombre de plaintes dans un prompt produit par build_batch_prompt."""
+    start = prompt.find(PLAINTES_MARKER)
+    if start < 0:
+        return 1
+    decoder = json.JSONDecoder()
+    try:
+        batch, _ = decoder.raw_decode(prompt, start + len(PLAINTES_MARKER))
+    except json.JSONDecodeError:
+        return 1
+    return len(batch) if isinstance(batch, list) else 1
+
+
+class _FakeModels:
+    def __init__(self, config: FakeGeminiConfig):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+
+    def _random(self) -> float:
+        with self.lock:
+            return self.rng.random()
+
+    def generate_content(self, model: str, contents: str, config=None):
+        cfg = self.config
+        with self.lock:
+            self.in_flight += 1
+            overloaded = self.in_flight > cfg.capacity
+        try:
+            n = count_plaintes(contents)
+            prompt_tokens = len(contents) // CHARS_PER_TOKEN
+            output = [
+                EnrichissementMinimal(label="autre", sous_label="autre", lieu=None, key_word=["stand-in", "charge"])
+                for _ in range(n)
+            ]
+            text = json.dumps([o.model_dump() for o in output], ensure_ascii=False)
+            output_tokens = len(text) // CHARS_PER_TOKEN
+
+            if overloaded and self._random() < cfg.overload_reject_rate:
+                time.sleep(0.05 * cfg.time_scale)
+                raise FakeGeminiError("429 RESOURCE_EXHAUSTED. Please retry in 5s.")
+            if self._random() < cfg.error_503_rate:
+                time.sleep(cfg.base_latency * cfg.time_scale)
+                raise FakeGeminiError("503 UNAVAILABLE. The model is overloaded.")
+
+            latency = cfg.base_latency + cfg.latency_per_1k_tokens * (prompt_tokens + output_tokens) / 1000
+            latency *= 1 + cfg.jitter * (2 * self._random() - 1)
+            time.sleep(latency * cfg.time_scale)
+
+            parse_ok = self._random() >= 1 - (1 - cfg.parse_failure_rate_per_item) ** n
+            return SimpleNamespace(
+                parsed=output if parse_ok else None,
+                text=text if parse_ok else text[: len(text) // 2],
+                usage_metadata=SimpleNamespace(
+                    prompt_token_count=prompt_tokens,
+                    candidates_token_count=output_tokens,
+                    total_token_count=prompt_tokens + output_tokens,
+                ),
+            )
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+class FakeGeminiClient:
+    """Remplaçant de genai.Client (seul client.models.generate_content est implémenté)."""
+
+    def __init__(self, config: Optional[FakeGeminiConfig] = None):
+        self.models = _FakeModels(config or FakeGeminiConfig())
+
@@ -0,0 +1,108 @@
+import streamlit as st
+import altair as alt
+
+from edn1_2_dataviz.app.utils.duckdb_conn import DATA_DIR, get_connection
+from edn1_2_dataviz.app.utils.semantic import dimension_labels, load_semantic
+
+st.set_page_config(page_title="Associations", layout="wide")
+
+# Tables précalculées par etl/associations.py (lues directement, sans jointure)
+ASSOCIATIONS_DIR = DATA_DIR / "parquet" / "associations"
+COOCCURRENCE_PATH = ASSOCIATIONS_DIR / "cooccurrence.parquet"
+DIMENSIONS = ("label", "pole_en_charge")
+SORT_OPTIONS = {"n": "Fréquence", "lift": "Lift", "pmi": "PMI"}
+
+semantic = load_semantic()
+labels = dimension_labels(semantic)
+con = get_connection()
+
+st.title("Associations de mots-clés")
+st.caption(
+    "Co-occurrences et croisements mots-clés × dimensions, précalculés "
+    "(lift = fréquence observée / fréquence attendue si indépendance ; PMI = ln(lift))."
+)
+
+if not COOCCURRENCE_PATH.exists():
+    st.info("Tables absentes : lancer `python -m edn1_2_dataviz.etl.associations`.")
+    st.stop()
+
+
+def _source(path) -> str:
+    return f"read_parquet('{path.as_posix()}')"
+
+
+with st.sidebar:
+    st.header("Configuration")
+    sort_by = st.selectbox("Trier par", options=list(SORT_OPTIONS), format_func=SORT_OPTIONS.get)
+    min_count = st.number_input("Saisines minimum", min_value=1, value=2, step=1)
+    limit = st.number_input("Lignes affichées", min_value=5, max_value=200, value=30, step=5)
+
+tab_cooc, tab_dim = st.tabs(["Co-occurrences", "Mots-clés × dimension"])
+
+with tab_cooc:
+    keywords = [
+        r[0]
+        for r in con.execute(
+            f"SELECT DISTINCT keyword FROM {_source(COOCCURRENCE_PATH)} ORDER BY 1"
+        ).fetchall()
+    ]
+    keyword = st.selectbox("Mot-clé", options=keywords)
+    if keyword:
+        order = "n_pair" if sort_by == "n" else sort_by
+        df = con.execute(
+            f"""
+            SELECT other AS mot_cle_associe, n_pair, n_other, round(lift, 2) AS lift, round(pmi, 3) AS pmi
+            FROM {_source(COOCCURRENCE_PATH)}
+            WHERE keyword = ? AND n_pair >= ?
+            ORDER BY {order} DESC, other
+            LIMIT {int(limit)}
+            """,
+            [keyword, min_count],
+        ).df()
+        if df.empty:
+            st.info("Aucune co-occurrence avec ces paramètres.")
+        else:
+            chart = (
+                alt.Chart(df)
+                .mark_bar()
+                .encode(
+                    x=alt.X(f"{order}:Q", title=SORT_OPTIONS[sort_by]),
+                    y=alt.Y("mot_cle_associe:N", sort="-x", title=None),
+                    tooltip=list(df.columns),
+                )
+            )
+            st.altair_chart(chart, width="stretch")
+            st.dataframe(df, hide_index=True, width="stretch")
+
+with tab_dim:
+    available = [d for d in DIMENSIONS if (ASSOCIATIONS_DIR / f"keyword_{d}.parquet").exists()]
+    dimension = st.selectbox("Dimension", options=available, format_func=lambda x: labels.get(x, x))
+    if dimension:
+        source = _source(ASSOCIATIONS_DIR / f"keyword_{dimension}.parquet")
+        values = [
+            r[0]
+            for r in con.execute(
+                f'SELECT "{dimension}" FROM {source} GROUP BY 1 ORDER BY max(n_value) DESC'
+            ).fetchall()
+        ]
+        value = st.selectbox(labels.get(dimension, dimension), options=values)
+        df = con.execute(
+            f"""
+            SELECT keyword AS mot_cle, n, n_keyword, n_value,
+                   round(n / n_keyword, 3) AS part_du_mot_cle,
+                   round(lift, 2) AS lift, round(pmi, 3) AS pmi
+            FROM {source}
+            WHERE "{dimension}" = ? AND n >= ?
+            ORDER BY {sort_by} DESC, keyword
+            LIMIT {int(limit)}
+            """,
+            [value, min_count],
+        ).df()
+        if df.empty:
+            st.info("Aucun mot-clé associé avec ces paramètres.")
+        else:
+            st.caption(
+                "Mots-clés sur-représentés pour cette valeur : lift > 1 ; "
+                "part_du_mot_cle = part des saisines du mot-clé portant cette valeur."
+            )
+            st.dataframe(df, hide_index=True, width="stretch")
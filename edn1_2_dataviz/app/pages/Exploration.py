@@ -2,7 +2,8 @@ import pandas as pd
 import streamlit as st
 
 from edn1_2_dataviz.app.utils.duckdb_conn import get_connection
-from edn1_2_dataviz.app.utils.filters import date_bounds, distinct_values
+from edn1_2_dataviz.app.utils.filters import date_bounds, distinct_values, search_index_fields
+from edn1_2_dataviz.app.utils.keyword_search import has_keyword_index, suggest_keywords
 from edn1_2_dataviz.app.utils.query_builder import QueryBuilder
 from edn1_2_dataviz.app.utils.semantic import (
     dimension_labels,
@@ -19,7 +20,7 @@ display_conf = semantic.get("display", {})
 max_rows = display_conf.get("max_rows", 2000)
 
 con = get_connection()
-qb = QueryBuilder(text_fields_list)
+qb = QueryBuilder(text_fields_list, search_index_fields(con))
 
 st.title("Exploration des saisines")
 st.caption("Filtres, recherche plein texte, export CSV.")
@@ -43,12 +44,33 @@ with st.sidebar:
         )
         filters[dim] = st.multiselect(labels.get(dim, dim), options)
 
+    if has_keyword_index(con):
+        st.divider()
+        keyword_text = st.text_input(
+            "Rechercher un mot-clé",
+            placeholder="début ou orthographe approchée",
+        )
+        selected_keywords = st.session_state.get("keywords", [])
+        keyword_options = list(
+            dict.fromkeys(selected_keywords + suggest_keywords(con, keyword_text, limit=20))
+        )
+        keywords = st.multiselect("Mots-clés", keyword_options, key="keywords")
+    else:
+        keywords = []
+
     st.divider()
     search_text = st.text_input(
         "Recherche analyse / mots-clés",
         placeholder="mot1 mot2",
+        help=qb.search_help,
     )
     match_all = st.checkbox("Faire correspondre tous les mots", value=False)
+    rank = st.checkbox(
+        "Trier par pertinence (BM25)",
+        value=False,
+        disabled=not qb.indexed_fields,
+        help="Disponible si la base contient l'index de recherche (build_duckdb).",
+    )
 
 query = qb.exploration_query(
     filters=filters,
@@ -56,6 +78,8 @@ query = qb.exploration_query(
     match_all=match_all,
     date_range=date_range if isinstance(date_range, tuple) else None,
     limit=max_rows,
+    rank=rank,
+    keywords=keywords,
 )
 
 df = con.execute(query.sql, query.params).df()
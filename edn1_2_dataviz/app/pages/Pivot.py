@@ -2,7 +2,7 @@ import streamlit as st
 import altair as alt
 
 from edn1_2_dataviz.app.utils.duckdb_conn import get_connection
-from edn1_2_dataviz.app.utils.filters import date_bounds, distinct_values
+from edn1_2_dataviz.app.utils.filters import date_bounds, distinct_values, search_index_fields
 from edn1_2_dataviz.app.utils.query_builder import QueryBuilder
 from edn1_2_dataviz.app.utils.semantic import dimension_labels, load_semantic, text_fields
 
@@ -14,7 +14,7 @@ display_conf = semantic.get("display", {})
 text_fields_list = text_fields(semantic)
 
 con = get_connection()
-qb = QueryBuilder(text_fields_list)
+qb = QueryBuilder(text_fields_list, search_index_fields(con))
 
 st.title("Pivot / Mini builder")
 
@@ -63,7 +63,7 @@ with st.sidebar:
         filters[dim] = st.multiselect(labels.get(dim, dim), options)
 
     st.divider()
-    search_text = st.text_input("Recherche analyse / mots-clés", placeholder="mot1 mot2")
+    search_text = st.text_input("Recherche analyse / mots-clés", placeholder="mot1 mot2", help=qb.search_help)
     match_all = st.checkbox("Faire correspondre tous les mots", value=False)
 
 query = qb.pivot_query(
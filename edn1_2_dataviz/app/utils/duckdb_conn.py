@@ -5,22 +5,43 @@ from functools import lru_cache
 from pathlib import Path
 
 import duckdb
-import streamlit as st
 
-DEFAULT_DB_PATH = Path(__file__).resolve().parents[2] / "data" / "edn1.duckdb"
+DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+# Versions publiées par etl/build_duckdb.py ; CURRENT contient le nom de la courante
+DEFAULT_DB_DIR = DATA_DIR / "duckdb"
+POINTER_NAME = "CURRENT"
+# Base unique des builds antérieures au versionnage
+LEGACY_DB_PATH = DATA_DIR / "edn1.duckdb"
 
 
-@lru_cache
+def resolve_db_path() -> Path:
+    """
+    Base à ouvrir : EDN1_DUCKDB_PATH (fichier, ou répertoire de versions),
+    sinon la version désignée par data/duckdb/CURRENT, sinon la base historique.
+    """
+    db_env = os.getenv("EDN1_DUCKDB_PATH")
+    if db_env and not Path(db_env).is_dir():
+        return Path(db_env)
+    db_dir = Path(db_env) if db_env else DEFAULT_DB_DIR
+    pointer = db_dir / POINTER_NAME
+    if pointer.exists():
+        return db_dir / pointer.read_text(encoding="utf-8").strip()
+    return LEGACY_DB_PATH
+
+
+@lru_cache(maxsize=1)
 def _open_connection(db_path: Path) -> duckdb.DuckDBPyConnection:
-    con = duckdb.connect(str(db_path))
+    # Lecture seule : une build n'écrit jamais dans une version publiée
+    con = duckdb.connect(str(db_path), read_only=True)
     con.execute("PRAGMA threads=4")
     return con
 
 
-@st.cache_resource(show_spinner=False)
 def get_connection() -> duckdb.DuckDBPyConnection:
-    """Retourne une connexion DuckDB partagée (cache Streamlit)."""
-    db_env = os.getenv("EDN1_DUCKDB_PATH")
-    path = Path(db_env) if db_env else DEFAULT_DB_PATH
-    return _open_connection(path)
-
+    """
+    Retourne la connexion DuckDB partagée sur la version publiée. Le pointeur
+    est relu à chaque appel (à chaque exécution de page) : après une build,
+    la connexion bascule sur la nouvelle version ; l'ancienne est libérée
+    quand plus aucune requête ne la référence.
+    """
+    return _open_connection(resolve_db_path())
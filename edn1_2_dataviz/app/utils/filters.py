@@ -77,3 +77,11 @@ def date_bounds(con: duckdb.DuckDBPyConnection) -> Tuple:
     ).fetchone()
     return res if res else (None, None)
 
+
+def search_index_fields(con: duckdb.DuckDBPyConnection) -> List[str]:
+    """Champs couverts par l'index de recherche (vide si la base n'en a pas)."""
+    try:
+        rows = con.execute("SELECT field FROM search_stats ORDER BY field").fetchall()
+    except duckdb.CatalogException:
+        return []
+    return [r[0] for r in rows]
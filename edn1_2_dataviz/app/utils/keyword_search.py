@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from typing import List, Set, Tuple
+
+import duckdb
+
+from edn1_2_dataviz.app.utils.query_builder import fold
+
+# Index construit par etl/build_duckdb.create_keyword_index
+# (tables keyword_dict, keyword_trigrams) ; même bordure que TRIGRAM_PADDING.
+_PAD_LEFT, _PAD_RIGHT = "  ", " "
+# Similarité (Jaccard sur les trigrammes) minimale d'une correspondance approchée
+MIN_SIMILARITY = 0.3
+# Borne haute d'un intervalle de préfixe (plus grand point de code)
+_MAX_CHAR = "\U0010ffff"
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrammes distincts de la forme repliée (accents retirés, minuscules)."""
+    padded = f"{_PAD_LEFT}{fold(text).strip()}{_PAD_RIGHT}"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def has_keyword_index(con: duckdb.DuckDBPyConnection) -> bool:
+    try:
+        con.execute("SELECT 1 FROM keyword_dict LIMIT 0")
+    except duckdb.CatalogException:
+        return False
+    return True
+
+
+def complete_keywords(
+    con: duckdb.DuckDBPyConnection, prefix: str, limit: int = 10
+) -> List[Tuple[str, int]]:
+    """Mots-clés commençant par `prefix` (accents/casse ignorés), les plus fréquents d'abord."""
+    folded = fold(prefix).strip()
+    if not folded:
+        return []
+    return con.execute(
+        """
+        SELECT keyword, n_docs FROM keyword_dict
+        WHERE folded >= ? AND folded < ?
+        ORDER BY n_docs DESC, keyword
+        LIMIT ?
+        """,
+        [folded, folded + _MAX_CHAR, limit],
+    ).fetchall()
+
+
+def fuzzy_keywords(
+    con: duckdb.DuckDBPyConnection,
+    text: str,
+    limit: int = 10,
+    min_similarity: float = MIN_SIMILARITY,
+) -> List[Tuple[str, int, float]]:
+    """
+    Mots-clés proches de `text` (fautes de frappe, variantes d'orthographe) :
+    similarité de Jaccard entre ensembles de trigrammes, calculée sur les
+    seuls mots-clés partageant au moins un trigramme.
+    """
+    if not fold(text).strip():
+        return []
+    grams = sorted(trigrams(text))
+    placeholders = ", ".join(["?"] * len(grams))
+    return con.execute(
+        f"""
+        WITH postings AS (
+            SELECT unnest(keyword_ids) AS keyword_id, unnest(n_trigrams) AS n_trigrams
+            FROM keyword_trigrams
+            WHERE trigram IN ({placeholders})
+        ),
+        scored AS (
+            SELECT keyword_id, count(*) / (any_value(n_trigrams) + ? - count(*)) AS similarity
+            FROM postings
+            GROUP BY keyword_id
+            HAVING similarity >= ?
+            ORDER BY similarity DESC, keyword_id
+            LIMIT ?
+        )
+        SELECT d.keyword, d.n_docs, round(s.similarity, 3) AS similarity
+        FROM scored AS s
+        JOIN keyword_dict AS d USING (keyword_id)
+        ORDER BY s.similarity DESC, d.n_docs DESC, d.keyword
+        """,
+        [*grams, len(grams), min_similarity, limit],
+    ).fetchall()
+
+
+def suggest_keywords(con: duckdb.DuckDBPyConnection, text: str, limit: int = 10) -> List[str]:
+    """Suggestions : complétions par préfixe, complétées par les correspondances approchées."""
+    suggestions = [kw for kw, _ in complete_keywords(con, text, limit)]
+    if len(suggestions) < limit:
+        for kw, _, _ in fuzzy_keywords(con, text, limit):
+            if kw not in suggestions:
+                suggestions.append(kw)
+    return suggestions[:limit]
@@ -1,28 +1,122 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+import re
+import unicodedata
+from typing import Dict, List, Sequence, Tuple
+
+
+# Index inversé construit par etl/build_duckdb.create_search_index
+# (tables search_tokens, search_doclen, search_stats).
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Paramètres BM25 usuels
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Aide du champ de recherche : avec l'index, un mot ne correspond qu'au
+# début d'un mot du texte (pas au milieu, contrairement à ILIKE)
+SEARCH_HELP_INDEXED = (
+    "Chaque mot cherche les mots du texte qui commencent par lui (accents et "
+    "casse ignorés) : « factur » trouve « facturation », « turation » ne le "
+    "trouve pas."
+)
+SEARCH_HELP_PLAIN = "Chaque mot est cherché n'importe où dans le texte (ILIKE, casse ignorée)."
+
+
+def fold(text: str) -> str:
+    """Accents retirés puis minuscules (équivalent de lower(strip_accents(...)))."""
+    return "".join(
+        c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c)
+    ).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Même tokenisation que l'index : accents retirés, minuscules, [a-z0-9]+."""
+    return _TOKEN_RE.findall(fold(text))
+
+
+def _token_range(token: str) -> List[str]:
+    # Préfixe en intervalle [token, token + "{"[ ("{" suit "z" en ASCII) :
+    # filtre de comparaison qui profite du tri de search_tokens
+    return [token, token + "{"]
+
+
+def _index_match_sql(indexed: List[str]) -> str:
+    fields = ", ".join(f"'{f}'" for f in indexed)
+    return f"SELECT id FROM search_tokens WHERE field IN ({fields}) AND token >= ? AND token < ?"
 
 
 def _build_search_clause(
-    search_text: str, match_all: bool, fields: List[str]
+    search_text: str,
+    match_all: bool,
+    fields: List[str],
+    indexed_fields: Sequence[str] = (),
 ) -> Tuple[str, List[str]]:
+    """
+    Clause de recherche plein texte. Chaque mot est cherché par préfixe de
+    token via des semi-jointures sur l'index pour les champs indexés (tous
+    les tokens du mot doivent correspondre), et par ILIKE sur les autres
+    champs ou si le mot ne contient aucun token. Un mot indexé ne trouve donc
+    pas une sous-chaîne au milieu d'un token (SEARCH_HELP_INDEXED).
+    """
     words = [w for w in search_text.strip().split() if w]
     if not words:
         return "", []
 
+    indexed = [f for f in fields if f in indexed_fields]
     clauses = []
     params: List[str] = []
     for word in words:
-        sub = " OR ".join([f"{field} ILIKE ?" for field in fields])
-        clauses.append(f"({sub})")
-        like_value = f"%{word}%"
-        params.extend([like_value] * len(fields))
+        tokens = tokenize(word) if indexed else []
+        scan_fields = [f for f in fields if f not in indexed] if tokens else fields
+        sub = []
+        if tokens:
+            sub.append(
+                "(" + " AND ".join(f"id IN ({_index_match_sql(indexed)})" for _ in tokens) + ")"
+            )
+            for token in tokens:
+                params.extend(_token_range(token))
+        # Noms entre guillemets : "analyse" est un mot réservé de DuckDB
+        sub.extend(f'"{field}" ILIKE ?' for field in scan_fields)
+        params.extend([f"%{word}%"] * len(scan_fields))
+        clauses.append(f"({' OR '.join(sub)})")
 
     joiner = " AND " if match_all else " OR "
     return f"({joiner.join(clauses)})", params
 
 
+def _build_bm25_scores(
+    search_text: str, fields: List[str], indexed_fields: Sequence[str]
+) -> Tuple[str, List[str]]:
+    """
+    Requête (id, score) : score BM25 des documents sur les tokens recherchés
+    (correspondance par préfixe, df calculé sur les occurrences retenues).
+    """
+    indexed = [f for f in fields if f in indexed_fields]
+    tokens = list(dict.fromkeys(t for w in search_text.split() for t in tokenize(w)))
+    if not indexed or not tokens:
+        return "", []
+
+    field_list = ", ".join(f"'{f}'" for f in indexed)
+    ranges = " OR ".join(["(token >= ? AND token < ?)"] * len(tokens))
+    params = [p for token in tokens for p in _token_range(token)]
+    sql = f"""
+        SELECT m.id, sum(
+            ln((s.n_docs - m.df + 0.5) / (m.df + 0.5) + 1)
+            * m.tf * {BM25_K1 + 1}
+            / (m.tf + {BM25_K1} * (1 - {BM25_B} + {BM25_B} * d.doclen / s.avgdl))
+        ) AS score
+        FROM (
+            SELECT token, id, field, tf, count(*) OVER (PARTITION BY field, token) AS df
+            FROM search_tokens
+            WHERE field IN ({field_list}) AND ({ranges})
+        ) AS m
+        JOIN search_doclen AS d USING (id, field)
+        JOIN search_stats AS s USING (field)
+        GROUP BY m.id
+    """
+    return sql, params
+
+
 def _build_filter_clause(filters: Dict[str, List]) -> Tuple[str, List]:
     clauses: List[str] = []
     params: List = []
@@ -37,6 +131,14 @@ def _build_filter_clause(filters: Dict[str, List]) -> Tuple[str, List]:
     return "", []
 
 
+def _build_keyword_clause(keywords: List[str] | None) -> Tuple[str, List]:
+    """Saisines portant au moins un des mots-clés (semi-jointure sur v_keywords)."""
+    if not keywords:
+        return "", []
+    placeholders = ", ".join(["?"] * len(keywords))
+    return f"id IN (SELECT id FROM v_keywords WHERE keyword IN ({placeholders}))", list(keywords)
+
+
 def _build_date_clause(date_range) -> Tuple[str, List]:
     if not date_range:
         return "", []
@@ -57,10 +159,22 @@ class Query:
 
 
 class QueryBuilder:
-    """Construit des requêtes SQL DuckDB paramétrées."""
+    """
+    Construit des requêtes SQL DuckDB paramétrées.
+
+    `indexed_fields` : champs texte couverts par l'index de recherche de la
+    base ouverte (voir filters.search_index_fields) ; vide, la recherche se
+    fait par ILIKE.
+    """
 
-    def __init__(self, text_fields: List[str]) -> None:
+    def __init__(self, text_fields: List[str], indexed_fields: Sequence[str] = ()) -> None:
         self.text_fields = text_fields
+        self.indexed_fields = tuple(indexed_fields)
+
+    @property
+    def search_help(self) -> str:
+        """Aide du champ de recherche, selon que la base a un index ou non."""
+        return SEARCH_HELP_INDEXED if self.indexed_fields else SEARCH_HELP_PLAIN
 
     def exploration_query(
         self,
@@ -69,7 +183,13 @@ class QueryBuilder:
         match_all: bool,
         date_range=None,
         limit: int = 2000,
+        rank: bool = False,
+        keywords: List[str] | None = None,
     ) -> Query:
+        """
+        `rank` : tri par pertinence BM25 (si la recherche porte sur l'index) ;
+        `keywords` : saisines portant au moins un de ces mots-clés.
+        """
         clauses: List[str] = []
         params: List = []
 
@@ -78,24 +198,48 @@ class QueryBuilder:
             clauses.append(filter_clause)
             params.extend(filter_params)
 
+        keyword_clause, keyword_params = _build_keyword_clause(keywords)
+        if keyword_clause:
+            clauses.append(keyword_clause)
+            params.extend(keyword_params)
+
         date_clause, date_params = _build_date_clause(date_range)
         if date_clause:
             clauses.append(date_clause)
             params.extend(date_params)
 
         search_clause, search_params = _build_search_clause(
-            search_text, match_all, self.text_fields
+            search_text, match_all, self.text_fields, self.indexed_fields
         )
         if search_clause:
             clauses.append(search_clause)
             params.extend(search_params)
 
         where = " WHERE " + " AND ".join(clauses) if clauses else ""
+        order = "coalesce(date_arrivee, date_cloture) DESC NULLS LAST, id"
+
+        scores_sql, scores_params = (
+            _build_bm25_scores(search_text, self.text_fields, self.indexed_fields)
+            if rank
+            else ("", [])
+        )
+        if scores_sql:
+            sql = f"""
+            WITH scores AS ({scores_sql})
+            SELECT v.*, round(coalesce(scores.score, 0), 3) AS score
+            FROM v_saisines AS v
+            LEFT JOIN scores USING (id)
+            {where}
+            ORDER BY score DESC, {order}
+            LIMIT {limit}
+            """
+            return Query(sql=sql, params=scores_params + params)
+
         sql = f"""
         SELECT *
         FROM v_saisines
         {where}
-        ORDER BY coalesce(date_arrivee, date_cloture) DESC NULLS LAST, id
+        ORDER BY {order}
         LIMIT {limit}
         """
         return Query(sql=sql, params=params)
@@ -127,7 +271,7 @@ class QueryBuilder:
             params.extend(date_params)
 
         search_clause, search_params = _build_search_clause(
-            search_text, match_all, self.text_fields
+            search_text, match_all, self.text_fields, self.indexed_fields
         )
         if search_clause:
             clauses.append(search_clause)
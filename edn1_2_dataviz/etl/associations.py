@@ -0,0 +1,161 @@
+"""
+Tables d'associations précalculées entre mots-clés et dimensions, écrites
+en Parquet compact dans parquet/associations/ et lues telles quelles par la
+page Associations (aucune jointure à la requête).
+
+- cooccurrence.parquet : paires de mots-clés apparaissant dans une même
+  saisine (keyword, other, n_pair, n_keyword, n_other, lift, pmi), les
+  TOP_K paires les plus fréquentes par mot-clé, dans les deux sens ;
+- keyword_<dimension>.parquet (label, pole_en_charge) : saisines portant
+  le mot-clé par valeur de la dimension (keyword, <dimension>, n,
+  n_keyword, n_value, lift, pmi).
+
+lift = n * N / (n_a * n_b) et pmi = ln(lift), N étant le nombre de
+saisines. Les mots-clés, paires et croisements vus dans moins de
+MIN_SUPPORT saisines sont ignorés (scores instables, tables creuses).
+
+Usage:
+    python -m edn1_2_dataviz.etl.associations [--top-k N] [--min-support N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from pathlib import Path
+from typing import Dict
+
+import duckdb
+
+from . import dataset
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+ASSOCIATIONS_DIR = "associations"
+COOCCURRENCE_FILE = "cooccurrence.parquet"
+# Dimensions croisées avec les mots-clés (fichier keyword_<dimension>.parquet)
+ASSOCIATION_DIMENSIONS = ("label", "pole_en_charge")
+TOP_K = 50
+MIN_SUPPORT = 2
+
+
+def associations_dir(parquet_dir: Path) -> Path:
+    return parquet_dir / ASSOCIATIONS_DIR
+
+
+def dimension_file(dimension: str) -> str:
+    return f"keyword_{dimension}.parquet"
+
+
+def cooccurrence_sql(top_k: int = TOP_K, min_support: int = MIN_SUPPORT) -> str:
+    """
+    Paires de mots-clés (tables temporaires kw et kw_counts). Seuls les
+    mots-clés fréquents entrent dans l'auto-jointure, dont le coût croît avec
+    le carré du nombre de mots-clés par saisine.
+    """
+    return f"""
+        WITH frequent AS (
+            SELECT kw.id, kw.keyword FROM kw JOIN kw_counts USING (keyword)
+        ),
+        pairs AS (
+            SELECT a.keyword, b.keyword AS other, count(*) AS n_pair
+            FROM frequent AS a JOIN frequent AS b ON a.id = b.id AND a.keyword < b.keyword
+            GROUP BY ALL
+            HAVING count(*) >= {min_support}
+        ),
+        both_ways AS (
+            SELECT keyword, other, n_pair FROM pairs
+            UNION ALL
+            SELECT other, keyword, n_pair FROM pairs
+        )
+        SELECT p.keyword, p.other, p.n_pair, ca.n AS n_keyword, cb.n AS n_other,
+               p.n_pair * n_total.n / (ca.n * cb.n) AS lift,
+               ln(p.n_pair * n_total.n / (ca.n * cb.n)) AS pmi
+        FROM both_ways AS p
+        JOIN kw_counts AS ca ON ca.keyword = p.keyword
+        JOIN kw_counts AS cb ON cb.keyword = p.other
+        CROSS JOIN n_total
+        QUALIFY row_number() OVER (PARTITION BY p.keyword ORDER BY p.n_pair DESC, lift DESC, p.other) <= {top_k}
+        ORDER BY p.keyword, p.n_pair DESC, lift DESC
+    """
+
+
+def dimension_sql(dimension: str, min_support: int = MIN_SUPPORT) -> str:
+    """Croisement mot-clé × valeur de dimension (tables temporaires kw, kw_counts, docs)."""
+    return f"""
+        WITH values_count AS (
+            SELECT "{dimension}" AS value, count(*) AS n FROM docs
+            WHERE "{dimension}" IS NOT NULL GROUP BY 1
+        ),
+        crossed AS (
+            SELECT kw.keyword, d."{dimension}" AS value, count(*) AS n
+            FROM kw JOIN kw_counts USING (keyword) JOIN docs AS d USING (id)
+            WHERE d."{dimension}" IS NOT NULL
+            GROUP BY ALL
+            HAVING count(*) >= {min_support}
+        )
+        SELECT c.keyword, c.value AS "{dimension}", c.n, k.n AS n_keyword, v.n AS n_value,
+               c.n * n_total.n / (k.n * v.n) AS lift,
+               ln(c.n * n_total.n / (k.n * v.n)) AS pmi
+        FROM crossed AS c
+        JOIN kw_counts AS k USING (keyword)
+        JOIN values_count AS v USING (value)
+        CROSS JOIN n_total
+        ORDER BY c.keyword, c.n DESC
+    """
+
+
+def _write(con: duckdb.DuckDBPyConnection, query: str, path: Path) -> int:
+    """Écriture atomique (fichier temporaire puis remplacement)."""
+    tmp = path.with_name(path.name + ".tmp")
+    con.execute(f"COPY ({query}) TO '{tmp.as_posix()}' ({dataset.PARQUET_OPTIONS})")
+    os.replace(tmp, path)
+    return con.execute(f"SELECT count(*) FROM read_parquet('{path.as_posix()}')").fetchone()[0]
+
+
+def run(
+    parquet_dir: Path | None = None, top_k: int = TOP_K, min_support: int = MIN_SUPPORT
+) -> Dict[str, int]:
+    """Calcule et écrit les tables d'associations ; retourne le nombre de lignes par fichier."""
+    parquet_dir = parquet_dir or Path(__file__).resolve().parents[1] / "data" / "parquet"
+    out_dir = associations_dir(parquet_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    con = duckdb.connect(":memory:")
+    columns = ", ".join(f'"{d}"' for d in ASSOCIATION_DIMENSIONS)
+    con.execute(f"CREATE TEMP TABLE docs AS SELECT id, {columns} FROM ({dataset.saisines_sql(parquet_dir)})")
+    con.execute(f"CREATE TEMP TABLE kw AS {dataset.keywords_sql(parquet_dir)}")
+    con.execute("CREATE TEMP TABLE n_total AS SELECT count(*)::DOUBLE AS n FROM docs")
+    con.execute(
+        f"CREATE TEMP TABLE kw_counts AS SELECT keyword, count(*) AS n FROM kw "
+        f"GROUP BY keyword HAVING count(*) >= {min_support}"
+    )
+
+    counts = {COOCCURRENCE_FILE: _write(con, cooccurrence_sql(top_k, min_support), out_dir / COOCCURRENCE_FILE)}
+    for dimension in ASSOCIATION_DIMENSIONS:
+        name = dimension_file(dimension)
+        counts[name] = _write(con, dimension_sql(dimension, min_support), out_dir / name)
+    con.close()
+    logger.info(
+        "Associations écrites dans %s: %s",
+        out_dir,
+        ", ".join(f"{name} ({n} lignes)" for name, n in counts.items()),
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tables d'associations mots-clés (co-occurrences, croisements).")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="Paires conservées par mot-clé.")
+    parser.add_argument("--min-support", type=int, default=MIN_SUPPORT, help="Saisines minimum par paire/croisement.")
+    args = parser.parse_args()
+    run(top_k=args.top_k, min_support=args.min_support)
+
+
+if __name__ == "__main__":
+    main()
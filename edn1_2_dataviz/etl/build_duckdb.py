@@ -1,65 +1,256 @@
 """
-Construit/actualise la base DuckDB locale à partir des Parquet générés.
+Construit une nouvelle version de la base DuckDB locale à partir des Parquet
+générés, puis la publie atomiquement.
+
+Chaque build écrit un fichier neuf `data/duckdb/edn1-<horodatage>.duckdb`
+contenant des tables natives matérialisées (saisines triées par
+date_arrivee, keywords par keyword), l'index de recherche plein texte
+(search_tokens, search_doclen, search_stats), le dictionnaire des mots-clés
+(keyword_dict, keyword_trigrams) et les vues
+v_saisines/v_keywords attendues par l'app. Le fichier pointeur
+`data/duckdb/CURRENT` (nom de la version courante) est remplacé par
+os.replace une fois la base fermée : un lecteur voit l'ancienne ou la
+nouvelle version, jamais une base en cours d'écriture. Les versions les plus anciennes sont ensuite supprimées
+(KEEP_VERSIONS conservées, dont la courante).
 
 Usage:
-    python -m edn1_2_dataviz.etl.build_duckdb
+    python -m edn1_2_dataviz.etl.build_duckdb [--keep N]
 """
 
 from __future__ import annotations
 
+import argparse
+import datetime as dt
 import logging
+import os
 from pathlib import Path
+from typing import List
 
 import duckdb
 
+from . import dataset
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(name)s - %(message)s",
 )
 logger = logging.getLogger(__name__)
 
+POINTER_NAME = "CURRENT"
+VERSION_PREFIX = "edn1-"
+VERSION_SUFFIX = ".duckdb"
+# Versions conservées après publication (la courante + la précédente, encore
+# ouverte par les sessions qui n'ont pas relu le pointeur)
+KEEP_VERSIONS = 2
+
+# Champs texte indexés pour la recherche plein texte (voir create_search_index)
+SEARCH_FIELDS = ("analyse", "key_word_str")
+# Tokenisation : accents retirés, minuscules, découpage sur tout caractère
+# hors [a-z0-9]. Doit rester identique à app/utils/query_builder.tokenize.
+TOKEN_SPLIT = "[^a-z0-9]+"
+# Trigrammes des mots-clés : forme repliée bordée de deux espaces à gauche
+# et d'un à droite (comme pg_trgm). Doit rester identique à
+# app/utils/keyword_search.trigrams.
+TRIGRAM_PADDING = ("  ", " ")
+
+
+def pointer_path(db_dir: Path) -> Path:
+    return db_dir / POINTER_NAME
 
-def create_views(con: duckdb.DuckDBPyConnection, parquet_dir: Path) -> None:
-    main_path = parquet_dir / "saisines.parquet"
-    kw_path = parquet_dir / "keywords.parquet"
 
-    if not main_path.exists():
-        raise FileNotFoundError(f"Parquet principal manquant: {main_path}")
+def current_version(db_dir: Path) -> Path | None:
+    """Base publiée désignée par le pointeur, ou None si aucune build."""
+    pointer = pointer_path(db_dir)
+    if not pointer.exists():
+        return None
+    path = db_dir / pointer.read_text(encoding="utf-8").strip()
+    return path if path.exists() else None
 
+
+def versions(db_dir: Path) -> List[Path]:
+    """Versions publiables présentes, de la plus ancienne à la plus récente."""
+    if not db_dir.exists():
+        return []
+    return sorted(db_dir.glob(f"{VERSION_PREFIX}*{VERSION_SUFFIX}"))
+
+
+def create_tables(con: duckdb.DuckDBPyConnection, parquet_dir: Path) -> None:
+    """
+    Tables natives matérialisées depuis le dataset, stockées triées : les
+    zone maps de DuckDB élaguent les row groups hors de la plage de dates
+    (saisines) ou du mot-clé filtré (keywords). Les vues v_saisines et
+    v_keywords pointent sur ces tables.
+    """
     con.execute(
-        f"CREATE OR REPLACE VIEW v_saisines AS SELECT * FROM read_parquet('{main_path.as_posix()}')"
+        f"CREATE TABLE saisines AS SELECT * FROM ({dataset.saisines_sql(parquet_dir)}) "
+        f"ORDER BY {dataset.SAISINES_ORDER}"
     )
+    con.execute(
+        f"CREATE TABLE keywords AS SELECT * FROM ({dataset.keywords_sql(parquet_dir)}) "
+        f"ORDER BY {dataset.KEYWORDS_ORDER}"
+    )
+    con.execute("CREATE VIEW v_saisines AS SELECT * FROM saisines")
+    con.execute("CREATE VIEW v_keywords AS SELECT * FROM keywords")
+    logger.info("Tables DuckDB matérialisées.")
+
 
-    if kw_path.exists():
-        con.execute(
-            f"CREATE OR REPLACE VIEW v_keywords AS SELECT * FROM read_parquet('{kw_path.as_posix()}')"
+def create_search_index(con: duckdb.DuckDBPyConnection, fields=SEARCH_FIELDS) -> None:
+    """
+    Index inversé sur les champs texte de la table saisines :
+
+    - search_tokens(token, id, field, tf) : occurrences par token, trié par
+      token (les recherches par préfixe ne lisent que les row groups utiles) ;
+    - search_doclen(id, field, doclen) : nombre de tokens par document ;
+    - search_stats(field, n_docs, avgdl) : statistiques pour le score BM25.
+    """
+    docs = " UNION ALL ".join(
+        f"SELECT id, '{field}' AS field, \"{field}\" AS text FROM saisines WHERE \"{field}\" IS NOT NULL"
+        for field in fields
+    )
+    con.execute(
+        f"""
+        CREATE TABLE search_tokens AS
+        WITH tokens AS (
+            SELECT id, field, unnest(regexp_split_to_array(lower(strip_accents(text)), '{TOKEN_SPLIT}')) AS token
+            FROM ({docs})
         )
-    else:
-        con.execute(
-            "CREATE OR REPLACE VIEW v_keywords AS "
-            "SELECT NULL::BIGINT AS id, NULL::VARCHAR AS keyword WHERE FALSE"
+        SELECT token, id, field, CAST(count(*) AS INTEGER) AS tf
+        FROM tokens
+        WHERE token <> ''
+        GROUP BY ALL
+        ORDER BY token, id
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE search_doclen AS
+        SELECT id, field, CAST(sum(tf) AS INTEGER) AS doclen
+        FROM search_tokens GROUP BY ALL ORDER BY id
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE search_stats AS
+        SELECT field, count(*) AS n_docs, avg(doclen) AS avgdl
+        FROM search_doclen GROUP BY field
+        """
+    )
+    logger.info("Index de recherche construit (%s).", ", ".join(fields))
+
+
+def create_keyword_index(con: duckdb.DuckDBPyConnection) -> None:
+    """
+    Dictionnaire des mots-clés et index de recherche approchée :
+
+    - keyword_dict(keyword_id, keyword, folded, n_docs, n_trigrams) : un
+      identifiant entier par mot-clé, trié par forme repliée (sans accents,
+      minuscules) pour l'autocomplétion par préfixe ;
+    - keyword_trigrams(trigram, keyword_ids, n_trigrams) : liste des
+      mots-clés (et de leur nombre de trigrammes) par trigramme de forme
+      repliée, pour la similarité (Jaccard). Une ligne par trigramme : une
+      recherche ne lit que quelques listes au lieu d'une ligne par
+      occurrence.
+    """
+    left, right = TRIGRAM_PADDING
+    padded = f"('{left}' || folded || '{right}')"
+    trigram_list = f"list_distinct(list_transform(range(1, length({padded}) - 1), i -> substr({padded}, i, 3)))"
+    con.execute(
+        f"""
+        CREATE TABLE keyword_dict AS
+        WITH kw AS (
+            SELECT keyword, lower(strip_accents(keyword)) AS folded, count(DISTINCT id) AS n_docs
+            FROM keywords GROUP BY keyword
+        )
+        SELECT CAST(row_number() OVER (ORDER BY folded, keyword) AS INTEGER) AS keyword_id,
+               keyword, folded, n_docs,
+               CAST(len({trigram_list}) AS INTEGER) AS n_trigrams
+        FROM kw
+        ORDER BY folded, keyword
+        """
+    )
+    con.execute(
+        f"""
+        CREATE TABLE keyword_trigrams AS
+        WITH grams AS (
+            SELECT unnest({trigram_list}) AS trigram, keyword_id, n_trigrams FROM keyword_dict
         )
-    logger.info("Vues DuckDB créées/rafraîchies.")
+        SELECT trigram,
+               list(keyword_id ORDER BY keyword_id) AS keyword_ids,
+               list(n_trigrams ORDER BY keyword_id) AS n_trigrams
+        FROM grams
+        GROUP BY trigram
+        ORDER BY trigram
+        """
+    )
+    n = con.execute("SELECT count(*) FROM keyword_dict").fetchone()[0]
+    logger.info("Dictionnaire des mots-clés construit (%d mots-clés).", n)
+
+
+def publish(db_dir: Path, version: Path) -> None:
+    """Bascule atomique du pointeur vers `version`."""
+    pointer = pointer_path(db_dir)
+    tmp = pointer.with_name(pointer.name + ".tmp")
+    tmp.write_text(version.name + "\n", encoding="utf-8")
+    os.replace(tmp, pointer)
 
 
-def run(db_path: Path | None = None, parquet_dir: Path | None = None) -> None:
+def gc_versions(db_dir: Path, keep: int = KEEP_VERSIONS) -> List[Path]:
+    """
+    Supprime les versions au-delà des `keep` plus récentes (jamais la
+    courante) et les builds interrompues. Un fichier encore ouvert par un
+    lecteur (Windows) est laissé en place pour le prochain passage.
+    """
+    current = current_version(db_dir)
+    stale = [p for p in versions(db_dir)[: -max(keep, 1)] if p != current]
+    stale += list(db_dir.glob(f".{VERSION_PREFIX}*.tmp"))
+    removed = []
+    for path in stale:
+        try:
+            path.unlink()
+            path.with_name(path.name + ".wal").unlink(missing_ok=True)
+            removed.append(path)
+        except OSError as exc:
+            logger.warning("Version non supprimée (%s): %s", path.name, exc)
+    if removed:
+        logger.info("%d ancienne(s) version(s) supprimée(s).", len(removed))
+    return removed
+
+
+def run(db_dir: Path | None = None, parquet_dir: Path | None = None, keep: int = KEEP_VERSIONS) -> Path:
+    """Construit, publie et retourne la nouvelle version de la base."""
     base = Path(__file__).resolve().parents[1]
-    db_path = db_path or base / "data" / "edn1.duckdb"
+    db_dir = db_dir or base / "data" / "duckdb"
     parquet_dir = parquet_dir or base / "data" / "parquet"
     parquet_dir.mkdir(parents=True, exist_ok=True)
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+    db_dir.mkdir(parents=True, exist_ok=True)
 
-    con = duckdb.connect(str(db_path))
-    con.execute("PRAGMA threads=4")
-    create_views(con, parquet_dir)
-    con.close()
-    logger.info("Base DuckDB prête: %s", db_path)
+    dataset.migrate_legacy(parquet_dir)
+    stamp = dt.datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    version = db_dir / f"{VERSION_PREFIX}{stamp}{VERSION_SUFFIX}"
+    tmp = db_dir / f".{version.name}.tmp"
+
+    con = duckdb.connect(str(tmp))
+    try:
+        con.execute("PRAGMA threads=4")
+        create_tables(con, parquet_dir)
+        create_search_index(con)
+        create_keyword_index(con)
+        con.execute("CHECKPOINT")
+    finally:
+        con.close()
+    os.replace(tmp, version)
+    publish(db_dir, version)
+    logger.info("Base DuckDB publiée: %s", version)
+    gc_versions(db_dir, keep)
+    return version
 
 
 def main():
-    run()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keep", type=int, default=KEEP_VERSIONS, help="Versions conservées (défaut: %(default)s)")
+    args = parser.parse_args()
+    run(keep=args.keep)
 
 
 if __name__ == "__main__":
     main()
-
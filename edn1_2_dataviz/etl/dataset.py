@@ -0,0 +1,304 @@
+"""
+Dataset Parquet partitionné (Hive annee=/mois=) en ajout seul, avec
+fusion à la lecture et compaction des partitions touchées.
+
+Arborescence :
+    parquet/saisines/annee=2022/mois=1/delta-0000000003-0.parquet
+    parquet/saisines/annee=2022/mois=1/base-0000000002.parquet
+    parquet/keywords/annee=2022/mois=1/...
+
+- Chaque ingestion écrit des fragments `delta-<seq>` (une ligne par id,
+  colonne `_seq` = numéro d'ingestion, reprise par ses mots-clés) : le coût
+  ne dépend que du delta.
+- Les lecteurs passent par saisines_sql()/keywords_sql() : la version
+  retenue pour un id est la plus récente (date, puis `_seq`), comme la
+  déduplication historique ; ses mots-clés sont ceux de cette version.
+- compact() réécrit une partition (fragments -> un `base-<seq>`) en n'y
+  gardant que la dernière version de chaque id et ses mots-clés ;
+  `full=True` retire aussi les versions supplantées par une ligne d'une
+  autre partition.
+
+Usage (compaction périodique) :
+    python -m edn1_2_dataviz.etl.dataset [--full] [--min-fragments N]
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Iterable, List, Tuple
+
+import duckdb
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+SAISINES_DIR = "saisines"
+KEYWORDS_DIR = "keywords"
+# Nombre de fragments d'une partition au-delà duquel l'ingestion la compacte
+COMPACTION_MIN_FRAGMENTS = 8
+
+# Disposition Parquet : zstd ; row groups courts (les fragments sont triés
+# par date, d'où un élagage fin sur les filtres de date et de point) ; un
+# dictionnaire par row group jusqu'à ROW_GROUP_SIZE valeurs, ce qui donne un
+# filtre de Bloom sur id et sur les dimensions. Les chaînes longues (analyse)
+# dépassent la limite de page de dictionnaire et restent en PLAIN.
+ROW_GROUP_SIZE = 16_384
+PARQUET_OPTIONS = (
+    "FORMAT 'parquet', COMPRESSION 'zstd', "
+    f"ROW_GROUP_SIZE {ROW_GROUP_SIZE}, DICTIONARY_SIZE_LIMIT {ROW_GROUP_SIZE}, "
+    "STRING_DICTIONARY_PAGE_SIZE_LIMIT 1048576, BLOOM_FILTER_FALSE_POSITIVE_RATIO 0.01"
+)
+SAISINES_ORDER = "date_arrivee NULLS LAST, id"
+KEYWORDS_ORDER = "keyword, id"
+
+# Version retenue pour un id : date la plus récente, puis dernière ingestion
+LATEST_VERSION_ORDER = "coalesce(date_arrivee, date_cloture) DESC NULLS LAST, _seq DESC"
+
+_SEQ_RE = re.compile(r"^(?:delta|base)-(\d+)")
+
+
+def _partition_columns(date_column: str = "date_arrivee") -> str:
+    return f"year({date_column}) AS annee, month({date_column}) AS mois"
+
+
+def table_dir(parquet_dir: Path, table: str) -> Path:
+    return parquet_dir / table
+
+
+def _glob(parquet_dir: Path, table: str) -> str:
+    return (table_dir(parquet_dir, table) / "**" / "*.parquet").as_posix()
+
+
+def fragments(parquet_dir: Path, table: str) -> List[Path]:
+    """Fragments Parquet d'une table (toutes partitions)."""
+    root = table_dir(parquet_dir, table)
+    return sorted(root.rglob("*.parquet")) if root.exists() else []
+
+
+def partitions(parquet_dir: Path, table: str) -> List[Path]:
+    """Dossiers de partition (annee=/mois=) contenant au moins un fragment."""
+    return sorted({p.parent for p in fragments(parquet_dir, table)})
+
+
+def next_seq(parquet_dir: Path) -> int:
+    """Numéro de la prochaine ingestion (d'après les noms de fragments)."""
+    seqs = [int(m.group(1)) for p in fragments(parquet_dir, SAISINES_DIR) if (m := _SEQ_RE.match(p.name))]
+    return max(seqs, default=0) + 1
+
+
+def _latest_sql(parquet_dir: Path) -> str:
+    return (
+        f"SELECT * FROM read_parquet('{_glob(parquet_dir, SAISINES_DIR)}', "
+        f"hive_partitioning = false, union_by_name = true) "
+        f"QUALIFY row_number() OVER (PARTITION BY id ORDER BY {LATEST_VERSION_ORDER}) = 1"
+    )
+
+
+def saisines_sql(parquet_dir: Path) -> str:
+    """Requête fusionnée à la lecture : dernière version de chaque saisine."""
+    if not fragments(parquet_dir, SAISINES_DIR):
+        raise FileNotFoundError(f"Dataset saisines vide ou absent: {table_dir(parquet_dir, SAISINES_DIR)}")
+    return f"SELECT * EXCLUDE (_seq) FROM ({_latest_sql(parquet_dir)})"
+
+
+def keywords_sql(parquet_dir: Path) -> str:
+    """
+    Mots-clés de la version retenue de chaque id (même `_seq`, sans doublon) :
+    ceux d'une version supplantée ne remontent plus. Au sein d'une ingestion,
+    seuls les mots-clés de la ligne retenue sont écrits (cf. write_delta).
+    """
+    if not fragments(parquet_dir, KEYWORDS_DIR) or not fragments(parquet_dir, SAISINES_DIR):
+        return "SELECT NULL::BIGINT AS id, NULL::VARCHAR AS keyword WHERE FALSE"
+    return (
+        f"SELECT DISTINCT id, keyword FROM read_parquet('{_glob(parquet_dir, KEYWORDS_DIR)}', "
+        f"hive_partitioning = false) "
+        f"SEMI JOIN (SELECT id, _seq FROM ({_latest_sql(parquet_dir)})) USING (id, _seq)"
+    )
+
+
+def write_delta(
+    con: duckdb.DuckDBPyConnection,
+    main_query: str,
+    keywords_query: str,
+    parquet_dir: Path,
+    work_dir: Path,
+) -> Tuple[int, List[Path]]:
+    """
+    Ajoute un delta au dataset. `main_query` doit renvoyer au plus une ligne
+    par id (colonnes de SAISINES_SCHEMA) ; `keywords_query` renvoie (id,
+    keyword) pour la ligne retenue de chaque id uniquement. Les fragments sont écrits dans work_dir puis déplacés
+    (rename atomique) dans le dataset. Retourne (numéro du delta, partitions
+    touchées).
+    """
+    work_dir.mkdir(parents=True, exist_ok=True)
+    seq = next_seq(parquet_dir)
+    pattern = f"delta-{seq:010d}-{{i}}"
+    con.execute(f"CREATE OR REPLACE TEMP TABLE delta_main AS SELECT *, {seq}::BIGINT AS _seq FROM ({main_query})")
+    con.execute(
+        f"""
+        COPY (SELECT *, {_partition_columns()} FROM delta_main ORDER BY {SAISINES_ORDER})
+        TO '{(work_dir / SAISINES_DIR).as_posix()}'
+        ({PARQUET_OPTIONS}, PARTITION_BY (annee, mois), FILENAME_PATTERN '{pattern}')
+        """
+    )
+    # Les mots-clés suivent la partition de la saisine correspondante
+    con.execute(
+        f"""
+        COPY (
+            SELECT DISTINCT k.id, k.keyword, m._seq, {_partition_columns("m.date_arrivee")}
+            FROM ({keywords_query}) k JOIN delta_main m USING (id)
+            ORDER BY {KEYWORDS_ORDER}
+        )
+        TO '{(work_dir / KEYWORDS_DIR).as_posix()}'
+        ({PARQUET_OPTIONS}, PARTITION_BY (annee, mois), FILENAME_PATTERN '{pattern}')
+        """
+    )
+    touched = set()
+    for table in (KEYWORDS_DIR, SAISINES_DIR):
+        for path in sorted((work_dir / table).rglob("*.parquet")):
+            target = table_dir(parquet_dir, table) / path.relative_to(work_dir / table)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, target)
+            touched.add(target.parent.relative_to(table_dir(parquet_dir, table)))
+    logger.info("Delta %d ajouté (%d partitions touchées).", seq, len(touched))
+    return seq, sorted(touched)
+
+
+def _replace_fragments(con: duckdb.DuckDBPyConnection, query: str, part_dir: Path, old: List[Path]) -> None:
+    """Écrit le fragment compacté puis supprime les anciens (les doublons transitoires sont dédupliqués à la lecture)."""
+    seq = max((int(m.group(1)) for p in old if (m := _SEQ_RE.match(p.name))), default=0)
+    target = part_dir / f"base-{seq:010d}.parquet"
+    tmp = part_dir / f"{target.name}.tmp"
+    con.execute(f"COPY ({query}) TO '{tmp.as_posix()}' ({PARQUET_OPTIONS})")
+    os.replace(tmp, target)
+    for path in old:
+        if path != target:
+            path.unlink(missing_ok=True)
+
+
+def _files_sql(files: Iterable[Path]) -> str:
+    return "[" + ", ".join(f"'{p.as_posix()}'" for p in files) + "]"
+
+
+def compact(
+    parquet_dir: Path,
+    touched: Iterable[Path] | None = None,
+    min_fragments: int = 2,
+    full: bool = False,
+) -> int:
+    """
+    Compacte les partitions `touched` (chemins relatifs annee=/mois=, toutes
+    si None) ayant au moins `min_fragments` fragments. Retourne le nombre de
+    partitions réécrites.
+    """
+    main_root = table_dir(parquet_dir, SAISINES_DIR)
+    kw_root = table_dir(parquet_dir, KEYWORDS_DIR)
+    if touched is None:
+        touched = [p.relative_to(main_root) for p in partitions(parquet_dir, SAISINES_DIR)]
+
+    con = duckdb.connect(":memory:")
+    if full and fragments(parquet_dir, SAISINES_DIR):
+        # Versions gagnantes globales : retire les lignes supplantées ailleurs
+        con.execute(f"CREATE TEMP TABLE winners AS SELECT id, _seq FROM ({_latest_sql(parquet_dir)})")
+
+    rewritten = 0
+    for rel in touched:
+        main_files = sorted((main_root / rel).glob("*.parquet"))
+        if not main_files or (len(main_files) < min_fragments and not full):
+            continue
+        query = (
+            f"SELECT * FROM read_parquet({_files_sql(main_files)}, hive_partitioning = false, union_by_name = true) "
+            f"QUALIFY row_number() OVER (PARTITION BY id ORDER BY {LATEST_VERSION_ORDER}) = 1"
+        )
+        if full:
+            query = f"SELECT * FROM ({query}) SEMI JOIN winners USING (id, _seq)"
+        con.execute(f"CREATE OR REPLACE TEMP TABLE kept AS {query}")
+        _replace_fragments(con, f"SELECT * FROM kept ORDER BY {SAISINES_ORDER}", main_root / rel, main_files)
+
+        # Les mots-clés suivent la partition de leur version : seuls ceux des
+        # versions conservées ci-dessus sont réécrits
+        kw_files = sorted((kw_root / rel).glob("*.parquet"))
+        if kw_files:
+            _replace_fragments(
+                con,
+                f"SELECT DISTINCT id, keyword, _seq FROM read_parquet({_files_sql(kw_files)}, hive_partitioning = false) "
+                f"SEMI JOIN (SELECT id, _seq FROM kept) USING (id, _seq) ORDER BY {KEYWORDS_ORDER}",
+                kw_root / rel,
+                kw_files,
+            )
+        rewritten += 1
+    con.close()
+    if rewritten:
+        logger.info("%d partitions compactées.", rewritten)
+    return rewritten
+
+
+def migrate_legacy(parquet_dir: Path) -> bool:
+    """
+    Convertit l'ancien format (saisines.parquet / keywords.parquet réécrits à
+    chaque ingestion) en dataset partitionné (fragments `base-0000000000`).
+    """
+    legacy_main = parquet_dir / "saisines.parquet"
+    legacy_kw = parquet_dir / "keywords.parquet"
+    if not legacy_main.exists():
+        return False
+    if fragments(parquet_dir, SAISINES_DIR):
+        raise RuntimeError(f"Ancien {legacy_main.name} et dataset partitionné coexistent dans {parquet_dir}")
+
+    # Écriture dans un dossier de travail puis renommage : pas d'état intermédiaire visible
+    work_dir = parquet_dir / ".migration"
+    work_dir.mkdir(exist_ok=True)
+    con = duckdb.connect(":memory:")
+    con.execute(
+        f"CREATE TEMP TABLE legacy_main AS SELECT *, 0::BIGINT AS _seq FROM read_parquet('{legacy_main.as_posix()}')"
+    )
+    pattern = "base-0000000000-{i}"
+    con.execute(
+        f"COPY (SELECT *, {_partition_columns()} FROM legacy_main ORDER BY {SAISINES_ORDER}) "
+        f"TO '{(work_dir / SAISINES_DIR).as_posix()}' "
+        f"({PARQUET_OPTIONS}, PARTITION_BY (annee, mois), FILENAME_PATTERN '{pattern}', OVERWRITE)"
+    )
+    if legacy_kw.exists():
+        con.execute(
+            f"""
+            COPY (
+                SELECT k.id, k.keyword, 0::BIGINT AS _seq, {_partition_columns("m.date_arrivee")}
+                FROM read_parquet('{legacy_kw.as_posix()}') k LEFT JOIN legacy_main m USING (id)
+                ORDER BY {KEYWORDS_ORDER}
+            )
+            TO '{(work_dir / KEYWORDS_DIR).as_posix()}'
+            ({PARQUET_OPTIONS}, PARTITION_BY (annee, mois), FILENAME_PATTERN '{pattern}', OVERWRITE)
+            """
+        )
+    con.close()
+    for table in (KEYWORDS_DIR, SAISINES_DIR):
+        if (work_dir / table).exists():
+            shutil.rmtree(table_dir(parquet_dir, table), ignore_errors=True)
+            os.replace(work_dir / table, table_dir(parquet_dir, table))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    legacy_main.unlink()
+    legacy_kw.unlink(missing_ok=True)
+    logger.info("Ancien Parquet migré vers le dataset partitionné: %s", parquet_dir)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compaction du dataset Parquet partitionné.")
+    parser.add_argument("--parquet-dir", type=Path, default=Path(__file__).resolve().parents[1] / "data" / "parquet")
+    parser.add_argument("--min-fragments", type=int, default=2, help="Fragments minimum pour réécrire une partition.")
+    parser.add_argument("--full", action="store_true", help="Retire aussi les versions supplantées entre partitions.")
+    args = parser.parse_args()
+    migrate_legacy(args.parquet_dir)
+    compact(args.parquet_dir, min_fragments=args.min_fragments, full=args.full)
+
+
+if __name__ == "__main__":
+    main()
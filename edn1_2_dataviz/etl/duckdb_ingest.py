@@ -0,0 +1,194 @@
+"""
+Moteur d'ingestion DuckDB : lecture JSON/JSONL native et normalisation en SQL.
+
+Même résultat que le moteur Python (schema.normalize_record), mais vectorisé :
+- renommages générés depuis FIELD_MAPPING (map_field) pour les clés présentes,
+- dates parsées par try_strptime (mêmes formats que parse_date) ou timestamp,
+- key_word découpé, mis en minuscules et dédupliqué (ordre conservé), puis
+  UNNEST vers la table keywords ; key_word_str reconstruit.
+
+Le staging produit a la même forme que celui du moteur Python
+(saisines/*.parquet et keywords/*.parquet avec _file/_row) : la fusion
+(append_to_dataset) est partagée.
+
+Écarts connus : une valeur non textuelle (liste, objet, booléen) dans une
+colonne texte est sérialisée par DuckDB (JSON compact, `true`) et non par
+Python ; si plusieurs clés source alimentent la même colonne, la première
+non nulle l'emporte.
+"""
+
+from __future__ import annotations
+
+import logging
+from pathlib import Path
+from typing import Dict, List
+
+import duckdb
+import pyarrow as pa
+
+from .schema import DATE_FIELDS, SAISINES_SCHEMA, is_text_type, map_field
+from .schema import DATE_FORMATS as SCHEMA_DATE_FORMATS
+
+logger = logging.getLogger(__name__)
+
+# Formats essayés dans l'ordre, comme parse_date (le dernier couvre fromisoformat)
+DATE_FORMATS = SCHEMA_DATE_FORMATS + ("%Y%m%d",)
+
+
+def _sql_type(type_: pa.DataType) -> str:
+    if is_text_type(type_):
+        return "VARCHAR"
+    return {pa.int64(): "BIGINT", pa.date32(): "DATE"}[type_]
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _date_expr(value: str) -> str:
+    formats = ", ".join(_literal(f) for f in DATE_FORMATS)
+    timestamp = f"epoch_ms(CAST(floor({value}::DOUBLE * 1000) AS BIGINT))::DATE"
+    return (
+        f"CASE json_type({value}) "
+        f"WHEN 'VARCHAR' THEN try_strptime(left(ltrim({value} ->> '$', ' \t\r\n'), 10), [{formats}])::DATE "
+        f"WHEN 'BIGINT' THEN {timestamp} WHEN 'UBIGINT' THEN {timestamp} WHEN 'DOUBLE' THEN {timestamp} "
+        f"END"
+    )
+
+
+def _raw_keywords_expr(value: str) -> str:
+    """Valeurs brutes de key_word (liste, chaîne découpée sur ; et , ou scalaire)."""
+    # Clé absente ou null : NULL, pour que coalesce passe à la clé suivante
+    return (
+        f"CASE coalesce(json_type({value}), 'NULL') "
+        f"WHEN 'ARRAY' THEN json_extract_string({value}, '$[*]') "
+        f"WHEN 'VARCHAR' THEN regexp_split_to_array({value} ->> '$', '[;,]') "
+        f"WHEN 'NULL' THEN NULL "
+        f"ELSE [{value} ->> '$'] END"
+    )
+
+
+def discover_keys(con: duckdb.DuckDBPyConnection, files_sql: str) -> List[str]:
+    """Clés distinctes présentes dans les objets des fichiers d'entrée."""
+    rows = con.execute(
+        f"SELECT DISTINCT unnest(json_keys(json)) "
+        f"FROM read_json_objects({files_sql}, format = 'auto', ignore_errors = true) "
+        f"WHERE json_type(json) = 'OBJECT'"
+    ).fetchall()
+    return sorted(r[0] for r in rows)
+
+
+def build_query(keys: List[str], files_sql: str) -> str:
+    """
+    Génère la requête de normalisation (colonnes de SAISINES_SCHEMA hors
+    key_word_str, liste `_keywords`, provenance _file/_row) à partir des
+    clés source et de map_field. Chaque clé est lue comme une colonne JSON
+    par le lecteur natif : un seul parsing par enregistrement.
+    """
+    sources: Dict[str, List[str]] = {}
+    for key in keys:
+        sources.setdefault(map_field(key), []).append(key)
+
+    columns = []
+    for field in SAISINES_SCHEMA:
+        if field.name == "key_word_str":
+            continue
+        sql_type = _sql_type(field.type)
+        exprs = []
+        for key in sources.get(field.name, []):
+            if field.name in DATE_FIELDS:
+                exprs.append(_date_expr(_ident(key)))
+            else:
+                exprs.append(f"TRY_CAST({_ident(key)} ->> '$' AS {sql_type})")
+        expr = f"coalesce({', '.join(exprs)})" if exprs else f"NULL::{sql_type}"
+        columns.append(f"{expr} AS {_ident(field.name)}")
+
+    kw_exprs = [_raw_keywords_expr(_ident(k)) for k in sources.get("key_word", [])]
+    columns.append(f"coalesce({', '.join(kw_exprs)}) AS _kw_raw" if kw_exprs else "NULL::VARCHAR[] AS _kw_raw")
+    columns.append(f"CAST(list_position({files_sql}, filename) - 1 AS INTEGER) AS _file")
+    columns.append("CAST(ordinality - 1 AS BIGINT) AS _row")
+
+    select_list = ",\n                ".join(columns)
+    json_columns = "{" + ", ".join(f"{_literal(k)}: 'JSON'" for k in keys) + "}"
+    # Étapes séparées : la liste nettoyée est calculée une fois par ligne
+    # avant le dédoublonnage (qui la relit pour chaque élément).
+    return f"""
+        WITH src AS (
+            SELECT
+                {select_list}
+            FROM read_json(
+                {files_sql}, columns = {json_columns}, format = 'auto',
+                filename = true, ignore_errors = true
+            ) WITH ORDINALITY
+        ),
+        cleaned AS (
+            SELECT * EXCLUDE (_kw_raw),
+                list_filter(
+                    list_transform(_kw_raw, x -> lower(regexp_replace(x, '^\\s+|\\s+$', '', 'g'))),
+                    x -> x IS NOT NULL AND x <> ''
+                ) AS _kw_clean
+            FROM src
+        )
+        SELECT * EXCLUDE (_kw_clean),
+            coalesce(list_filter(_kw_clean, (x, i) -> list_position(_kw_clean, x) = i), []) AS _keywords
+        FROM cleaned
+    """
+
+
+def stage_files(files: List[Path], staging_dir: Path, memory_limit: str = "1GB") -> int:
+    """
+    Normalise les fichiers d'entrée avec DuckDB dans staging_dir
+    (saisines/frag-00000.parquet, keywords/frag-00000.parquet).
+    Retourne le nombre de saisines.
+    """
+    con = duckdb.connect(":memory:")
+    con.execute(f"SET memory_limit = '{memory_limit}'")
+    con.execute(f"SET temp_directory = '{(staging_dir / 'duckdb_tmp').as_posix()}'")
+    files_sql = "[" + ", ".join(_literal(p.as_posix()) for p in files) + "]"
+
+    keys = discover_keys(con, files_sql)
+    if "id" not in {map_field(k) for k in keys}:
+        logger.warning("Aucun champ 'id' dans les fichiers d'entrée.")
+        con.close()
+        return 0
+    unknown = sorted(
+        {k for k in keys if map_field(k) not in SAISINES_SCHEMA.names and map_field(k) != "key_word"}
+    )
+    if unknown:
+        logger.warning("Champs hors schéma ignorés (à déclarer dans schema.py): %s", ", ".join(unknown))
+
+    logger.info("Normalisation DuckDB de %d fichiers", len(files))
+    con.execute(f"CREATE TEMP TABLE normalized AS {build_query(keys, files_sql)}")
+    dropped = con.execute("SELECT count(*) FROM normalized WHERE id IS NULL").fetchone()[0]
+    if dropped:
+        logger.error("%d enregistrements ignorés (id manquant ou non entier).", dropped)
+
+    name = "frag-00000.parquet"
+    main_columns = ", ".join(_ident(f) for f in SAISINES_SCHEMA.names if f != "key_word_str")
+    con.execute(
+        f"""
+        COPY (
+            SELECT {main_columns},
+                   CASE WHEN len(_keywords) > 0 THEN array_to_string(_keywords, ' ') END AS key_word_str,
+                   _file, _row
+            FROM normalized WHERE id IS NOT NULL
+        ) TO '{(staging_dir / 'saisines' / name).as_posix()}' (FORMAT 'parquet')
+        """
+    )
+    con.execute(
+        f"""
+        COPY (
+            SELECT id, unnest(_keywords) AS keyword, _file, _row FROM normalized WHERE id IS NOT NULL
+        ) TO '{(staging_dir / 'keywords' / name).as_posix()}' (FORMAT 'parquet')
+        """
+    )
+    count = con.execute("SELECT count(*) FROM normalized WHERE id IS NOT NULL").fetchone()[0]
+    con.close()
+    return count
+
+
+__all__ = ["DATE_FORMATS", "discover_keys", "build_query", "stage_files"]
@@ -1,21 +1,40 @@
 """
 Ingestion des fichiers JSON/JSONL vers Parquet + DuckDB.
 
+Les enregistrements normalisés sont convertis en RecordBatch Arrow (schéma
+déclaré dans schema.py) et écrits au fil de l'eau dans des Parquet de
+staging ; DuckDB déduplique ensuite le staging (sur id) et l'ajoute comme
+delta au dataset partitionné (dataset.py).
+
+Par défaut, le journal NDJSON de l'enrichissement (ENRICHMENT_JOURNAL) est
+ingéré avec les fichiers du dossier input/.
+
 Usage:
-    python -m edn1_2_dataviz.etl.ingest_json_to_parquet
+    python -m edn1_2_dataviz.etl.ingest_json_to_parquet [--engine duckdb] [--journal PATH]
 """
 
 from __future__ import annotations
 
+import argparse
+import gzip
 import json
 import logging
+import os
+import re
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import Dict, Iterable, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 import duckdb
 import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 
-from .schema import normalize_record
+from . import dataset, duckdb_ingest, manifest
+from .schema import KEYWORDS_SCHEMA, SAISINES_SCHEMA, is_text_type, normalize_columns, normalize_record
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,18 +42,49 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Enregistrements normalisés par lot / RecordBatch (borne la mémoire de l'ingestion)
+BATCH_SIZE = 50_000
+READ_CHUNK_CHARS = 1024 * 1024
+# Mémoire max de DuckDB pour la fusion (au-delà, DuckDB déborde sur disque)
+DUCKDB_MEMORY_LIMIT = "1GB"
+# Moteurs de normalisation disponibles (voir stage_records)
+ENGINES = ("python", "duckdb")
+# Journal écrit batch par batch par back/projet/output_tri_structure.py
+ENRICHMENT_JOURNAL = (
+    Path(__file__).resolve().parents[2] / "back" / "data" / "output" / "output_tri_structure2.ndjson"
+)
+
+_WS = re.compile(r"[\s,]*")
+
+# Colonnes de provenance du staging (fichier, ligne), retirées à la fusion
+STAGING_SAISINES_SCHEMA = SAISINES_SCHEMA.append(pa.field("_file", pa.int32())).append(
+    pa.field("_row", pa.int64())
+)
+# Les mots-clés portent la provenance de leur saisine : seuls ceux de la
+# ligne retenue pour un id sont ajoutés au dataset
+STAGING_KEYWORDS_SCHEMA = KEYWORDS_SCHEMA.append(pa.field("_file", pa.int32())).append(
+    pa.field("_row", pa.int64())
+)
+
 
 def iter_input_files(input_dir: Path) -> Iterable[Path]:
-    """Liste les fichiers .json et .jsonl du dossier input."""
+    """Liste les fichiers .json, .jsonl et .ndjson (éventuellement .gz) du dossier input."""
     for path in sorted(input_dir.glob("*.json*")):
         if path.is_file():
             yield path
 
 
+def _open_text(path: Path):
+    if path.suffix.lower() == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
+
 def read_json_records(path: Path) -> Iterable[Dict]:
-    """Yield les enregistrements d'un fichier JSON ou JSONL."""
-    if path.suffix.lower() == ".jsonl" or path.name.lower().endswith(".ndjson"):
-        with path.open("r", encoding="utf-8") as f:
+    """Yield les enregistrements d'un fichier JSON ou JSONL (compressé gzip ou non)."""
+    name = path.name.lower().removesuffix(".gz")
+    if name.endswith((".jsonl", ".ndjson")):
+        with _open_text(path) as f:
             for line in f:
                 line = line.strip()
                 if not line:
@@ -44,130 +94,319 @@ def read_json_records(path: Path) -> Iterable[Dict]:
                 except json.JSONDecodeError as exc:
                     logger.error("Ligne invalide dans %s: %s", path.name, exc)
     else:
-        with path.open("r", encoding="utf-8") as f:
+        with _open_text(path) as f:
             try:
-                payload = json.load(f)
+                yield from _iter_json_payload(f, path)
             except json.JSONDecodeError as exc:
                 logger.error("JSON invalide dans %s: %s", path.name, exc)
-                return
-        if isinstance(payload, list):
-            for row in payload:
-                yield row
-        elif isinstance(payload, dict):
-            yield payload
-        else:
-            logger.error("Format inattendu dans %s (ni liste ni objet)", path.name)
 
 
-def collect_records(input_dir: Path) -> Tuple[List[Dict], List[Dict]]:
-    """Charge et normalise tous les enregistrements du dossier input/."""
-    mains: List[Dict] = []
-    keywords: List[Dict] = []
-    files = list(iter_input_files(input_dir))
-    if not files:
-        logger.warning("Aucun fichier .json/.jsonl trouvé dans %s", input_dir)
-    for path in files:
-        logger.info("Lecture de %s", path.name)
-        for raw in read_json_records(path):
+def _iter_json_payload(f, path: Path, chunk_chars: int = READ_CHUNK_CHARS) -> Iterator[Dict]:
+    """
+    Itère sur les éléments d'un tableau JSON sans charger le fichier entier
+    (décodage élément par élément avec raw_decode). Un objet unique est
+    renvoyé tel quel.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_chars)
+    pos = _WS.match(buf).end()
+    if buf[pos : pos + 1] == "{":
+        yield decoder.decode(buf + f.read())
+        return
+    if buf[pos : pos + 1] != "[":
+        logger.error("Format inattendu dans %s (ni liste ni objet)", path.name)
+        return
+    pos += 1
+    eof = False
+    while True:
+        pos = _WS.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            end = None
+        if end is None or (end == len(buf) and not eof):
+            # Élément tronqué par la fin du buffer : lecture supplémentaire
+            more = f.read(chunk_chars)
+            if not more:
+                if eof or end is None:
+                    decoder.raw_decode(buf, pos)  # relève l'erreur de syntaxe
+                eof = True
+                continue
+            buf, pos = buf[pos:] + more, 0
+            continue
+        yield obj
+        pos = end
+
+
+def _text(value) -> str:
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (list, dict)) else str(value)
+
+
+def _int_or_none(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        logger.error("Enregistrement ignoré: id=%r n'est pas un entier.", value)
+        return None
+
+
+def column_to_array(values: List, field: pa.Field) -> pa.Array:
+    """
+    Convertit une colonne Python au type déclaré. Les types hétérogènes sont
+    convertis colonne par colonne (texte : str/JSON ; entier : int(), NULL
+    si invalide).
+    """
+    try:
+        return pa.array(values, type=field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError):
+        if is_text_type(field.type):
+            values = [v if v is None or isinstance(v, str) else _text(v) for v in values]
+        elif pa.types.is_integer(field.type):
+            values = [v if v is None or isinstance(v, int) else _int_or_none(v) for v in values]
+        return pa.array(values, type=field.type)
+
+
+def columns_to_batch(columns: Dict[str, List], schema: pa.Schema, num_rows: int) -> pa.RecordBatch:
+    """RecordBatch conforme au schéma ; les lignes dont l'id n'est pas un entier sont retirées."""
+    arrays = [
+        column_to_array(columns[field.name], field) if field.name in columns else pa.nulls(num_rows, field.type)
+        for field in schema
+    ]
+    ids = arrays[schema.get_field_index("id")]
+    if ids.null_count:
+        mask = pc.is_valid(ids)
+        arrays = [pc.filter(array, mask) for array in arrays]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def normalize_chunk(records: List[Dict], path: Path) -> Tuple[Dict[str, List], Dict[str, List], List[int]]:
+    """
+    normalize_columns sur un lot ; si un enregistrement est inexploitable, le
+    lot est repris enregistrement par enregistrement pour n'écarter que lui.
+    """
+    try:
+        columns, keyword_columns, rejected = normalize_columns(records)
+    except Exception:
+        columns, keyword_columns, rejected = {}, {"id": [], "keyword": [], "_row": []}, []
+        rows = []
+        for i, record in enumerate(records):
             try:
-                main_row, keyword_rows = normalize_record(raw)
-                mains.append(main_row)
-                keywords.extend(keyword_rows)
+                rows.append(normalize_record(record))
             except Exception as exc:
-                logger.exception("Enregistrement ignoré (fichier %s): %s", path.name, exc)
-    return mains, keywords
+                logger.error("Enregistrement ignoré (fichier %s): %s", path.name, exc)
+                rejected.append(i)
+        for name in dict.fromkeys(k for main_row, _ in rows for k in main_row):
+            columns[name] = [main_row.get(name) for main_row, _ in rows]
+        for pos, (_, keyword_rows) in enumerate(rows):
+            for kw_row in keyword_rows:
+                keyword_columns["id"].append(kw_row["id"])
+                keyword_columns["keyword"].append(kw_row["keyword"])
+                keyword_columns["_row"].append(pos)
+        return columns, keyword_columns, rejected
 
+    if rejected:
+        logger.error("%d enregistrements ignorés (fichier %s): champ 'id' manquant.", len(rejected), path.name)
+    return columns, keyword_columns, rejected
 
-def _table_from_pylist(rows: List[Dict]) -> pa.Table:
-    """Construit une table Arrow à partir d'une liste de dicts."""
-    return pa.Table.from_pylist(rows) if rows else pa.table({})
 
+def stage_file(
+    path: Path, file_index: int, staging_dir: Path, batch_size: int = BATCH_SIZE
+) -> Tuple[int, List[str]]:
+    """
+    Normalise un fichier d'entrée dans un fragment de staging
+    (saisines/frag-NNNNN.parquet, keywords/frag-NNNNN.parquet), par lots de
+    `batch_size` enregistrements normalisés en colonnes : la mémoire reste
+    bornée. Les colonnes de provenance (_file, _row) rendent la fusion
+    déterministe. Retourne (nombre de saisines, champs hors schéma).
+    """
+    logger.info("Lecture de %s", path.name)
+    name = f"frag-{file_index:05d}.parquet"
+    known = set(STAGING_SAISINES_SCHEMA.names)
+    unknown: set = set()
+    count = 0
+    position = 0
+    records = iter(read_json_records(path))
+    with pq.ParquetWriter(staging_dir / "saisines" / name, STAGING_SAISINES_SCHEMA) as main_writer, \
+            pq.ParquetWriter(staging_dir / "keywords" / name, STAGING_KEYWORDS_SCHEMA) as kw_writer:
+        while chunk := list(islice(records, batch_size)):
+            columns, keyword_columns, rejected = normalize_chunk(chunk, path)
+            num_rows = len(chunk) - len(rejected)
+            unknown.update(columns.keys() - known)
+            columns["_file"] = [file_index] * num_rows
+            columns["_row"] = list(range(position, position + num_rows))
+            keyword_columns["_file"] = [file_index] * len(keyword_columns["id"])
+            keyword_columns["_row"] = [position + pos for pos in keyword_columns["_row"]]
+            position += num_rows
+            if num_rows:
+                batch = columns_to_batch(columns, STAGING_SAISINES_SCHEMA, num_rows)
+                main_writer.write_batch(batch)
+                count += batch.num_rows
+            if keyword_columns["id"]:
+                kw_writer.write_batch(
+                    columns_to_batch(keyword_columns, STAGING_KEYWORDS_SCHEMA, len(keyword_columns["id"]))
+                )
+    return count, sorted(unknown)
 
-def write_parquet_with_dedup(
-    mains: List[Dict], keywords: List[Dict], parquet_dir: Path
-) -> None:
-    """Fusionne avec l'existant en supprimant les doublons sur id."""
-    parquet_dir.mkdir(parents=True, exist_ok=True)
-    main_path = parquet_dir / "saisines.parquet"
-    kw_path = parquet_dir / "keywords.parquet"
 
-    con = duckdb.connect(":memory:")
+def stage_records(
+    input_dir: Path,
+    staging_dir: Path,
+    batch_size: int = BATCH_SIZE,
+    workers: int | None = None,
+    engine: str = "python",
+    files: List[Path] | None = None,
+) -> int:
+    """
+    Normalise les fichiers du dossier input/ (ou la liste `files`) en
+    fragments de staging ; `_file` est l'index du fichier dans cette liste.
 
-    # Table principale
-    new_main = _table_from_pylist(mains)
-    con.register("new_main", new_main)
-    if main_path.exists():
-        con.execute(
-            f"CREATE OR REPLACE TEMP VIEW existing_main AS "
-            f"SELECT * FROM read_parquet('{main_path.as_posix()}')"
-        )
+    engine="python" : un fichier par tâche dans un pool de processus
+    (`workers`, défaut : nombre de cœurs) ; engine="duckdb" : lecture et
+    normalisation en SQL (voir duckdb_ingest.py). Retourne le nombre total
+    de saisines.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Moteur d'ingestion inconnu: {engine!r} (attendu: {', '.join(ENGINES)})")
+    files = list(iter_input_files(input_dir)) if files is None else files
+    if not files:
+        logger.warning("Aucun fichier .json/.jsonl trouvé dans %s", input_dir)
+        return 0
+    for sub in ("saisines", "keywords"):
+        (staging_dir / sub).mkdir(parents=True, exist_ok=True)
+    if engine == "duckdb":
+        return duckdb_ingest.stage_files(files, staging_dir, memory_limit=DUCKDB_MEMORY_LIMIT)
+
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers <= 1:
+        results = [stage_file(path, i, staging_dir, batch_size) for i, path in enumerate(files)]
     else:
-        con.execute("CREATE OR REPLACE TEMP VIEW existing_main AS SELECT * FROM new_main WHERE 1=0")
+        logger.info("Normalisation de %d fichiers sur %d processus", len(files), workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(stage_file, path, i, staging_dir, batch_size) for i, path in enumerate(files)
+            ]
+            results = [f.result() for f in futures]
+
+    unknown = sorted({field for _, fields in results for field in fields})
+    if unknown:
+        logger.warning("Champs hors schéma ignorés (à déclarer dans schema.py): %s", ", ".join(unknown))
+    return sum(count for count, _ in results)
 
+
+def append_to_dataset(staging_dir: Path, parquet_dir: Path) -> int:
+    """
+    Ajoute le staging au dataset partitionné (voir dataset.py) : seul le delta
+    est dédupliqué et écrit ; l'existant n'est pas relu. Les partitions
+    touchées sont compactées au-delà de COMPACTION_MIN_FRAGMENTS fragments.
+    Retourne le numéro du delta écrit.
+    """
+    parquet_dir.mkdir(parents=True, exist_ok=True)
+    dataset.migrate_legacy(parquet_dir)
+
+    con = duckdb.connect(":memory:")
+    con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+    con.execute(f"SET temp_directory = '{(staging_dir / 'duckdb_tmp').as_posix()}'")
+    con.execute("SET preserve_insertion_order = false")
+
+    # À date égale, la dernière occurrence (ordre des fichiers puis des lignes)
+    # l'emporte ; entre ingestions, c'est le delta le plus récent (_seq).
+    # Les mots-clés sont ceux de la ligne retenue (même _file/_row).
+    staged_main = f"read_parquet('{(staging_dir / 'saisines' / '*.parquet').as_posix()}')"
     con.execute(
-        """
-        CREATE OR REPLACE TEMP VIEW combined_main AS
-        SELECT * FROM (
-            SELECT * FROM existing_main
-            UNION ALL
-            SELECT * FROM new_main
-        )
+        f"""
+        CREATE TEMP TABLE winners AS
+        SELECT id, _file, _row FROM {staged_main}
         QUALIFY row_number() OVER (
             PARTITION BY id
-            ORDER BY coalesce(date_arrivee, date_cloture) DESC NULLS LAST, id
+            ORDER BY coalesce(date_arrivee, date_cloture) DESC NULLS LAST,
+                     _file DESC, _row DESC
         ) = 1
         """
     )
-    con.execute(
-        f"COPY (SELECT * FROM combined_main ORDER BY date_arrivee NULLS LAST, id) "
-        f"TO '{main_path.as_posix()}' (FORMAT 'parquet');"
+    main_query = f"SELECT * EXCLUDE (_file, _row) FROM {staged_main} SEMI JOIN winners USING (id, _file, _row)"
+    keywords_query = (
+        f"SELECT id, keyword FROM read_parquet('{(staging_dir / 'keywords' / '*.parquet').as_posix()}') "
+        f"SEMI JOIN winners USING (id, _file, _row)"
     )
-    logger.info("Parquet principal écrit: %s", main_path)
-
-    # Table enfant keywords (optionnelle)
-    new_kw = _table_from_pylist(keywords)
-    con.register("new_kw", new_kw)
-    if kw_path.exists():
-        con.execute(
-            f"CREATE OR REPLACE TEMP VIEW existing_kw AS SELECT * FROM read_parquet('{kw_path.as_posix()}')"
-        )
-    else:
-        con.execute("CREATE OR REPLACE TEMP VIEW existing_kw AS SELECT * FROM new_kw WHERE 1=0")
+    seq, touched = dataset.write_delta(con, main_query, keywords_query, parquet_dir, staging_dir / "delta")
+    con.close()
+    dataset.compact(parquet_dir, touched, min_fragments=dataset.COMPACTION_MIN_FRAGMENTS)
+    return seq
 
-    con.execute(
-        """
-        CREATE OR REPLACE TEMP VIEW combined_kw AS
-        SELECT * FROM (
-            SELECT * FROM existing_kw
-            UNION ALL
-            SELECT * FROM new_kw
-        )
-        QUALIFY row_number() OVER (
-            PARTITION BY id, keyword
-            ORDER BY id
-        ) = 1
-        """
-    )
-    con.execute(
-        f"COPY (SELECT * FROM combined_kw ORDER BY id) TO '{kw_path.as_posix()}' (FORMAT 'parquet');"
-    )
-    logger.info("Parquet keywords écrit: %s", kw_path)
+
+def staged_counts(staging_dir: Path) -> Dict[int, int]:
+    """Nombre de saisines stagées par index de fichier (_file)."""
+    con = duckdb.connect(":memory:")
+    rows = con.execute(
+        f"SELECT _file, count(*) FROM read_parquet('{(staging_dir / 'saisines' / '*.parquet').as_posix()}') "
+        f"GROUP BY _file"
+    ).fetchall()
+    con.close()
+    return dict(rows)
 
 
-def run(input_dir: Path | None = None, parquet_dir: Path | None = None) -> None:
+def run(
+    input_dir: Path | None = None,
+    parquet_dir: Path | None = None,
+    workers: int | None = None,
+    engine: str = "python",
+    force: bool = False,
+    journal: Path | None = None,
+) -> None:
+    """
+    Ingère les fichiers nouveaux ou modifiés depuis le dernier run (voir
+    manifest.py) ; `force=True` retraite tous les fichiers. `journal` (journal
+    NDJSON de l'enrichissement) est ingéré en plus du dossier input/ s'il existe.
+    """
     base = Path(__file__).resolve().parents[1]
     input_dir = input_dir or base / "data" / "input"
     parquet_dir = parquet_dir or base / "data" / "parquet"
+    parquet_dir.mkdir(parents=True, exist_ok=True)
 
-    mains, keywords = collect_records(input_dir)
-    if not mains:
-        logger.warning("Aucune donnée ingérée.")
+    files = list(iter_input_files(input_dir))
+    if journal is not None and journal.is_file():
+        files.append(journal)
+    previous = {} if force else manifest.load_manifest(parquet_dir)
+    files, entries, removed = manifest.select_changed(files, previous)
+    for name in removed:
+        logger.info("Fichier disparu, retiré du manifeste (données conservées): %s", name)
+    if not files:
+        logger.info("Aucun fichier nouveau ou modifié dans %s.", input_dir)
+        if removed:
+            manifest.save_manifest(parquet_dir, entries)
         return
-    write_parquet_with_dedup(mains, keywords, parquet_dir)
+
+    logger.info("%d fichiers à ingérer (%d inchangés ignorés).", len(files), len(entries))
+    snapshots = [manifest.snapshot(path) for path in files]
+    staging_dir = Path(tempfile.mkdtemp(prefix=".staging-", dir=parquet_dir))
+    try:
+        seq = None
+        if stage_records(input_dir, staging_dir, workers=workers, engine=engine, files=files):
+            seq = append_to_dataset(staging_dir, parquet_dir)
+            counts = staged_counts(staging_dir)
+        else:
+            logger.warning("Aucune donnée ingérée.")
+            counts = {}
+        # Manifeste mis à jour seulement après l'ajout du delta
+        for i, (path, snap) in enumerate(zip(files, snapshots)):
+            entries[path.name] = {**snap, "rows": counts.get(i, 0), "seq": seq}
+        manifest.save_manifest(parquet_dir, entries)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
 
 
 def main():
-    run()
+    parser = argparse.ArgumentParser(description="Ingestion JSON/JSONL vers Parquet.")
+    parser.add_argument("--engine", choices=ENGINES, default="python", help="Moteur de normalisation.")
+    parser.add_argument("--workers", type=int, default=None, help="Processus (moteur python).")
+    parser.add_argument("--force", action="store_true", help="Retraite tous les fichiers (ignore le manifeste).")
+    parser.add_argument(
+        "--journal", type=Path, default=ENRICHMENT_JOURNAL, help="Journal NDJSON de l'enrichissement à ingérer."
+    )
+    args = parser.parse_args()
+    run(workers=args.workers, engine=args.engine, force=args.force, journal=args.journal)
 
 
 if __name__ == "__main__":
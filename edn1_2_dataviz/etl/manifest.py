@@ -0,0 +1,111 @@
+"""
+Manifeste des fichiers d'entrée déjà ingérés (parquet/_manifest.json).
+
+Chaque entrée (clé : nom du fichier dans input/) mémorise taille, mtime,
+empreinte sha256, nombre de saisines et numéro d'ingestion. Un fichier est
+retraité s'il est nouveau ou si son contenu a changé ; un simple changement
+de mtime (copie, touch) avec la même empreinte ne déclenche pas de
+ré-ingestion.
+
+Un fichier disparu est retiré du manifeste (ses données restent dans le
+dataset) ; un fichier remplacé est ré-ingéré et ses nouvelles versions
+l'emportent à date égale (delta plus récent).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "_manifest.json"
+HASH_CHUNK = 1024 * 1024
+
+
+def manifest_path(parquet_dir: Path) -> Path:
+    return parquet_dir / MANIFEST_NAME
+
+
+def load_manifest(parquet_dir: Path) -> Dict[str, Dict]:
+    path = manifest_path(parquet_dir)
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as exc:
+        logger.error("Manifeste illisible (%s), tous les fichiers seront retraités: %s", path, exc)
+        return {}
+
+
+def save_manifest(parquet_dir: Path, manifest: Dict[str, Dict]) -> None:
+    """Écriture atomique (fichier temporaire puis remplacement)."""
+    path = manifest_path(parquet_dir)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, ensure_ascii=False, sort_keys=True) + "\n", encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(HASH_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(path: Path) -> Dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def select_changed(
+    files: Iterable[Path], manifest: Dict[str, Dict]
+) -> Tuple[List[Path], Dict[str, Dict], List[str]]:
+    """
+    Compare les fichiers présents au manifeste.
+
+    Retourne (fichiers à traiter, entrées des fichiers inchangés, noms
+    disparus). Le hash n'est calculé que si taille ou mtime ont changé.
+    """
+    to_process: List[Path] = []
+    kept: Dict[str, Dict] = {}
+    present = set()
+    for path in files:
+        present.add(path.name)
+        entry = manifest.get(path.name)
+        current = fingerprint(path)
+        if entry and all(entry.get(k) == v for k, v in current.items()):
+            kept[path.name] = entry
+            continue
+        if entry and entry.get("size") == current["size"] and entry.get("sha256") == file_sha256(path):
+            # Contenu identique (copie, touch) : seule la mtime est mise à jour
+            kept[path.name] = {**entry, **current}
+            continue
+        to_process.append(path)
+    removed = sorted(set(manifest) - present)
+    return to_process, kept, removed
+
+
+def snapshot(path: Path) -> Dict:
+    """
+    Empreinte complète, prise avant l'ingestion : un fichier modifié pendant
+    le traitement ne correspondra plus et sera retraité au run suivant.
+    """
+    return {**fingerprint(path), "sha256": file_sha256(path)}
+
+
+__all__ = [
+    "MANIFEST_NAME",
+    "manifest_path",
+    "load_manifest",
+    "save_manifest",
+    "file_sha256",
+    "fingerprint",
+    "select_changed",
+    "snapshot",
+]
@@ -9,7 +9,11 @@ import datetime as dt
 import logging
 import re
 import unicodedata
-from typing import Dict, Iterable, List, Tuple
+from functools import lru_cache
+from operator import itemgetter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import pyarrow as pa
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +49,69 @@ DATE_FIELDS = {"date_arrivee", "date_cloture"}
 TEXT_FIELDS = {"analyse", "key_word_str"}
 LIST_FIELDS = {"key_word"}
 
+# Formats de date reconnus, essayés dans l'ordre (sur les 10 premiers caractères)
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d")
+_KEYWORD_SEPARATORS = re.compile(r"[;,]")
+
+# Dimensions à faible cardinalité : encodées en dictionnaire (une valeur
+# stockée une fois par row group, filtres par égalité sur les index).
+DIMENSION_FIELDS = (
+    "pole_en_charge",
+    "categorie",
+    "sous_categorie",
+    "domaine",
+    "sous_domaine",
+    "aspect_contextuel",
+    "nature_saisine",
+    "reclamation_position_mediateur",
+    "impact_appui_mediateur",
+    "label",
+    "sous_label",
+    "lieu",
+)
+
+_DIMENSION = pa.dictionary(pa.int32(), pa.string())
+
+# Schémas Arrow déclarés des tables produites par l'ETL. Les colonnes absentes
+# d'un enregistrement sont NULL ; les champs hors schéma sont ignorés.
+SAISINES_SCHEMA = pa.schema(
+    [
+        pa.field("id", pa.int64(), nullable=False),
+        pa.field("date_arrivee", pa.date32()),
+        pa.field("date_cloture", pa.date32()),
+        pa.field("pole_en_charge", _DIMENSION),
+        pa.field("categorie", _DIMENSION),
+        pa.field("sous_categorie", _DIMENSION),
+        pa.field("domaine", _DIMENSION),
+        pa.field("sous_domaine", _DIMENSION),
+        pa.field("aspect_contextuel", _DIMENSION),
+        pa.field("nature_saisine", _DIMENSION),
+        pa.field("reclamation_position_mediateur", _DIMENSION),
+        pa.field("impact_appui_mediateur", _DIMENSION),
+        pa.field("analyse", pa.large_string()),
+        pa.field("label", _DIMENSION),
+        pa.field("sous_label", _DIMENSION),
+        pa.field("lieu", _DIMENSION),
+        pa.field("label_proposition", pa.string()),
+        pa.field("sous_label_proposition", pa.string()),
+        pa.field("key_word_str", pa.string()),
+    ]
+)
+
+KEYWORDS_SCHEMA = pa.schema(
+    [
+        pa.field("id", pa.int64(), nullable=False),
+        pa.field("keyword", _DIMENSION),
+    ]
+)
+
+
+def is_text_type(type_: pa.DataType) -> bool:
+    """Vrai pour les colonnes texte (string, large_string ou dictionnaire de chaînes)."""
+    if pa.types.is_dictionary(type_):
+        type_ = type_.value_type
+    return pa.types.is_string(type_) or pa.types.is_large_string(type_)
+
 
 def slugify(name: str) -> str:
     """Convertit un libellé libre en snake_case ASCII stable."""
@@ -59,13 +126,20 @@ def slugify(name: str) -> str:
     return normalized
 
 
+@lru_cache(maxsize=None)
 def map_field(name: str) -> str:
-    """Retourne le nom de champ normalisé (mapping explicite ou slug)."""
+    """Retourne le nom de champ normalisé (mapping explicite ou slug), mémoïsé."""
     if name in FIELD_MAPPING:
         return FIELD_MAPPING[name]
     return slugify(name)
 
 
+@lru_cache(maxsize=1024)
+def key_mapping(keys: Tuple[str, ...]) -> Tuple[str, ...]:
+    """Noms normalisés d'un jeu de clés source (calculé une fois par jeu distinct)."""
+    return tuple(map_field(key) for key in keys)
+
+
 def parse_date(value) -> dt.date | None:
     """Essaie de parser une date au format ISO (YYYY-MM-DD) ou proche."""
     if value is None or value == "":
@@ -82,7 +156,7 @@ def parse_date(value) -> dt.date | None:
             return None
     if isinstance(value, str):
         value = value.strip()
-        for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d"):
+        for fmt in DATE_FORMATS:
             try:
                 return dt.datetime.strptime(value[:10], fmt).date()
             except ValueError:
@@ -95,6 +169,50 @@ def parse_date(value) -> dt.date | None:
     return None
 
 
+def detect_date_format(values: Sequence) -> str | None:
+    """Format de DATE_FORMATS de la première chaîne non vide qui en respecte un."""
+    for value in values:
+        if not isinstance(value, str) or not value.strip():
+            continue
+        text = value.strip()[:10]
+        for fmt in DATE_FORMATS:
+            try:
+                dt.datetime.strptime(text, fmt)
+                return fmt
+            except ValueError:
+                continue
+    return None
+
+
+def parse_date_column(values: Sequence) -> List[dt.date | None]:
+    """
+    Parse une colonne de dates avec le format détecté une fois pour la
+    colonne ; les valeurs qui ne le respectent pas (ou non textuelles)
+    passent par parse_date. Les formats étant exclusifs, le résultat est
+    celui de parse_date valeur par valeur.
+    """
+    fmt = detect_date_format(values)
+    if fmt == "%Y-%m-%d":
+        def fast(text: str) -> dt.date:
+            return dt.date.fromisoformat(text)
+    elif fmt is not None:
+        def fast(text: str) -> dt.date:
+            return dt.datetime.strptime(text, fmt).date()
+    else:
+        return [parse_date(v) for v in values]
+
+    out: List[dt.date | None] = []
+    for value in values:
+        if isinstance(value, str):
+            try:
+                out.append(fast(value.strip()[:10]))
+                continue
+            except ValueError:
+                pass
+        out.append(parse_date(value))
+    return out
+
+
 def normalize_keywords(value) -> List[str]:
     """Transforme le champ key_word sous forme liste de chaînes normalisées."""
     if value is None:
@@ -102,49 +220,84 @@ def normalize_keywords(value) -> List[str]:
     if isinstance(value, list):
         raw_values = value
     elif isinstance(value, str):
-        raw_values = re.split(r"[;,]", value)
+        raw_values = _KEYWORD_SEPARATORS.split(value)
     else:
         raw_values = [str(value)]
-    keywords = [v.strip().lower() for v in raw_values if v and str(v).strip()]
-    # Filtrer doublons tout en conservant l'ordre
-    seen = set()
-    uniq: List[str] = []
-    for kw in keywords:
-        if kw not in seen:
-            uniq.append(kw)
-            seen.add(kw)
-    return uniq
+    # Doublons filtrés en conservant l'ordre
+    return list(dict.fromkeys(v.strip().lower() for v in raw_values if v and str(v).strip()))
 
 
-def normalize_record(record: Dict) -> Tuple[Dict, List[Dict[str, str]]]:
+def normalize_columns(records: Sequence[Dict]) -> Tuple[Dict[str, List], Dict[str, List], List[int]]:
     """
-    Normalise un enregistrement brut.
+    Normalise un lot d'enregistrements bruts en colonnes.
 
-    Retourne (main_row, keywords_rows). main_row inclut key_word_str.
+    Les enregistrements sont regroupés par jeu de clés : le mapping des noms
+    est calculé une fois par jeu (key_mapping) et les valeurs sont extraites
+    en bloc. Les dates sont parsées par colonne (parse_date_column) et les
+    mots-clés normalisés sur toute la colonne.
+
+    Retourne (colonnes principales, colonnes keywords {"id", "keyword",
+    "_row"}, positions des enregistrements rejetés faute d'id). Les colonnes
+    principales incluent key_word_str ; `_row` est la position, parmi les
+    enregistrements retenus, de la saisine portant le mot-clé.
     """
-    norm: Dict = {}
-    keyword_list: List[str] = []
+    n = len(records)
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for i, record in enumerate(records):
+        groups.setdefault(tuple(record), []).append(i)
 
-    for raw_key, raw_val in record.items():
-        norm_key = map_field(raw_key)
-        if norm_key == "key_word":
-            keyword_list = normalize_keywords(raw_val)
+    columns: Dict[str, List] = {}
+    for keys, positions in groups.items():
+        if not keys:
             continue
+        getter = itemgetter(*keys)
+        rows = [getter(records[i]) for i in positions]
+        values = list(zip(*rows)) if len(keys) > 1 else [rows]
+        # Clés dans l'ordre de l'enregistrement : la dernière clé d'un même
+        # champ normalisé l'emporte, comme dans la version par enregistrement.
+        for name, column_values in zip(key_mapping(keys), values):
+            column = columns.get(name)
+            if column is None:
+                column = columns[name] = [None] * n
+            if len(positions) == n:
+                column[:] = column_values
+            else:
+                for i, value in zip(positions, column_values):
+                    column[i] = value
 
-        if norm_key in DATE_FIELDS:
-            norm[norm_key] = parse_date(raw_val)
-        else:
-            norm[norm_key] = raw_val
+    ids = columns.get("id", [None] * n)
+    rejected = [i for i, value in enumerate(ids) if value is None]
+    if rejected:
+        kept = [i for i, value in enumerate(ids) if value is not None]
+        columns = {name: [column[i] for i in kept] for name, column in columns.items()}
+        ids = columns.get("id", [])
 
-    if "id" not in norm:
-        raise ValueError("Champ 'id' manquant dans l'enregistrement.")
+    for name in DATE_FIELDS & columns.keys():
+        columns[name] = parse_date_column(columns[name])
 
-    # key_word_str pour recherche simple
-    norm["key_word_str"] = " ".join(keyword_list) if keyword_list else None
+    keyword_lists = [normalize_keywords(v) for v in columns.pop("key_word", [None] * len(ids))]
+    columns["key_word_str"] = [" ".join(k) if k else None for k in keyword_lists]
+    keyword_columns = {
+        "id": [i for i, kws in zip(ids, keyword_lists) for _ in kws],
+        "keyword": [kw for kws in keyword_lists for kw in kws],
+        "_row": [pos for pos, kws in enumerate(keyword_lists) for _ in kws],
+    }
+    return columns, keyword_columns, rejected
 
-    # Table enfant keywords
-    keyword_rows = [{"id": norm["id"], "keyword": kw} for kw in keyword_list]
 
+def normalize_record(record: Dict) -> Tuple[Dict, List[Dict[str, str]]]:
+    """
+    Normalise un enregistrement brut (enveloppe de normalize_columns).
+
+    Retourne (main_row, keywords_rows). main_row inclut key_word_str.
+    """
+    columns, keyword_columns, rejected = normalize_columns([record])
+    if rejected:
+        raise ValueError("Champ 'id' manquant dans l'enregistrement.")
+    norm = {name: column[0] for name, column in columns.items()}
+    keyword_rows = [
+        {"id": i, "keyword": kw} for i, kw in zip(keyword_columns["id"], keyword_columns["keyword"])
+    ]
     return norm, keyword_rows
 
 
@@ -153,10 +306,19 @@ __all__ = [
     "DATE_FIELDS",
     "TEXT_FIELDS",
     "LIST_FIELDS",
+    "DATE_FORMATS",
+    "DIMENSION_FIELDS",
+    "SAISINES_SCHEMA",
+    "KEYWORDS_SCHEMA",
+    "is_text_type",
     "slugify",
     "map_field",
+    "key_mapping",
     "parse_date",
+    "detect_date_format",
+    "parse_date_column",
     "normalize_keywords",
+    "normalize_columns",
     "normalize_record",
 ]
 
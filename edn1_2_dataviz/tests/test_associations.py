@@ -0,0 +1,44 @@
+import json
+import math
+from pathlib import Path
+
+import duckdb
+import pytest
+
+from edn1_2_dataviz.etl import associations, ingest_json_to_parquet
+
+
+def test_associations_tables(tmp_path: Path):
+    input_dir, parquet_dir = tmp_path / "input", tmp_path / "parquet"
+    rows = [
+        {"id": 1, "label": "rh", "Pôle en charge": "P1", "key_word": ["paie", "retard"]},
+        {"id": 2, "label": "rh", "Pôle en charge": "P1", "key_word": ["paie", "retard"]},
+        {"id": 3, "label": "rh", "Pôle en charge": "P2", "key_word": ["paie", "mutation"]},
+        {"id": 4, "label": "scol", "Pôle en charge": "P2", "key_word": ["inscription", "retard"]},
+        {"id": 5, "label": "scol", "key_word": ["inscription"]},
+    ]
+    input_dir.mkdir()
+    (input_dir / "data.jsonl").write_text("\n".join(json.dumps(r) for r in rows), encoding="utf-8")
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+
+    counts = associations.run(parquet_dir, top_k=1, min_support=2)
+    assert counts == {"cooccurrence.parquet": 2, "keyword_label.parquet": 3, "keyword_pole_en_charge.parquet": 2}
+
+    con = duckdb.connect()
+    out = associations.associations_dir(parquet_dir)
+    pairs = con.execute(
+        f"SELECT keyword, other, n_pair, lift, pmi FROM read_parquet('{out / 'cooccurrence.parquet'}')"
+    ).fetchall()
+    # paie (3 saisines) et retard (3) ensemble dans 2 saisines sur 5
+    assert [p[:3] for p in pairs] == [("paie", "retard", 2), ("retard", "paie", 2)]
+    assert pairs[0][3] == pytest.approx(2 * 5 / (3 * 3))
+    assert pairs[0][4] == pytest.approx(math.log(2 * 5 / (3 * 3)))
+
+    labels = con.execute(
+        f"SELECT keyword, label, n, n_keyword, n_value, lift FROM read_parquet('{out / 'keyword_label.parquet'}')"
+    ).fetchall()
+    assert labels == [
+        ("inscription", "scol", 2, 2, 2, pytest.approx(2.5)),
+        ("paie", "rh", 3, 3, 3, pytest.approx(5 / 3)),
+        ("retard", "rh", 2, 3, 3, pytest.approx(10 / 9)),
+    ]
@@ -0,0 +1,96 @@
+import json
+from pathlib import Path
+
+import duckdb
+
+from edn1_2_dataviz.app.utils import keyword_search
+from edn1_2_dataviz.app.utils.filters import search_index_fields
+from edn1_2_dataviz.app.utils.query_builder import QueryBuilder
+from edn1_2_dataviz.etl import build_duckdb, ingest_json_to_parquet
+
+
+def _ingest(input_dir: Path, parquet_dir: Path, rows):
+    input_dir.mkdir(parents=True, exist_ok=True)
+    (input_dir / "data.jsonl").write_text("\n".join(json.dumps(r) for r in rows), encoding="utf-8")
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+
+
+def test_build_publishes_new_version_and_collects_old_ones(tmp_path: Path):
+    input_dir, parquet_dir, db_dir = tmp_path / "input", tmp_path / "parquet", tmp_path / "duckdb"
+    _ingest(input_dir, parquet_dir, [
+        {"id": 2, "Date arrivée": "2022-03-01", "key_word": ["b"]},
+        {"id": 1, "Date arrivée": "2022-01-01", "key_word": ["a"]},
+    ])
+    first = build_duckdb.run(db_dir=db_dir, parquet_dir=parquet_dir, keep=1)
+    assert build_duckdb.current_version(db_dir) == first
+
+    # Un lecteur garde sa version pendant la build suivante
+    reader = duckdb.connect(str(first), read_only=True)
+    _ingest(input_dir, parquet_dir, [{"id": 3, "Date arrivée": "2021-12-01"}])
+    second = build_duckdb.run(db_dir=db_dir, parquet_dir=parquet_dir, keep=1)
+    assert reader.execute("SELECT count(*) FROM v_saisines").fetchone()[0] == 2
+    reader.close()
+
+    assert build_duckdb.current_version(db_dir) == second
+    assert build_duckdb.versions(db_dir) == [second]
+    con = duckdb.connect(str(second), read_only=True)
+    tables = {r[0]: r[1] for r in con.execute("SELECT table_name, table_type FROM information_schema.tables").fetchall()}
+    assert {name: tables[name] for name in ("saisines", "keywords", "v_saisines", "v_keywords")} == {
+        "saisines": "BASE TABLE", "keywords": "BASE TABLE", "v_saisines": "VIEW", "v_keywords": "VIEW",
+    }
+    assert [r[0] for r in con.execute("SELECT id FROM saisines").fetchall()] == [3, 1, 2]
+    assert con.execute("SELECT keyword FROM v_keywords").fetchall() == [("a",), ("b",)]
+
+
+def test_search_index_matches_tokens_and_ranks(tmp_path: Path):
+    input_dir, parquet_dir, db_dir = tmp_path / "input", tmp_path / "parquet", tmp_path / "duckdb"
+    _ingest(input_dir, parquet_dir, [
+        {"id": 1, "Date arrivée": "2022-01-01", "Analyse": "Problème de facturation"},
+        {"id": 2, "Date arrivée": "2022-01-02", "Analyse": "Facture impayée, facture contestée", "key_word": ["école"]},
+        {"id": 3, "Date arrivée": "2022-01-03", "Analyse": "Demande d'information"},
+        {"id": 4, "Date arrivée": "2022-01-04", "lieu": "Paris"},
+    ])
+    con = duckdb.connect(str(build_duckdb.run(db_dir=db_dir, parquet_dir=parquet_dir)), read_only=True)
+    assert search_index_fields(con) == ["analyse", "key_word_str"]
+
+    indexed = QueryBuilder(["analyse", "key_word_str"], search_index_fields(con))
+    plain = QueryBuilder(["analyse", "key_word_str"])
+
+    def ids(qb, text, match_all=False, rank=False):
+        query = qb.exploration_query({}, text, match_all, rank=rank)
+        return [r[0] for r in con.execute(query.sql, query.params).fetchall()]
+
+    # Préfixe de token, accents et casse ignorés ; ici même résultat que ILIKE
+    assert ids(indexed, "FACTUR") == ids(plain, "factur") == [2, 1]
+    # Mais pas de sous-chaîne au milieu d'un token, contrairement à ILIKE
+    assert ids(indexed, "turation") == []
+    assert ids(plain, "turation") == [1]
+    assert ids(indexed, "ecole") == [2]
+    assert ids(indexed, "factur d'info") == [3, 2, 1]
+    assert ids(indexed, "factur d'info", match_all=True) == []
+    # BM25 : deux occurrences de "facture" dans un document plus court
+    assert ids(indexed, "factur", rank=True) == [2, 1]
+    assert ids(indexed, "factur probleme", rank=True)[0] == 1
+
+
+def test_keyword_index_completes_and_tolerates_typos(tmp_path: Path):
+    input_dir, parquet_dir, db_dir = tmp_path / "input", tmp_path / "parquet", tmp_path / "duckdb"
+    _ingest(input_dir, parquet_dir, [
+        {"id": 1, "Date arrivée": "2022-01-01", "key_word": ["facture", "école"]},
+        {"id": 2, "Date arrivée": "2022-01-02", "key_word": ["facture", "facturation"]},
+        {"id": 3, "Date arrivée": "2022-01-03", "key_word": ["retraite"]},
+    ])
+    con = duckdb.connect(str(build_duckdb.run(db_dir=db_dir, parquet_dir=parquet_dir)), read_only=True)
+    assert keyword_search.has_keyword_index(con)
+    assert con.execute("SELECT keyword_id, keyword FROM keyword_dict").fetchall() == [
+        (1, "école"), (2, "facturation"), (3, "facture"), (4, "retraite"),
+    ]
+
+    assert keyword_search.complete_keywords(con, "FACT") == [("facture", 2), ("facturation", 1)]
+    assert keyword_search.complete_keywords(con, "eco") == [("école", 1)]
+    assert keyword_search.fuzzy_keywords(con, "factrue")[0][0] == "facture"
+    assert keyword_search.suggest_keywords(con, "retriate") == ["retraite"]
+
+    qb = QueryBuilder(["analyse"])
+    query = qb.exploration_query({}, "", False, keywords=["école", "retraite"])
+    assert [r[0] for r in con.execute(query.sql, query.params).fetchall()] == [3, 1]
@@ -1,8 +1,13 @@
+import datetime as dt
+import gzip
+import json
 from pathlib import Path
 
 import duckdb
+import pyarrow.parquet as pq
+import pytest
 
-from edn1_2_dataviz.etl import ingest_json_to_parquet
+from edn1_2_dataviz.etl import dataset, ingest_json_to_parquet, manifest, schema
 
 
 def _write_jsonl(path: Path, rows):
@@ -12,7 +17,20 @@ def _write_jsonl(path: Path, rows):
             f.write(f"{row}\n".replace("'", '"'))
 
 
-def test_deduplication_on_id(tmp_path: Path):
+def _read(parquet_dir: Path):
+    """Saisines et mots-clés lus via les requêtes fusionnées du dataset."""
+    con = duckdb.connect()
+    main = con.execute(
+        f"SELECT * FROM ({dataset.saisines_sql(parquet_dir)}) ORDER BY date_arrivee NULLS LAST, id"
+    ).arrow().read_all().to_pylist()
+    keywords = con.execute(
+        f"SELECT * FROM ({dataset.keywords_sql(parquet_dir)}) ORDER BY id, keyword"
+    ).arrow().read_all().to_pylist()
+    return main, keywords
+
+
+@pytest.mark.parametrize("engine", ingest_json_to_parquet.ENGINES)
+def test_deduplication_on_id(tmp_path: Path, engine: str):
     input_dir = tmp_path / "input"
     parquet_dir = tmp_path / "parquet"
     rows = [
@@ -31,13 +49,230 @@ def test_deduplication_on_id(tmp_path: Path):
     ]
     _write_jsonl(input_dir / "data.jsonl", rows)
 
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir, engine=engine)
+
+    main, keywords = _read(parquet_dir)
+    assert len(main) == 1
+    assert main[0]["analyse"] == "plus récent"
+    # Mots-clés de la ligne retenue seulement, comme entre deux ingestions
+    assert {k["keyword"] for k in keywords} == {"b"}
+
+    split_dir = tmp_path / "parquet-split"
+    for i, row in enumerate(rows):
+        _write_jsonl(tmp_path / f"input-{i}" / "data.jsonl", [row])
+        ingest_json_to_parquet.run(input_dir=tmp_path / f"input-{i}", parquet_dir=split_dir, engine=engine)
+    assert _read(split_dir) == (main, keywords)
+
+
+def test_json_array_streamed_in_small_chunks(tmp_path: Path):
+    path = tmp_path / "data.json"
+    rows = [{"id": i, "Analyse": "texte [avec] des, séparateurs" * (i % 3)} for i in range(20)]
+    path.write_text(json.dumps(rows, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    with path.open("r", encoding="utf-8") as f:
+        streamed = list(ingest_json_to_parquet._iter_json_payload(f, path, chunk_chars=7))
+
+    assert streamed == rows
+
+
+def test_stage_records_uses_declared_schema(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    rows = [{"id": i, "Date arrivée": "2022-01-01", "key_word": ["x"]} for i in range(10)]
+    rows.append({"id": "42", "Catégorie": 7, "Champ inconnu": "ignoré"})
+    _write_jsonl(input_dir / "data.jsonl", rows)
+
+    staging = tmp_path / "staging"
+    count = ingest_json_to_parquet.stage_records(input_dir, staging, batch_size=4)
+
+    assert count == 11
+    main = pq.ParquetFile(staging / "saisines" / "frag-00000.parquet")
+    assert main.schema_arrow == ingest_json_to_parquet.STAGING_SAISINES_SCHEMA
+    assert main.metadata.num_row_groups == 3
+    table = main.read()
+    last = table.slice(10).to_pylist()[0]
+    assert last["id"] == 42 and last["categorie"] == "7"
+    assert last["_file"] == 0 and last["_row"] == 10
+    assert pq.read_table(staging / "keywords" / "frag-00000.parquet").num_rows == 10
+
+
+def test_parallel_staging_is_deterministic(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    # Même id et même date dans deux fichiers : le dernier fichier l'emporte
+    _write_jsonl(input_dir / "a.jsonl", [{"id": 1, "Date arrivée": "2022-01-01", "Analyse": "a"}])
+    _write_jsonl(input_dir / "b.jsonl", [{"id": 1, "Date arrivée": "2022-01-01", "Analyse": "b"}])
+    with gzip.open(input_dir / "c.jsonl.gz", "wt", encoding="utf-8") as f:
+        f.write(json.dumps({"id": 2, "Date arrivée": "2022-03-01", "key_word": ["gz"]}) + "\n")
+
+    results = []
+    for workers in (1, 2):
+        parquet_dir = tmp_path / f"parquet-{workers}"
+        ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir, workers=workers)
+        results.append(_read(parquet_dir)[0])
+
+    assert results[0] == results[1]
+    assert [(r["id"], r["analyse"]) for r in results[0]] == [(1, "b"), (2, None)]
+    assert results[0][0].keys() == set(schema.SAISINES_SCHEMA.names)
+
+
+def test_duckdb_engine_matches_python(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    rows = [
+        {"id": 1, "Date arrivée": "2022-01-31", "Pôle en charge": "Pôle A", "key_word": [" A", "b", "a", ""]},
+        {"id": "2", "Date d'arrivée": "31/01/2022 10:00", "Catégorie": 7, "keywords": "x; Y,x"},
+        {"id": 3, "Date arrivée": 1650000000, "Date clôture fiche": "2022/05/02", "Champ libre": "z"},
+        {"id": 4, "Date arrivée": "pas une date", "key_word": None, "Analyse": "texte"},
+        {"Analyse": "sans id"},
+        {"id": 1, "Date arrivée": "2022-01-31", "Analyse": "doublon, même date"},
+    ]
+    input_dir.mkdir()
+    (input_dir / "a.jsonl").write_text("\n".join(json.dumps(r) for r in rows[:3]), encoding="utf-8")
+    (input_dir / "b.json").write_text(json.dumps(rows[3:], ensure_ascii=False), encoding="utf-8")
+
+    tables = {}
+    for engine in ingest_json_to_parquet.ENGINES:
+        parquet_dir = tmp_path / engine
+        ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir, engine=engine)
+        tables[engine] = _read(parquet_dir)
+
+    assert tables["duckdb"] == tables["python"]
+    main, keywords = tables["python"]
+    assert [r["id"] for r in main] == [1, 2, 3, 4]
+    assert main[0]["analyse"] == "doublon, même date"
+    # Le doublon retenu pour l'id 1 n'a pas de mots-clés
+    assert {(k["id"], k["keyword"]) for k in keywords} == {(2, "x"), (2, "y")}
+
+
+def test_ingest_appends_deltas_and_compacts(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    parquet_dir = tmp_path / "parquet"
+    _write_jsonl(input_dir / "data.jsonl", [
+        {"id": 1, "Date arrivée": "2022-01-10", "Analyse": "v1", "key_word": ["a"]},
+        {"id": 2, "Date arrivée": "2023-05-01", "Analyse": "autre partition"},
+    ])
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    first = set(dataset.fragments(parquet_dir, dataset.SAISINES_DIR))
+
+    # Même date : la nouvelle ingestion l'emporte ; l'existant n'est pas réécrit
+    _write_jsonl(input_dir / "data.jsonl", [{"id": 1, "Date arrivée": "2022-01-10", "Analyse": "v2", "key_word": ["b"]}])
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    files = set(dataset.fragments(parquet_dir, dataset.SAISINES_DIR))
+    assert first < files
+    assert {p.parent.relative_to(parquet_dir).as_posix() for p in files} == {
+        "saisines/annee=2022/mois=1", "saisines/annee=2023/mois=5",
+    }
+    before = _read(parquet_dir)
+    assert [(r["id"], r["analyse"]) for r in before[0]] == [(1, "v2"), (2, "autre partition")]
+    # Mots-clés de la version retenue seulement
+    assert [k["keyword"] for k in before[1]] == ["b"]
+
+    assert dataset.compact(parquet_dir) == 1
+    assert len(dataset.fragments(parquet_dir, dataset.SAISINES_DIR)) == 2
+    assert _read(parquet_dir) == before
+    (kw_fragment,) = dataset.fragments(parquet_dir, dataset.KEYWORDS_DIR)
+    assert pq.read_table(kw_fragment).to_pylist() == [{"id": 1, "keyword": "b", "_seq": 2}]
+
+
+def test_keywords_follow_latest_version_across_partitions(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    parquet_dir = tmp_path / "parquet"
+    _write_jsonl(input_dir / "data.jsonl", [{"id": 1, "Date arrivée": "2022-01-10", "key_word": ["ancien"]}])
     ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    _write_jsonl(input_dir / "data.jsonl", [{"id": 1, "Date arrivée": "2022-03-10", "key_word": ["nouveau"]}])
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+
+    expected = [{"id": 1, "keyword": "nouveau"}]
+    assert _read(parquet_dir)[1] == expected
+    # La compaction complète retire la version supplantée et ses mots-clés
+    dataset.compact(parquet_dir, full=True)
+    keywords = [
+        row for path in dataset.fragments(parquet_dir, dataset.KEYWORDS_DIR) for row in pq.read_table(path).to_pylist()
+    ]
+    assert [(k["id"], k["keyword"]) for k in keywords] == [(1, "nouveau")]
+    assert _read(parquet_dir)[1] == expected
+
 
+def test_legacy_parquet_is_migrated(tmp_path: Path):
+    parquet_dir = tmp_path / "parquet"
+    parquet_dir.mkdir()
     con = duckdb.connect()
-    df = con.execute(f"SELECT * FROM read_parquet('{parquet_dir / 'saisines.parquet'}')").df()
-    assert len(df) == 1
-    assert df.loc[0, "analyse"] == "plus récent"
+    con.execute(
+        f"COPY (SELECT 7::BIGINT AS id, DATE '2021-03-04' AS date_arrivee, NULL::DATE AS date_cloture, 'ancien' AS analyse) "
+        f"TO '{parquet_dir / 'saisines.parquet'}' (FORMAT 'parquet')"
+    )
+    con.execute(
+        f"COPY (SELECT 7::BIGINT AS id, 'kw' AS keyword) TO '{parquet_dir / 'keywords.parquet'}' (FORMAT 'parquet')"
+    )
+
+    assert dataset.migrate_legacy(parquet_dir)
+    assert not (parquet_dir / "saisines.parquet").exists()
+    main, keywords = _read(parquet_dir)
+    assert main == [{"id": 7, "date_arrivee": dt.date(2021, 3, 4), "date_cloture": None, "analyse": "ancien"}]
+    assert keywords == [{"id": 7, "keyword": "kw"}]
+    assert dataset.next_seq(parquet_dir) == 1
+
+
+def test_manifest_skips_unchanged_files(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    parquet_dir = tmp_path / "parquet"
+    _write_jsonl(input_dir / "a.jsonl", [{"id": 1, "Date arrivée": "2022-01-01"}, {"id": 2}])
+    _write_jsonl(input_dir / "b.jsonl", [{"id": 3, "Date arrivée": "2022-02-01"}])
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    entries = manifest.load_manifest(parquet_dir)
+    assert {name: e["rows"] for name, e in entries.items()} == {"a.jsonl": 2, "b.jsonl": 1}
+    files = set(dataset.fragments(parquet_dir, dataset.SAISINES_DIR))
+
+    # Rien de changé, puis simple touch : aucun nouveau delta
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    (input_dir / "a.jsonl").touch()
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    assert set(dataset.fragments(parquet_dir, dataset.SAISINES_DIR)) == files
+
+    # Fichier remplacé : seul lui est retraité ; fichier disparu : données conservées
+    _write_jsonl(input_dir / "b.jsonl", [{"id": 3, "Date arrivée": "2022-02-01", "Analyse": "corrigé"}])
+    (input_dir / "a.jsonl").unlink()
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+    entries = manifest.load_manifest(parquet_dir)
+    assert list(entries) == ["b.jsonl"] and entries["b.jsonl"]["seq"] == 2
+    main, _ = _read(parquet_dir)
+    assert [(r["id"], r["analyse"]) for r in main] == [(1, None), (3, "corrigé"), (2, None)]
+
+
+def test_enrichment_journal_is_ingested(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    parquet_dir = tmp_path / "parquet"
+    journal = tmp_path / "output" / "output_tri_structure2.ndjson"
+    _write_jsonl(input_dir / "a.jsonl", [{"id": 1, "Date arrivée": "2022-01-01"}])
+    _write_jsonl(journal, [{"id": 2, "Date arrivée": "2022-02-01", "key_word": ["k"]}])
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir, journal=journal)
+    assert list(manifest.load_manifest(parquet_dir)) == ["a.jsonl", "output_tri_structure2.ndjson"]
+
+    # Batch ajouté au journal : seul le journal est retraité
+    with journal.open("a", encoding="utf-8") as f:
+        f.write('{"id": 3, "Date arrivée": "2022-03-01"}\n')
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir, journal=journal)
+    main, keywords = _read(parquet_dir)
+    assert [r["id"] for r in main] == [1, 2, 3]
+    assert [(k["id"], k["keyword"]) for k in keywords] == [(2, "k")]
 
-    kw_df = con.execute(f"SELECT * FROM read_parquet('{parquet_dir / 'keywords.parquet'}')").df()
-    assert set(kw_df["keyword"]) == {"a", "b"}
 
+def test_dataset_layout_is_tuned(tmp_path: Path):
+    input_dir = tmp_path / "input"
+    parquet_dir = tmp_path / "parquet"
+    rows = [
+        {"id": 100 - i, "Date arrivée": f"2022-03-{28 - i % 28:02d}", "label": f"l{i % 3}", "Analyse": "x" * 50}
+        for i in range(60)
+    ]
+    _write_jsonl(input_dir / "data.jsonl", rows)
+    ingest_json_to_parquet.run(input_dir=input_dir, parquet_dir=parquet_dir)
+
+    (fragment,) = dataset.fragments(parquet_dir, dataset.SAISINES_DIR)
+    con = duckdb.connect()
+    meta = dict(
+        con.execute(
+            "SELECT path_in_schema, any_value(compression) || '/' || bool_or(bloom_filter_offset IS NOT NULL) "
+            f"FROM parquet_metadata('{fragment}') GROUP BY 1"
+        ).fetchall()
+    )
+    assert meta["id"] == meta["label"] == "ZSTD/true"
+    dates = [r[0] for r in con.execute(f"SELECT date_arrivee FROM read_parquet('{fragment}')").fetchall()]
+    assert dates == sorted(dates)
@@ -31,3 +31,26 @@ def test_missing_id_raises():
     with pytest.raises(ValueError):
         schema.normalize_record({"Analyse": "test"})
 
+
+def test_normalize_columns_matches_normalize_record():
+    records = [
+        {"id": 1, "Date arrivée": "31/01/2022", "key_word": "A; b, a"},
+        {"Analyse": "sans id"},
+        {"id": 2, "Pôle en charge": "Pôle X", "Date arrivée": "2022-02-01"},
+        {"id": 3, "Date arrivée": "2022-03-01", "Date d'arrivée": "2022-03-02", "keywords": ["c"]},
+    ]
+    columns, keyword_columns, rejected = schema.normalize_columns(records)
+
+    assert rejected == [1]
+    assert columns["date_arrivee"] == [dt.date(2022, 1, 31), dt.date(2022, 2, 1), dt.date(2022, 3, 2)]
+    assert columns["pole_en_charge"] == [None, "Pôle X", None]
+    assert keyword_columns == {"id": [1, 1, 3], "keyword": ["a", "b", "c"], "_row": [0, 0, 2]}
+    for position, record in enumerate(r for r in records if "id" in r):
+        main, _ = schema.normalize_record(record)
+        expected = {name: column[position] for name, column in columns.items() if column[position] is not None}
+        assert {k: v for k, v in main.items() if v is not None} == expected
+
+
+def test_parse_date_column_falls_back_per_value():
+    values = ["31/01/2022", "2022-02-01", None, "pas une date"]
+    assert schema.parse_date_column(values) == [dt.date(2022, 1, 31), dt.date(2022, 2, 1), None, None]
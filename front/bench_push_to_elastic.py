@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+"""
+Benchmark du chargement _bulk de push_to_elastic.py contre le stand-in local
+(fake_elastic.py), sans Elasticsearch réel.
+
+Pour chaque couple (taille de batch, concurrence), une génération d'index
+neuve est construite à partir du même NDJSON ; le script mesure docs/s et
+octets/s (octets réellement reçus par le stand-in, renvois compris).
+
+Le stand-in tourne dans un processus séparé pour ne pas partager le GIL
+avec le chargeur.
+
+Usage :
+    python bench_push_to_elastic.py
+    python bench_push_to_elastic.py --docs 200000 --bulk-mb 1 5 10 --concurrency 1 2 4 8 --latency-ms 20
+    python bench_push_to_elastic.py ../back/data/output/output_tri_structure2.ndjson --reject-rate 0.01
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import requests
+
+import push_to_elastic as loader
+
+# ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
+FRONT_DIR = Path(__file__).resolve().parent
+FAKE_ELASTIC = FRONT_DIR / "fake_elastic.py"
+
+sys.path.insert(0, str(FRONT_DIR.parent / "back" / "tests"))
+from fake_gemini import MOTS_DOMAINE as MOTS  # noqa: E402  (même vocabulaire que l'audit Gemini)
+
+# ---------- CONFIG ----------
+DOCS = 50000
+BULK_MB = [1.0, 5.0, 10.0]
+CONCURRENCY = [1, 2, 4, 8]
+SERVER_START_TIMEOUT = 10.0  # secondes
+
+
+def generate_ndjson(path: Path, n_docs: int, seed: int = 0) -> None:
+    """Génère un NDJSON synthétique proche des documents enrichis."""
+    rng = random.Random(seed)
+    with path.open("w", encoding="utf-8") as f:
+        for i in range(n_docs):
+            doc = {
+                "id": i,
+                "Date arrivée": f"{rng.randint(2019, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+                "label": f"Label {rng.randint(1, 12)}",
+                "sous_label": f"Sous-label {rng.randint(1, 60)}",
+                "key_word": rng.sample(MOTS, 3),
+                "Analyse": " ".join(rng.choices(MOTS, k=rng.randint(40, 400))),
+            }
+            f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_fake_elastic(args) -> subprocess.Popen:
+    """Lance fake_elastic.py dans un sous-processus et attend qu'il réponde."""
+    port = free_port()
+    cmd = [
+        sys.executable, str(FAKE_ELASTIC), "--port", str(port),
+        "--reject-rate", str(args.reject_rate),
+        "--mapping-error-rate", str(args.mapping_error_rate),
+        "--latency-ms", str(args.latency_ms),
+        "--latency-ms-per-mb", str(args.latency_ms_per_mb),
+        "--seed", "0",
+    ]
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL)
+    loader.ES_URL = f"http://127.0.0.1:{port}"
+    deadline = time.time() + SERVER_START_TIMEOUT
+    while time.time() < deadline:
+        try:
+            requests.get(loader.ES_URL, timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("[ERREUR] Le stand-in Elasticsearch n'a pas démarré.")
+
+
+def received_bytes() -> int:
+    return requests.get(f"{loader.ES_URL}/_stats_fake").json()["bulk_bytes"]
+
+
+def run_once(files: List[Path], bulk_mb: float, concurrency: int, run_id: int, dead_letter_path: Path) -> dict:
+    """Construit une génération complète et mesure le chargement."""
+    session = loader.make_session(concurrency)
+    generation = loader.IndexGeneration(session, alias=f"bench-{run_id}")
+    plan = loader.SyncPlan(upserts={}, deletes=[])
+    dead_letter = loader.DeadLetter(dead_letter_path)
+    bytes_before = received_bytes()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # la progression du chargeur n'est pas utile ici
+        entries = loader.iter_actions(loader.iter_lines(files), generation, {}, plan, int(time.time() * 1000), False)
+        total = loader.load(session, entries, dead_letter, concurrency, int(bulk_mb * 1024 * 1024))
+    elapsed = time.perf_counter() - start
+    dead_letter.close()
+
+    sent = received_bytes() - bytes_before
+    with contextlib.redirect_stdout(io.StringIO()):
+        generation.discard()
+    session.close()
+    return {
+        "bulk_mb": bulk_mb,
+        "concurrency": concurrency,
+        "seconds": elapsed,
+        "indexed": total.indexed,
+        "retried": total.retried,
+        "failed": total.failed,
+        "docs_s": total.indexed / elapsed if elapsed else 0.0,
+        "mb_s": sent / elapsed / 1e6 if elapsed else 0.0,
+    }
+
+
+def print_table(results: List[dict]) -> None:
+    print("=" * 78)
+    print(f"{'bulk (Mo)':>9} {'conc.':>6} {'durée (s)':>10} {'docs/s':>10} {'Mo/s':>8} {'renvois':>8} {'échecs':>7}")
+    print("-" * 78)
+    for r in results:
+        print(
+            f"{r['bulk_mb']:>9.1f} {r['concurrency']:>6} {r['seconds']:>10.2f} "
+            f"{r['docs_s']:>10.0f} {r['mb_s']:>8.1f} {r['retried']:>8} {r['failed']:>7}"
+        )
+    print("=" * 78)
+    best = max(results, key=lambda r: r["docs_s"])
+    print(f"[OK] Meilleur débit : bulk {best['bulk_mb']} Mo, concurrence {best['concurrency']} "
+          f"({best['docs_s']:.0f} docs/s)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark du chargement _bulk contre le stand-in Elasticsearch.")
+    parser.add_argument("inputs", nargs="*", type=Path, help="NDJSON à charger (défaut : jeu synthétique).")
+    parser.add_argument("--docs", type=int, default=DOCS, help="Taille du jeu synthétique.")
+    parser.add_argument("--bulk-mb", type=float, nargs="+", default=BULK_MB, help="Tailles de batch testées (Mo).")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY, help="Concurrences testées.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latence fixe par requête _bulk.")
+    parser.add_argument("--latency-ms-per-mb", type=float, default=0.0, help="Latence par Mo reçu.")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="Part des items rejetés en 429.")
+    parser.add_argument("--mapping-error-rate", type=float, default=0.0, help="Part des items en erreur de mapping.")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory(prefix="bench_es_") as tmp:
+        tmp = Path(tmp)
+        if args.inputs:
+            files = loader.resolve_inputs(args.inputs)
+            if not files:
+                raise SystemExit("[ERREUR] Aucun fichier NDJSON trouvé.")
+        else:
+            files = [tmp / "bench.ndjson"]
+            print(f"[INFO] Génération d'un NDJSON synthétique ({args.docs} documents)...")
+            generate_ndjson(files[0], args.docs)
+        size_mb = sum(p.stat().st_size for p in files) / 1e6
+        print(f"[INFO] Entrée : {', '.join(p.name for p in files)} ({size_mb:.1f} Mo)")
+
+        proc = start_fake_elastic(args)
+        results = []
+        try:
+            run_id = 0
+            for bulk_mb in args.bulk_mb:
+                for concurrency in args.concurrency:
+                    run_id += 1
+                    print(f"[INFO] Run {run_id} : bulk {bulk_mb} Mo, concurrence {concurrency}...")
+                    results.append(run_once(files, bulk_mb, concurrency, run_id, tmp / "dead_letter.ndjson"))
+        finally:
+            proc.terminate()
+            proc.wait()
+
+    print_table(results)
+
+
+if __name__ == "__main__":
+    main()
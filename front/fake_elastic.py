@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+"""
+Stand-in Elasticsearch local (HTTP) pour tester et mesurer push_to_elastic.py
+sans lancer le docker-compose.
+
+Implémente le strict nécessaire du chargeur :
+- GET /                          : infos cluster
+- HEAD / PUT / DELETE /{index}   : existence, création, suppression
+- GET / PUT /{index}/_settings   : réglages (refresh, réplicas)
+- POST /{index}/_refresh, /_forcemerge, GET /{index}/_count
+- POST /_bulk                    : index / create / delete, versions externes,
+                                   rejets 429 et erreurs de mapping injectables
+- GET /_alias/{alias}, POST /_aliases (add / remove / remove_index),
+  GET /_cat/indices/{motif}
+- GET /_stats_fake               : compteurs du stand-in (requêtes, octets, rejets)
+
+Les documents ne sont pas conservés (seulement id, version et taille) : le
+stand-in tient des millions de documents en mémoire.
+
+Usage :
+    python fake_elastic.py --port 9200 --reject-rate 0.02 --mapping-error-rate 0.001 --latency-ms 20
+"""
+
+import argparse
+import fnmatch
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+
+@dataclass
+class FakeElasticConfig:
+    reject_rate: float = 0.0          # part des items _bulk rejetés en 429
+    mapping_error_rate: float = 0.0   # part des items _bulk en erreur de mapping (400)
+    request_reject_rate: float = 0.0  # part des requêtes _bulk rejetées en bloc (429)
+    latency_ms: float = 0.0           # latence fixe ajoutée à chaque requête _bulk
+    latency_ms_per_mb: float = 0.0    # latence proportionnelle au volume reçu
+    validate_source: bool = False     # parse le document source (erreur 400 si invalide)
+    seed: Optional[int] = None
+
+
+@dataclass
+class FakeIndex:
+    settings: Dict[str, str] = field(default_factory=lambda: {
+        "index.refresh_interval": "1s",
+        "index.number_of_replicas": "1",
+        "index.number_of_shards": "1",
+    })
+    mappings: Dict = field(default_factory=dict)
+    docs: Dict[str, Tuple[int, int]] = field(default_factory=dict)  # id -> (version, taille)
+    auto_ids: int = 0
+
+
+def _flatten(prefix: str, value, out: Dict[str, str]):
+    if isinstance(value, dict):
+        for k, v in value.items():
+            _flatten(f"{prefix}.{k}" if prefix else k, v, out)
+    else:
+        out[prefix] = str(value)
+
+
+class FakeElasticState:
+    """État en mémoire du cluster (protégé par un verrou)."""
+
+    def __init__(self, config: FakeElasticConfig):
+        self.config = config
+        self.indices: Dict[str, FakeIndex] = {}
+        self.aliases: Dict[str, Set[str]] = {}
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.stats = {"bulk_requests": 0, "bulk_bytes": 0, "items": 0, "rejected": 0, "mapping_errors": 0}
+
+    def resolve(self, expr: str) -> List[str]:
+        """Résout une liste d'index / alias / motifs séparés par des virgules."""
+        names: List[str] = []
+        for part in expr.split(","):
+            if part in self.aliases:
+                names.extend(sorted(self.aliases[part]))
+            elif any(c in part for c in "*?"):
+                names.extend(sorted(fnmatch.filter(self.indices, part)))
+            elif part in self.indices:
+                names.append(part)
+        return names
+
+    def write_target(self, name: str) -> Optional[str]:
+        """Index réel pour une écriture (alias vers un seul index accepté)."""
+        if name in self.aliases:
+            targets = self.aliases[name]
+            return next(iter(targets)) if len(targets) == 1 else None
+        if name not in self.indices:
+            self.indices[name] = FakeIndex()  # création automatique, comme ES
+        return name
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeElasticState = None
+
+    def log_message(self, *args):
+        pass
+
+    # ----------------- utilitaires -----------------
+
+    def _send(self, status: int, payload=None):
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _error(self, status: int, err_type: str, reason: str):
+        self._send(status, {"error": {"type": err_type, "reason": reason}, "status": status})
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _json_body(self):
+        body = self._body()
+        return json.loads(body) if body else {}
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        return parts, query
+
+    # ----------------- verbes -----------------
+
+    def do_HEAD(self):
+        parts, _ = self._route()
+        with self.state.lock:
+            found = len(parts) == 1 and bool(self.state.resolve(parts[0]))
+        self._send(200 if found else 404)
+
+    def do_GET(self):
+        parts, query = self._route()
+        st = self.state
+        with st.lock:
+            if not parts:
+                return self._send(200, {"name": "fake-elastic", "version": {"number": "8.15.0"}, "tagline": "stand-in"})
+            if parts[0] == "_alias" and len(parts) == 2:
+                targets = sorted(st.aliases.get(parts[1], ()))
+                if not targets:
+                    return self._error(404, "aliases_not_found_exception", parts[1])
+                return self._send(200, {i: {"aliases": {parts[1]: {}}} for i in targets})
+            if parts[0] == "_cat" and len(parts) == 3 and parts[1] == "indices":
+                rows = [{"index": i, "docs.count": str(len(st.indices[i].docs))} for i in st.resolve(parts[2])]
+                return self._send(200, rows)
+            if len(parts) == 2 and parts[1] == "_settings":
+                names = st.resolve(parts[0])
+                if not names:
+                    return self._error(404, "index_not_found_exception", parts[0])
+                return self._send(200, {i: {"settings": dict(st.indices[i].settings)} for i in names})
+            if len(parts) == 2 and parts[1] == "_count":
+                names = st.resolve(parts[0])
+                if not names:
+                    return self._error(404, "index_not_found_exception", parts[0])
+                return self._send(200, {"count": sum(len(st.indices[i].docs) for i in names)})
+            if parts == ["_stats_fake"]:
+                return self._send(200, st.stats)
+        self._error(400, "unsupported", f"GET {self.path}")
+
+    def do_PUT(self):
+        parts, _ = self._route()
+        body = self._json_body()
+        st = self.state
+        with st.lock:
+            if len(parts) == 1:
+                if parts[0] in st.indices:
+                    return self._error(400, "resource_already_exists_exception", parts[0])
+                index = FakeIndex(mappings=body.get("mappings", {}))
+                _flatten("index", {k: v for k, v in body.get("settings", {}).items()}, index.settings)
+                st.indices[parts[0]] = index
+                return self._send(200, {"acknowledged": True, "index": parts[0]})
+            if len(parts) == 2 and parts[1] == "_settings":
+                names = st.resolve(parts[0])
+                if not names:
+                    return self._error(404, "index_not_found_exception", parts[0])
+                flat: Dict[str, str] = {}
+                _flatten("", body, flat)
+                for name in names:
+                    for k, v in flat.items():
+                        st.indices[name].settings[k if k.startswith("index.") else f"index.{k}"] = v
+                return self._send(200, {"acknowledged": True})
+        self._error(400, "unsupported", f"PUT {self.path}")
+
+    def do_DELETE(self):
+        parts, _ = self._route()
+        st = self.state
+        with st.lock:
+            if len(parts) == 1:
+                names = [n for n in parts[0].split(",") if n in st.indices]
+                if not names:
+                    return self._error(404, "index_not_found_exception", parts[0])
+                for name in names:
+                    del st.indices[name]
+                    for targets in st.aliases.values():
+                        targets.discard(name)
+                return self._send(200, {"acknowledged": True})
+        self._error(400, "unsupported", f"DELETE {self.path}")
+
+    def do_POST(self):
+        parts, _ = self._route()
+        if parts == ["_bulk"]:
+            return self._bulk()
+        body = self._json_body()
+        st = self.state
+        with st.lock:
+            if parts == ["_aliases"]:
+                for action in body.get("actions", []):
+                    (op, spec), = action.items()
+                    if op == "add":
+                        if spec["index"] not in st.indices:
+                            return self._error(404, "index_not_found_exception", spec["index"])
+                        if spec["alias"] in st.indices:
+                            return self._error(400, "invalid_alias_name_exception", spec["alias"])
+                        st.aliases.setdefault(spec["alias"], set()).add(spec["index"])
+                    elif op == "remove":
+                        st.aliases.get(spec["alias"], set()).discard(spec["index"])
+                    elif op == "remove_index":
+                        if spec["index"] not in st.indices:
+                            return self._error(404, "index_not_found_exception", spec["index"])
+                        del st.indices[spec["index"]]
+                        for targets in st.aliases.values():
+                            targets.discard(spec["index"])
+                return self._send(200, {"acknowledged": True})
+            if len(parts) == 2 and parts[1] in ("_refresh", "_forcemerge"):
+                if not st.resolve(parts[0]):
+                    return self._error(404, "index_not_found_exception", parts[0])
+                return self._send(200, {"_shards": {"total": 1, "successful": 1, "failed": 0}})
+        self._error(400, "unsupported", f"POST {self.path}")
+
+    def _bulk(self):
+        st = self.state
+        cfg = st.config
+        body = self._body()
+
+        delay = cfg.latency_ms + cfg.latency_ms_per_mb * len(body) / 1e6
+        if delay:
+            time.sleep(delay / 1000)
+
+        with st.lock:
+            st.stats["bulk_requests"] += 1
+            st.stats["bulk_bytes"] += len(body)
+            if cfg.request_reject_rate and st.rng.random() < cfg.request_reject_rate:
+                st.stats["rejected"] += 1
+                return self._error(429, "es_rejected_execution_exception", "rejected execution (queue full)")
+
+        lines = body.split(b"\n")
+        items = []
+        errors = False
+        i = 0
+        with st.lock:
+            while i < len(lines):
+                if not lines[i].strip():
+                    i += 1
+                    continue
+                (op, meta), = json.loads(lines[i]).items()
+                source = None
+                if op != "delete":
+                    source = lines[i + 1]
+                    i += 2
+                else:
+                    i += 1
+                item = self._bulk_item(op, meta, source)
+                errors = errors or "error" in item
+                items.append({op: item})
+            st.stats["items"] += len(items)
+        self._send(200, {"took": int(delay), "errors": errors, "items": items})
+
+    def _bulk_item(self, op: str, meta: Dict, source: Optional[bytes]) -> Dict:
+        st = self.state
+        cfg = st.config
+        index_name = st.write_target(meta.get("_index", ""))
+        doc_id = meta.get("_id")
+        item = {"_index": index_name, "_id": doc_id}
+        if index_name is None:
+            return {**item, "status": 400, "error": {"type": "illegal_argument_exception", "reason": "alias with multiple write indices"}}
+
+        r = st.rng.random()
+        if r < cfg.reject_rate:
+            st.stats["rejected"] += 1
+            return {**item, "status": 429, "error": {"type": "es_rejected_execution_exception", "reason": "rejected execution"}}
+        if op != "delete" and r < cfg.reject_rate + cfg.mapping_error_rate:
+            st.stats["mapping_errors"] += 1
+            return {**item, "status": 400, "error": {"type": "document_parsing_exception", "reason": "failed to parse field"}}
+        if op != "delete" and cfg.validate_source:
+            try:
+                json.loads(source)
+            except ValueError:
+                return {**item, "status": 400, "error": {"type": "document_parsing_exception", "reason": "invalid source"}}
+
+        index = st.indices[index_name]
+        current = index.docs.get(str(doc_id)) if doc_id is not None else None
+        version = meta.get("version")
+        if version is not None and meta.get("version_type") == "external" and current and current[0] >= version:
+            return {**item, "status": 409, "error": {"type": "version_conflict_engine_exception", "reason": "version conflict"}}
+
+        if op == "delete":
+            if current is None:
+                return {**item, "status": 404, "result": "not_found"}
+            del index.docs[str(doc_id)]
+            return {**item, "status": 200, "result": "deleted"}
+
+        if doc_id is None:
+            index.auto_ids += 1
+            doc_id = f"auto-{index.auto_ids}"
+            item["_id"] = doc_id
+        new_version = version if version is not None else (current[0] + 1 if current else 1)
+        index.docs[str(doc_id)] = (new_version, len(source))
+        return {**item, "status": 200 if current else 201, "result": "updated" if current else "created", "_version": new_version}
+
+
+def start_server(config: FakeElasticConfig, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Démarre le stand-in dans un thread (port 0 = port libre). Retourne le serveur."""
+    handler = type("BoundHandler", (Handler,), {"state": FakeElasticState(config)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Stand-in Elasticsearch local (HTTP).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="Part des items _bulk rejetés (429).")
+    parser.add_argument("--mapping-error-rate", type=float, default=0.0, help="Part des items en erreur de mapping (400).")
+    parser.add_argument("--request-reject-rate", type=float, default=0.0, help="Part des requêtes _bulk rejetées en bloc (429).")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Latence fixe par requête _bulk.")
+    parser.add_argument("--latency-ms-per-mb", type=float, default=0.0, help="Latence par Mo reçu.")
+    parser.add_argument("--validate-source", action="store_true", help="Parse chaque document source.")
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = FakeElasticConfig(
+        reject_rate=args.reject_rate,
+        mapping_error_rate=args.mapping_error_rate,
+        request_reject_rate=args.request_reject_rate,
+        latency_ms=args.latency_ms,
+        latency_ms_per_mb=args.latency_ms_per_mb,
+        validate_source=args.validate_source,
+        seed=args.seed,
+    )
+    server = start_server(config, args.host, args.port)
+    print(f"[OK] Stand-in Elasticsearch sur http://{args.host}:{server.server_port} (Ctrl+C pour arrêter)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("\nAu revoir.")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,153 +4,938 @@ Importe un fichier NDJSON dans Elasticsearch via l'API _bulk.
 
 - Elasticsearch est supposé tourner sur http://localhost:9200
 - Le NDJSON est supposé contenir 1 document JSON par ligne
+  (par défaut le journal output_tri_structure2.ndjson tenu au fil des
+  batches par l'enrichissement, ou shards compressés de json_to_ndjson.py)
 - Le champ "id" du document est utilisé comme _id dans ES (si présent)
+- Les lignes NDJSON ne sont pas re-parsées : seul "id" est extrait, et la
+  ligne d'origine est copiée telle quelle dans le corps _bulk.
+- Les batches sont découpés par taille de payload (octets) et plusieurs
+  requêtes _bulk sont en vol en parallèle sur des connexions keep-alive.
+- Les documents rejetés de façon transitoire (429, 503, ...) sont renvoyés
+  seuls avec backoff ; les rejets définitifs vont dans un dead-letter NDJSON.
+- Chaque import construit une nouvelle génération d'index (éventuellement
+  une par année de "Date arrivée") avec un mapping explicite
+  (INDEX_DEFINITION) et un profil "bulk" (refresh et réplicas coupés).
+  Après validation, l'alias interrogé par Kibana bascule atomiquement
+  sur la nouvelle génération et l'ancienne est supprimée.
+- Par défaut, l'import est incrémental : un hash de contenu par document
+  (fichier d'état local) permet de n'envoyer que les documents nouveaux ou
+  modifiés (upsert versionné) et de supprimer les ids disparus (au-delà
+  d'un seuil, les suppressions exigent `--allow-deletes`).
+  `--full` force une reconstruction complète (nouvelle génération).
 """
 
+import argparse
+import gzip
+import hashlib
 import json
+import queue
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dépend de l'environnement
+    zstandard = None
 
 # ----------------- CONFIG -----------------
 
 ES_URL = "http://localhost:9200"
-INDEX_NAME = "plaintes_mediation_v1"
+ALIAS_NAME = "plaintes_mediation"  # alias interrogé par Kibana (générations derrière)
 
 # ---------- CHEMINS BASÉS SUR LE SCRIPT ----------
 BASE_DIR = Path(__file__).resolve().parent.parent
-NDJSON_FILE = BASE_DIR / "back" / "data" / "output" / "output_tri_structure.ndjson"
-
-BATCH_SIZE = 500  # nombre de documents envoyés par requête _bulk
+NDJSON_FILE = BASE_DIR / "back" / "data" / "output" / "output_tri_structure2.ndjson"  # journal de l'enrichissement
+DEAD_LETTER_FILE = BASE_DIR / "back" / "data" / "output" / "push_to_elastic_dead_letter.ndjson"
+STATE_FILE = BASE_DIR / "back" / "data" / "output" / "push_to_elastic_state.json"
+
+BULK_MAX_BYTES = 10 * 1024 * 1024  # taille max d'une requête _bulk (5–15 Mo conseillé)
+CONCURRENCY = 4                    # requêtes _bulk en vol simultanément
+
+MAX_RETRIES = 5                       # renvois des documents rejetés (429, 503, ...)
+RETRY_BASE_DELAY = 1.0                # secondes (backoff exponentiel)
+RETRY_MAX_DELAY = 60.0
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+BULK_TIMEOUT = 120                    # secondes ; au-delà la requête _bulk est rejouée
+
+# Formats des dates produites par l'extraction ("YYYY-MM-DD", ou "DD/MM/YYYY"
+# comme accepté par l'extraction et l'ETL dataviz)
+DATE_FORMAT = "yyyy-MM-dd||dd/MM/yyyy||strict_date_optional_time"
+
+# Définition gérée de l'index : pas de double text + keyword sur chaque champ,
+# analyseur français pour "Analyse", dimensions en keyword pour les agrégations.
+INDEX_DEFINITION = {
+    "settings": {
+        "number_of_shards": 1,
+        "refresh_interval": "1s",
+    },
+    "mappings": {
+        "dynamic_templates": [
+            {
+                # Champs métier non listés (Catégorie, Domaine, ...) : keyword seulement
+                "strings_as_keyword": {
+                    "match_mapping_type": "string",
+                    "mapping": {"type": "keyword", "ignore_above": 512},
+                }
+            }
+        ],
+        "properties": {
+            "id": {"type": "long"},
+            "Analyse": {"type": "text", "analyzer": "french"},
+            "label": {"type": "keyword"},
+            "sous_label": {"type": "keyword"},
+            "label_proposition": {"type": "keyword"},
+            "sous_label_proposition": {"type": "keyword"},
+            "lieu": {"type": "keyword"},
+            "key_word": {"type": "keyword"},
+            "Pôle en charge": {"type": "keyword"},
+            "Date arrivée": {"type": "date", "format": DATE_FORMAT},
+            "Date clôture fiche": {"type": "date", "format": DATE_FORMAT},
+        },
+    },
+}
+
+# Réglages appliqués pendant un chargement massif
+BULK_LOAD_SETTINGS = {"refresh_interval": "-1", "number_of_replicas": 0}
+REPLICAS_AFTER_LOAD = 1
+FORCE_MERGE_SEGMENTS = 1
+MAX_FAILED_DOCS = 0  # échecs tolérés avant de refuser la bascule d'alias
+REJECTED_ALIAS_SUFFIX = "_rejete"  # alias de la dernière génération refusée (analyse)
+# Index concrets des versions précédentes du chargeur (avant les générations
+# derrière l'alias) : leur nom reste joignable (data views et dashboards Kibana)
+# comme alias secondaire de la génération publiée. L'index concret n'est
+# supprimé que sur demande (--drop-legacy) : un alias ne peut pas porter le nom
+# d'un index existant.
+LEGACY_INDICES = ("plaintes_mediation_v1",)
+
+# Garde-fou de l'import incrémental : au-delà, les suppressions (ids absents
+# des fichiers d'entrée) sont refusées sans --allow-deletes (entrée tronquée ?)
+MAX_DELETES = 1000
+MAX_DELETE_RATIO = 0.05  # part du corpus précédent
+
+
+# Une entrée _bulk : (ligne action, ligne document ou None pour un delete),
+# sans retour à la ligne
+Entry = Tuple[bytes, Optional[bytes]]
 
 
 # ----------------- FONCTIONS -----------------
 
 
-def check_es_up():
+def make_session(pool_size: int = CONCURRENCY) -> requests.Session:
+    """Session HTTP avec un pool de connexions keep-alive dimensionné pour la concurrence."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def check_es_up(session: requests.Session):
     """Vérifie que Elasticsearch répond bien."""
     try:
-        r = requests.get(ES_URL)
+        r = session.get(ES_URL)
         r.raise_for_status()
         print(f"[OK] Elasticsearch est joignable sur {ES_URL}")
     except Exception as e:
         raise SystemExit(f"[ERREUR] Impossible de joindre Elasticsearch sur {ES_URL} : {e}")
 
 
-def ensure_index():
+class IndexGeneration:
     """
-    Vérifie si l'index existe.
-    Si non, le crée avec un mapping très simple (ES fera le reste dynamiquement).
+    Génération d'index "blue/green" construite derrière un alias :
+    - les index `<alias>-g<horodatage>[-<année>]` sont créés à la volée avec
+      la définition gérée et le profil bulk (refresh coupé, 0 réplica),
+    - finalize() force-merge puis restaure les réglages (refresh, réplicas),
+    - validate() compare le nombre de documents au nombre attendu,
+    - publish() bascule l'alias (et les noms historiques LEGACY_INDICES) de
+      façon atomique puis supprime l'ancienne génération,
+    - mark_rejected() garde la dernière génération refusée pour analyse.
+    Kibana interroge l'alias : il ne voit jamais un index à moitié rempli.
     """
-    r = requests.head(f"{ES_URL}/{INDEX_NAME}")
-    if r.status_code == 200:
-        print(f"[INFO] Index '{INDEX_NAME}' existe déjà.")
-        return
 
-    print(f"[INFO] Index '{INDEX_NAME}' inexistant, création...")
-    # Ici on laisse ES créer le mapping dynamique.
-    r = requests.put(f"{ES_URL}/{INDEX_NAME}")
-    try:
+    def __init__(self, session: requests.Session, alias: str = ALIAS_NAME, split_by_year: bool = False):
+        self.session = session
+        self.alias = alias
+        self.split_by_year = split_by_year
+        self.name = f"{alias}-g{time.strftime('%Y%m%d%H%M%S')}"
+        self.indices: List[str] = []
+        self.created: List[str] = []
+        self.expected_ids = set()
+        self.without_id = 0
+
+    @classmethod
+    def attach(cls, session: requests.Session, alias: str, name: str, split_by_year: bool) -> "IndexGeneration":
+        """Reprend la génération publiée (import incrémental dans les index existants)."""
+        generation = cls(session, alias, split_by_year)
+        generation.name = name
+        generation.indices = generation.current_indices()
+        return generation
+
+    def index_for(self, doc_id: Optional[str], year: Optional[str]) -> str:
+        """Index cible du document (par année de "Date arrivée" si demandé), créé si besoin."""
+        index = self.name
+        if self.split_by_year:
+            index = f"{self.name}-{year or 'sans-date'}"
+        if index not in self.indices:
+            self.create_index(index)
+        if doc_id is None:
+            self.without_id += 1
+        else:
+            self.expected_ids.add((index, doc_id))
+        return index
+
+    def create_index(self, index: str):
+        body = {
+            "settings": {**INDEX_DEFINITION["settings"], **BULK_LOAD_SETTINGS},
+            "mappings": INDEX_DEFINITION["mappings"],
+        }
+        r = self.session.put(f"{ES_URL}/{index}", json=body)
+        try:
+            r.raise_for_status()
+        except Exception as e:
+            print(f"[ERREUR] Création de l'index '{index}' : {r.text}")
+            raise SystemExit(e)
+        self.indices.append(index)
+        self.created.append(index)
+        print(f"[OK] Index '{index}' créé (profil bulk : refresh désactivé, 0 réplica).")
+
+    @property
+    def pattern(self) -> str:
+        return ",".join(self.indices)
+
+    def finalize(self):
+        """
+        Force-merge les index créés par ce run (encore sans réplica : la fusion
+        n'est faite qu'une fois), puis restaure refresh/réplicas et refresh de
+        toute la génération.
+        """
+        if self.created:
+            created = ",".join(self.created)
+            self.session.post(f"{ES_URL}/{created}/_refresh").raise_for_status()
+            print(f"[INFO] Force-merge de {len(self.created)} index ({FORCE_MERGE_SEGMENTS} segment)...")
+            self.session.post(
+                f"{ES_URL}/{created}/_forcemerge",
+                params={"max_num_segments": FORCE_MERGE_SEGMENTS},
+                timeout=None,
+            ).raise_for_status()
+            restore = {
+                "refresh_interval": INDEX_DEFINITION["settings"]["refresh_interval"],
+                "number_of_replicas": REPLICAS_AFTER_LOAD,
+            }
+            self.session.put(f"{ES_URL}/{created}/_settings", json={"index": restore}).raise_for_status()
+        if self.indices:
+            self.session.post(f"{ES_URL}/{self.pattern}/_refresh").raise_for_status()
+
+    def count(self) -> int:
+        if not self.indices:
+            return 0
+        r = self.session.get(f"{ES_URL}/{self.pattern}/_count")
         r.raise_for_status()
-        print(f"[OK] Index '{INDEX_NAME}' créé.")
-    except Exception as e:
-        print(f"[ERREUR] Création de l'index '{INDEX_NAME}' : {r.text}")
-        raise SystemExit(e)
+        return int(r.json().get("count", 0))
+
+    def validate(self, result: "BulkResult", max_failed: int = MAX_FAILED_DOCS) -> bool:
+        """La génération est publiable si elle est complète et sans trop d'échecs."""
+        expected = len(self.expected_ids) + self.without_id - result.failed
+        count = self.count()
+        print(f"[INFO] Validation '{self.name}' : {count} documents (attendus >= {expected}).")
+        if not self.indices or count == 0:
+            print("[ERREUR] Génération vide.")
+            return False
+        if count < expected:
+            print("[ERREUR] Documents manquants dans la nouvelle génération.")
+            return False
+        if result.failed > max_failed:
+            print(f"[ERREUR] {result.failed} documents en échec (max toléré : {max_failed}).")
+            return False
+        return True
+
+    def current_indices(self, alias: Optional[str] = None) -> List[str]:
+        """Index actuellement derrière l'alias (liste vide si l'alias n'existe pas)."""
+        r = self.session.get(f"{ES_URL}/_alias/{alias or self.alias}")
+        if r.status_code == 404:
+            return []
+        r.raise_for_status()
+        return sorted(r.json())
+
+    def publish(self, delete_old: bool = True, drop_legacy: bool = False):
+        """
+        Bascule atomique de l'alias, et des noms historiques (LEGACY_INDICES),
+        vers la nouvelle génération.
+        """
+        aliases = [self.alias] + self.legacy_aliases(drop_legacy)
+        actions = []
+        for alias in aliases:
+            if alias in LEGACY_INDICES and self.is_concrete_index(alias):
+                # --drop-legacy : l'index historique est remplacé par l'alias
+                # dans la même bascule (pas de trou pour Kibana)
+                actions.append({"remove_index": {"index": alias}})
+            else:
+                actions += [{"remove": {"index": index, "alias": alias}} for index in self.current_indices(alias)]
+            actions += [{"add": {"index": index, "alias": alias}} for index in self.indices]
+        self.session.post(f"{ES_URL}/_aliases", json={"actions": actions}).raise_for_status()
+        for alias in aliases:
+            print(f"[OK] Alias '{alias}' -> {', '.join(self.indices)}")
+
+        if not delete_old:
+            return
+        r = self.session.get(
+            f"{ES_URL}/_cat/indices/{self.alias}-g*",
+            params={"format": "json", "h": "index"},
+        )
+        r.raise_for_status()
+        stale = sorted({row["index"] for row in r.json()} - set(self.indices))
+        for index in stale:
+            self.session.delete(f"{ES_URL}/{index}").raise_for_status()
+            print(f"[INFO] Ancienne génération supprimée : {index}")
+
+    def is_concrete_index(self, name: str) -> bool:
+        """Vrai si `name` est un index concret (et non un alias ou un nom libre)."""
+        r = self.session.get(f"{ES_URL}/_cat/indices/{name}", params={"format": "json", "h": "index"})
+        if r.status_code == 404:
+            return False
+        r.raise_for_status()
+        return any(row["index"] == name for row in r.json())
+
+    def legacy_aliases(self, drop_legacy: bool = False) -> List[str]:
+        """
+        Noms historiques (LEGACY_INDICES) à faire pointer sur la génération.
+        Un nom encore porté par l'index concret historique est laissé tel quel,
+        sauf avec drop_legacy (l'index est alors remplacé par l'alias).
+        """
+        names = []
+        for name in LEGACY_INDICES:
+            if not drop_legacy and self.is_concrete_index(name):
+                print(
+                    f"[AVERTISSEMENT] Index historique '{name}' conservé (non mis à jour) : "
+                    f"relancer avec --drop-legacy pour le remplacer par un alias sur '{self.alias}'."
+                )
+                continue
+            names.append(name)
+        return names
+
+    @property
+    def rejected_alias(self) -> str:
+        return f"{self.alias}{REJECTED_ALIAS_SUFFIX}"
+
+    def mark_rejected(self):
+        """
+        Validation en échec : la génération est conservée pour analyse derrière
+        l'alias des rejets, et seule la dernière l'est (les générations rejetées
+        par les runs précédents sont supprimées). Les anciennes générations
+        gardées par --keep-old ne sont pas concernées.
+        """
+        previous = []
+        r = self.session.get(f"{ES_URL}/_alias/{self.rejected_alias}")
+        if r.status_code != 404:
+            r.raise_for_status()
+            previous = sorted(r.json())
+        for index in previous:
+            if index not in self.indices:
+                self.session.delete(f"{ES_URL}/{index}").raise_for_status()
+                print(f"[INFO] Génération rejetée précédente supprimée : {index}")
+        if self.indices:
+            actions = [{"add": {"index": index, "alias": self.rejected_alias}} for index in self.indices]
+            self.session.post(f"{ES_URL}/_aliases", json={"actions": actions}).raise_for_status()
+
+    def publish_created(self):
+        """Import incrémental : ajoute à l'alias les index créés (nouvelle année)."""
+        if not self.created:
+            return
+        aliases = [self.alias] + [name for name in LEGACY_INDICES if self.current_indices(name)]
+        actions = [{"add": {"index": index, "alias": alias}} for alias in aliases for index in self.created]
+        self.session.post(f"{ES_URL}/_aliases", json={"actions": actions}).raise_for_status()
+        for alias in aliases:
+            print(f"[OK] Alias '{alias}' étendu à : {', '.join(self.created)}")
+
+    def discard(self):
+        """Supprime les index créés par ce run et non publiés (build en échec)."""
+        for index in self.created:
+            self.session.delete(f"{ES_URL}/{index}")
+
+
+# Extraction sans parsing complet : le NDJSON est produit par json_to_ndjson.py
+# (documents plats, "id" en première clé). Une clé "id" littérale ne peut pas
+# apparaître dans une valeur texte, où les guillemets sont échappés.
+_ID_RE = re.compile(rb'"id"\s*:\s*(-?\d+|"(?:[^"\\]|\\.)*"|null)')
+_DATE_RE = re.compile(rb'"Date arriv(?:\xc3\xa9|\\u00e9)e"\s*:\s*"(?:(\d{4})-|\d{2}/\d{2}/(\d{4}))')
+
+
+def extract_id(line: bytes) -> Optional[str]:
+    """Lit le champ "id" d'une ligne NDJSON sans la parser (repli json.loads)."""
+    m = _ID_RE.search(line)
+    if m is None:
+        try:
+            doc_id = json.loads(line).get("id")
+        except (json.JSONDecodeError, AttributeError):
+            return None
+        return None if doc_id is None else str(doc_id)
+    token = m.group(1)
+    if token == b"null":
+        return None
+    if token[:1] == b'"':
+        return json.loads(token)
+    return token.decode("ascii")
+
 
+def extract_year(line: bytes) -> Optional[str]:
+    """Année de "Date arrivée" (YYYY-MM-DD ou DD/MM/YYYY) lue directement dans la ligne."""
+    m = _DATE_RE.search(line)
+    return (m.group(1) or m.group(2)).decode("ascii") if m else None
 
-def iter_ndjson_lines(path: Path):
-    """Itère sur chaque ligne non vide du fichier NDJSON."""
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
+
+def doc_hash(line: bytes) -> str:
+    """Hash du contenu d'un document : la ligne NDJSON brute (sortie déterministe)."""
+    return hashlib.sha256(line).hexdigest()
+
+
+class SyncState:
+    """
+    État local du dernier import : génération publiée et, par id,
+    [hash du contenu, index cible]. Sert à n'envoyer que le delta.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.generation: Optional[str] = None
+        self.split_by_year = False
+        self.docs: Dict[str, List[str]] = {}
+
+    @classmethod
+    def load(cls, path: Path) -> "SyncState":
+        state = cls(path)
+        if path.exists() and path.stat().st_size:
+            try:
+                data = json.loads(path.read_text(encoding="utf-8"))
+                state.generation = data.get("generation")
+                state.split_by_year = bool(data.get("split_by_year"))
+                state.docs = data.get("docs", {})
+            except (json.JSONDecodeError, OSError) as e:
+                print(f"[AVERTISSEMENT] État illisible ({e}) : reconstruction complète.")
+        return state
+
+    def save(self):
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        payload = {
+            "alias": ALIAS_NAME,
+            "generation": self.generation,
+            "split_by_year": self.split_by_year,
+            "docs": self.docs,
+        }
+        tmp_path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        tmp_path.replace(self.path)
+
+
+@dataclass
+class SyncPlan:
+    """Changements calculés pendant l'itération : {id: [hash, index]}, ignorés, supprimés."""
+
+    upserts: Dict[str, List[str]]
+    deletes: List[str]
+    unchanged: int = 0
+    skipped_without_id: int = 0
+
+
+def resolve_inputs(paths: List[Path]) -> List[Path]:
+    """
+    Retourne les fichiers NDJSON à charger : les chemins donnés, ou à défaut
+    les shards `<nom>-00000.ndjson[.gz|.zst]` produits par json_to_ndjson.py.
+    """
+    files: List[Path] = []
+    for path in paths:
+        if path.exists():
+            files.append(path)
+            continue
+        shards = sorted(path.parent.glob(f"{path.stem}-[0-9][0-9][0-9][0-9][0-9]{path.suffix}*"))
+        files.extend(p for p in shards if not p.name.endswith(".tmp"))
+    return files
+
+
+def open_ndjson(path: Path):
+    """Ouvre un NDJSON (éventuellement .gz / .zst) en lecture binaire."""
+    if path.suffix == ".gz":
+        return gzip.open(path, "rb")
+    if path.suffix == ".zst":
+        if zstandard is None:
+            raise SystemExit(f"[ERREUR] Module 'zstandard' requis pour lire {path.name}")
+        return zstandard.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+    return path.open("rb")
+
+
+def iter_ndjson_lines(path: Path) -> Iterator[bytes]:
+    """Itère sur chaque ligne non vide du fichier NDJSON (bytes, sans '\\n')."""
+    with open_ndjson(path) as raw:
+        for line in (raw if path.suffix != ".zst" else _iter_stream_lines(raw)):
             line = line.strip()
             if not line:
                 continue
             yield line
 
 
-def bulk_send(batch_docs):
+def _iter_stream_lines(stream, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+    """Découpe un flux binaire (ex: zstd) en lignes."""
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        yield from lines
+    if pending:
+        yield pending
+
+
+def iter_lines(files: List[Path]) -> Iterator[bytes]:
+    """
+    Lignes brutes de tous les fichiers NDJSON. Elles ne sont pas parsées :
+    une ligne invalide sera rejetée par Elasticsearch (dead-letter).
+    """
+    for path in files:
+        print(f"[INFO] Lecture de {path.name}")
+        yield from iter_ndjson_lines(path)
+
+
+def iter_actions(
+    lines: Iterator[bytes],
+    generation: IndexGeneration,
+    previous: Dict[str, List[str]],
+    plan: SyncPlan,
+    version: int,
+    incremental: bool,
+    allow_deletes: bool = False,
+) -> Iterator[Entry]:
     """
-    Envoie un batch de documents au format _bulk.
-    batch_docs = liste de dict JSON (déjà parsés)
+    Produit les entrées _bulk à envoyer, sans parser les documents :
+    - documents nouveaux ou modifiés (hash différent de l'état précédent) en
+      upsert versionné (version externe = horodatage du run), la ligne
+      d'origine étant réutilisée telle quelle comme source ; si le document
+      change d'index (année modifiée), l'ancienne copie est supprimée,
+    - puis suppression des ids absents du nouveau snapshot (mode incrémental),
+      refusée au-delà de MAX_DELETES / MAX_DELETE_RATIO sauf `allow_deletes`.
+    Les documents inchangés ne sont pas envoyés.
     """
-    if not batch_docs:
-        return 0
+    seen = set()
+    for line in lines:
+        key = extract_id(line)
+        year = extract_year(line) if generation.split_by_year else None
+        if key is None:
+            if incremental:
+                # Sans id, impossible de dédupliquer : on ne l'envoie qu'en reconstruction
+                plan.skipped_without_id += 1
+                continue
+            index = generation.index_for(None, year)
+            yield b'{"index":{"_index":' + json.dumps(index).encode("utf-8") + b"}}", line
+            continue
 
-    bulk_lines = []
+        seen.add(key)
+        h = doc_hash(line)
+        if incremental and previous.get(key, [None])[0] == h:
+            plan.unchanged += 1
+            continue
 
-    for doc in batch_docs:
-        # On utilise le champ "id" comme _id si présent
-        doc_id = doc.get("id")
-        if doc_id is not None:
-            action = {"index": {"_index": INDEX_NAME, "_id": doc_id}}
-        else:
-            action = {"index": {"_index": INDEX_NAME}}
+        # On utilise le champ "id" comme _id
+        index = generation.index_for(key, year)
+        plan.upserts[key] = [h, index]
+        action = {"index": {"_index": index, "_id": key, "version": version, "version_type": "external"}}
+        yield json.dumps(action, ensure_ascii=False).encode("utf-8"), line
 
-        bulk_lines.append(json.dumps(action, ensure_ascii=False))
-        bulk_lines.append(json.dumps(doc, ensure_ascii=False))
+        old_index = previous.get(key, [None, None])[1] if incremental else None
+        if old_index is not None and old_index != index:
+            yield delete_action(old_index, key, version), None
 
-    payload = "\n".join(bulk_lines) + "\n"
+    if not incremental:
+        return
+    missing = [key for key in previous if key not in seen]
+    check_deletes(len(missing), len(previous), allow_deletes)
+    for key in missing:
+        plan.deletes.append(key)
+        yield delete_action(previous[key][1], key, version), None
 
-    resp = requests.post(
-        f"{ES_URL}/_bulk",
-        data=payload.encode("utf-8"),
-        headers={"Content-Type": "application/x-ndjson"},
-    )
 
-    try:
-        resp.raise_for_status()
-    except Exception as e:
-        print("[ERREUR] Requête _bulk échouée :")
-        print(resp.text[:2000])
-        raise e
-
-    data = resp.json()
-    if data.get("errors"):
-        # On affiche quelques erreurs pour debug
-        print("[AVERTISSEMENT] _bulk a des erreurs pour certains documents.")
-        for item in data.get("items", [])[:5]:
-            if "error" in item["index"]:
-                print("  ->", item["index"]["error"])
-        # On continue quand même, les autres docs sont indexés
-    else:
-        print(f"[OK] _bulk : {len(batch_docs)} documents indexés sans erreur.")
+def delete_action(index: str, key: str, version: int) -> bytes:
+    """Ligne action d'une suppression versionnée."""
+    action = {"delete": {"_index": index, "_id": key, "version": version, "version_type": "external"}}
+    return json.dumps(action, ensure_ascii=False).encode("utf-8")
+
+
+def check_deletes(n_deletes: int, n_previous: int, allow_deletes: bool = False):
+    """
+    Refuse l'import si trop d'ids ont disparu des fichiers d'entrée : une
+    entrée partielle (shard manquant, export tronqué) viderait l'index.
+    Les upserts déjà envoyés restent valides ; l'état local n'est pas modifié.
+    """
+    if allow_deletes or not n_deletes:
+        return
+    if n_deletes > MAX_DELETES or n_deletes > MAX_DELETE_RATIO * n_previous:
+        raise SystemExit(
+            f"[ERREUR] {n_deletes} suppressions sur {n_previous} documents "
+            f"(max : {MAX_DELETES} ou {MAX_DELETE_RATIO:.0%}). Vérifier les fichiers "
+            f"d'entrée ou relancer avec --allow-deletes."
+        )
 
-    return len(batch_docs)
 
+def entry_size(entry: Entry) -> int:
+    """Taille d'une entrée dans le corps _bulk (retours à la ligne compris)."""
+    return len(entry[0]) + 1 + (len(entry[1]) + 1 if entry[1] is not None else 0)
 
-def main():
-    if not NDJSON_FILE.exists():
-        raise SystemExit(f"[ERREUR] Fichier NDJSON introuvable : {NDJSON_FILE.resolve()}")
 
-    print(f"[INFO] Fichier NDJSON : {NDJSON_FILE.resolve()}")
+class BulkBatch:
+    """
+    Corps _bulk assemblé par copie directe des lignes dans un buffer
+    préalloué (pas de sérialisation) ; garde les entrées pour les renvois.
+    """
 
-    check_es_up()
-    ensure_index()
+    def __init__(self, buf: bytearray):
+        self.buf = buf
+        self.size = 0
+        self.entries: List[Entry] = []
 
-    total = 0
-    batch = []
+    def fits(self, n: int) -> bool:
+        return self.size + n <= len(self.buf)
 
-    for line in iter_ndjson_lines(NDJSON_FILE):
-        try:
-            doc = json.loads(line)
-        except json.JSONDecodeError as e:
-            print(f"[AVERTISSEMENT] Ligne invalide ignorée : {e}")
-            continue
+    def _copy(self, data: bytes):
+        end = self.size + len(data)
+        self.buf[self.size:end] = data  # même longueur : copie en place
+        self.size = end
+
+    def append(self, entry: Entry):
+        self._copy(entry[0])
+        self._copy(b"\n")
+        if entry[1] is not None:
+            self._copy(entry[1])
+            self._copy(b"\n")
+        self.entries.append(entry)
+
+    def payload(self) -> memoryview:
+        return memoryview(self.buf)[: self.size]
+
+
+class BufferPool:
+    """
+    Buffers réutilisés d'un batch à l'autre. acquire() bloque tant qu'aucun
+    buffer n'est libre : la mémoire reste bornée par la concurrence.
+    """
+
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self._free = queue.Queue()
+        for _ in range(count):
+            self._free.put(bytearray(size))
+
+    def acquire(self) -> bytearray:
+        return self._free.get()
+
+    def release(self, buf: bytearray):
+        if len(buf) == self.size:  # les buffers hors gabarit ne sont pas recyclés
+            self._free.put(buf)
+
+
+def iter_bulk_batches(entries: Iterator[Entry], pool: BufferPool) -> Iterator[BulkBatch]:
+    """
+    Regroupe les entrées _bulk en batches coupés par taille d'octets
+    (taille des buffers) plutôt que par nombre de documents.
+    """
+    batch = BulkBatch(pool.acquire())
+    for entry in entries:
+        n = entry_size(entry)
+        if not batch.fits(n):
+            if batch.entries:
+                yield batch
+            # Document plus gros qu'un buffer : buffer dédié
+            batch = BulkBatch(pool.acquire() if n <= pool.size else bytearray(n))
+        batch.append(entry)
+
+    if batch.entries:
+        yield batch
+    else:
+        pool.release(batch.buf)
 
-        batch.append(doc)
 
-        if len(batch) >= BATCH_SIZE:
-            print(f"[INFO] Envoi d'un batch de {len(batch)} documents...")
-            n = bulk_send(batch)
-            total += n
-            batch = []
+def build_payload(entries: List[Entry]) -> bytes:
+    """Assemble le corps NDJSON d'une requête _bulk (renvois partiels)."""
+    return b"\n".join(line for entry in entries for line in entry if line is not None) + b"\n"
 
-    # Dernier batch restant
-    if batch:
-        print(f"[INFO] Envoi du dernier batch de {len(batch)} documents...")
-        n = bulk_send(batch)
-        total += n
 
-    print(f"[OK] Import terminé. Total de documents envoyés : {total}")
+class DeadLetter:
+    """
+    Fichier NDJSON des documents rejetés définitivement (thread-safe).
+    Chaque ligne : {"status": ..., "error": ..., "doc": <document d'origine>}
+    (status 0 : erreur réseau). Le fichier ne contient que les rejets du run
+    courant : celui d'un run précédent est supprimé à l'ouverture.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.unlink(missing_ok=True)
+        self.count = 0
+        self.failed_ids = set()
+        self._lock = threading.Lock()
+        self._f = None
+
+    def write(self, entry: Entry, status: int, error) -> None:
+        line = (
+            b'{"status":' + str(status).encode("ascii")
+            + b',"error":' + json.dumps(error, ensure_ascii=False).encode("utf-8")
+            + b',"action":' + entry[0]
+            + b',"doc":' + (entry[1] if entry[1] is not None else b"null") + b"}\n"
+        )
+        doc_id = next(iter(json.loads(entry[0]).values())).get("_id")
+        with self._lock:
+            if self._f is None:
+                self._f = self.path.open("wb")
+            self._f.write(line)
+            self.count += 1
+            if doc_id is not None:
+                self.failed_ids.add(str(doc_id))
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+
+
+@dataclass
+class BulkResult:
+    indexed: int = 0
+    deleted: int = 0
+    retried: int = 0
+    failed: int = 0
+
+    def add(self, other: "BulkResult") -> None:
+        self.indexed += other.indexed
+        self.deleted += other.deleted
+        self.retried += other.retried
+        self.failed += other.failed
+
+
+def _backoff(attempt: int) -> float:
+    """Délai exponentiel (avec jitter) avant la tentative suivante."""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def bulk_send(session: requests.Session, batch: BulkBatch, dead_letter: DeadLetter) -> BulkResult:
+    """
+    Envoie un batch _bulk et inspecte la réponse document par document :
+    - succès : compté comme indexé,
+    - 429 / erreurs transitoires : seuls ces documents sont renvoyés, avec
+      backoff exponentiel, jusqu'à MAX_RETRIES tentatives,
+    - connexion perdue / timeout : toute la requête est rejouée avec le même
+      backoff ; un document déjà appliqué par l'envoi perdu revient en 409
+      (version externe identique) et compte comme un succès,
+    - erreurs définitives (mapping, ...) : écrites dans le dead-letter.
+    """
+    result = BulkResult()
+    pending = batch.entries
+
+    for attempt in range(1, MAX_RETRIES + 2):
+        # 1er envoi : le buffer tel quel ; renvois : seulement les entrées rejetées
+        try:
+            resp = session.post(
+                f"{ES_URL}/_bulk",
+                data=batch.payload() if attempt == 1 else build_payload(pending),
+                headers={"Content-Type": "application/x-ndjson"},
+                timeout=BULK_TIMEOUT,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # Connexion perdue / timeout : tout le batch est rejoué
+            retry = [(entry, 0, str(e)[:500]) for entry in pending]
+        else:
+            retry = []
+            if resp.status_code in RETRYABLE_STATUSES:
+                # Requête entière rejetée (cluster saturé) : tout le batch est rejoué
+                retry = [(entry, resp.status_code, resp.text[:500]) for entry in pending]
+            else:
+                try:
+                    resp.raise_for_status()
+                except Exception as e:
+                    print("[ERREUR] Requête _bulk échouée :")
+                    print(resp.text[:2000])
+                    raise e
+
+                for entry, item in zip(pending, resp.json().get("items", [])):
+                    op_type, op = next(iter(item.items()))
+                    status = op.get("status", 500)
+                    # 409 sur un renvoi : version déjà écrite par un envoi dont la réponse est perdue
+                    replayed = status == 409 and attempt > 1
+                    if op_type == "delete" and (status in (200, 404) or replayed):
+                        result.deleted += 1
+                    elif status < 300 or replayed:
+                        result.indexed += 1
+                    elif status in RETRYABLE_STATUSES:
+                        retry.append((entry, status, op.get("error")))
+                    else:
+                        result.failed += 1
+                        dead_letter.write(entry, status, op.get("error"))
+
+        if not retry:
+            break
+        if attempt > MAX_RETRIES:
+            for entry, status, error in retry:
+                result.failed += 1
+                dead_letter.write(entry, status, error)
+            print(f"[ERREUR] {len(retry)} documents abandonnés après {MAX_RETRIES} tentatives.")
+            break
+
+        result.retried += len(retry)
+        delay = _backoff(attempt)
+        print(
+            f"[AVERTISSEMENT] {len(retry)} documents rejetés (statut {retry[0][1] or 'erreur réseau'}), "
+            f"nouvel essai {attempt}/{MAX_RETRIES} dans {delay:.1f}s..."
+        )
+        time.sleep(delay)
+        pending = [entry for entry, _, _ in retry]
+
+    return result
+
+
+def load(
+    session: requests.Session,
+    entries: Iterator[Entry],
+    dead_letter: DeadLetter,
+    concurrency: int = CONCURRENCY,
+    max_bytes: int = BULK_MAX_BYTES,
+) -> BulkResult:
+    """
+    Envoie les batches avec au plus `concurrency` requêtes _bulk en vol.
+    Le nombre de batches en mémoire reste borné par la concurrence
+    (un buffer réutilisé par batch en vol, plus un en cours de remplissage).
+    """
+    total = BulkResult()
+    buffers = BufferPool(concurrency + 1, max_bytes)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        for batch in iter_bulk_batches(entries, buffers):
+            future = pool.submit(bulk_send, session, batch, dead_letter)
+            future.add_done_callback(lambda _f, buf=batch.buf: buffers.release(buf))
+            in_flight.add(future)
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for f in done:
+                    total.add(f.result())
+                print(f"[INFO] Progression : {total.indexed} indexés, {total.failed} en échec.")
+        for f in in_flight:
+            total.add(f.result())
+    return total
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import NDJSON -> Elasticsearch (_bulk).")
+    parser.add_argument("inputs", nargs="*", type=Path, default=[NDJSON_FILE], help="Fichiers NDJSON (ou base des shards).")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requêtes _bulk simultanées.")
+    parser.add_argument("--bulk-mb", type=float, default=BULK_MAX_BYTES / (1024 * 1024), help="Taille max d'un _bulk (Mo).")
+    parser.add_argument("--full", action="store_true", help="Reconstruction complète dans une nouvelle génération.")
+    parser.add_argument("--split-by-year", action="store_true", help="Un index par année de 'Date arrivée' (avec --full).")
+    parser.add_argument("--keep-old", action="store_true", help="Ne pas supprimer l'ancienne génération.")
+    parser.add_argument(
+        "--drop-legacy",
+        action="store_true",
+        help=f"Remplacer les index historiques ({', '.join(LEGACY_INDICES)}) par des alias de la génération publiée.",
+    )
+    parser.add_argument(
+        "--max-failed",
+        type=int,
+        default=MAX_FAILED_DOCS,
+        help="Documents en échec tolérés avant de refuser la bascule d'alias.",
+    )
+    parser.add_argument(
+        "--allow-deletes",
+        action="store_true",
+        help=f"Autoriser plus de {MAX_DELETES} suppressions ou {MAX_DELETE_RATIO:.0%}% du corpus (import incrémental).",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    files = resolve_inputs(args.inputs)
+    if not files:
+        raise SystemExit(f"[ERREUR] Fichier NDJSON introuvable : {', '.join(str(p.resolve()) for p in args.inputs)}")
+
+    print(f"[INFO] Fichiers NDJSON : {', '.join(p.name for p in files)}")
+
+    session = make_session(args.concurrency)
+    check_es_up(session)
+
+    state = SyncState.load(STATE_FILE)
+    incremental = not args.full and state.generation is not None
+    if incremental:
+        generation = IndexGeneration.attach(session, ALIAS_NAME, state.generation, state.split_by_year)
+        if not any(i == state.generation or i.startswith(state.generation + "-") for i in generation.indices):
+            print(f"[AVERTISSEMENT] La génération '{state.generation}' n'est plus derrière l'alias : reconstruction complète.")
+            incremental = False
+    if incremental:
+        print(f"[INFO] Import incrémental dans la génération '{generation.name}' (alias '{ALIAS_NAME}').")
+    else:
+        generation = IndexGeneration(session, ALIAS_NAME, split_by_year=args.split_by_year)
+        print(f"[INFO] Construction de la génération '{generation.name}' (alias '{ALIAS_NAME}').")
+
+    max_bytes = int(args.bulk_mb * 1024 * 1024)
+    version = int(time.time() * 1000)
+    plan = SyncPlan(upserts={}, deletes=[])
+    dead_letter = DeadLetter(DEAD_LETTER_FILE)
+    try:
+        entries = iter_actions(
+            iter_lines(files), generation, state.docs, plan, version, incremental, args.allow_deletes
+        )
+        total = load(session, entries, dead_letter, args.concurrency, max_bytes)
+        generation.finalize()
+    except BaseException:
+        print("[ERREUR] Import interrompu : les index créés par ce run sont supprimés, l'alias est inchangé.")
+        generation.discard()
+        raise
+    finally:
+        dead_letter.close()
+
+    if incremental:
+        generation.publish_created()
+    elif generation.validate(total, args.max_failed):
+        generation.publish(delete_old=not args.keep_old, drop_legacy=args.drop_legacy)
+    else:
+        generation.mark_rejected()
+        print(
+            f"[ERREUR] Validation échouée : l'alias '{ALIAS_NAME}' reste sur l'ancienne génération. "
+            f"Nouvelle génération conservée pour analyse : {generation.pattern} "
+            f"(alias '{generation.rejected_alias}')"
+        )
+        raise SystemExit(1)
+
+    # Mise à jour de l'état : les documents en échec seront renvoyés au prochain run
+    docs = dict(state.docs) if incremental else {}
+    for key, value in plan.upserts.items():
+        if key not in dead_letter.failed_ids:
+            docs[key] = value
+        elif not incremental:
+            docs.pop(key, None)
+    for key in plan.deletes:
+        if key not in dead_letter.failed_ids:
+            docs.pop(key, None)
+    state.docs = docs
+    state.generation = generation.name
+    state.split_by_year = generation.split_by_year
+    state.save()
+
+    print("=" * 60)
+    print("[OK] Import terminé.")
+    print(f"[OK] Documents inchangés (ignorés)  : {plan.unchanged}")
+    print(f"[OK] Documents indexés              : {total.indexed}")
+    print(f"[OK] Documents supprimés            : {total.deleted}")
+    print(f"[OK] Renvois (rejets transitoires)  : {total.retried}")
+    print(f"[OK] Documents en échec             : {total.failed}")
+    if plan.skipped_without_id:
+        print(f"[AVERTISSEMENT] Documents sans id ignorés (import incrémental) : {plan.skipped_without_id}")
+    if dead_letter.count:
+        print(f"[AVERTISSEMENT] Documents rejetés écrits dans : {DEAD_LETTER_FILE.resolve()}")
+    print("=" * 60)
 
 
 if __name__ == "__main__":